@@ -0,0 +1,300 @@
+"""
+告警规则
+
+规则按作用范围分为全局、楼宇、设备三级，保存时按范围建立索引。
+每台设备第一次上报时把适用于它的规则编译成 字段 -> 检查列表，缓存到规则或设备楼宇变化为止，
+每帧只检查本帧出现的字段对应的检查项，开销与该设备的规则数有关，与规则总数无关。
+
+规则类型:
+- band: 数值超出 [low, high] 时触发，回到 [low + hysteresis, high - hysteresis] 内时解除
+- change: 数值变化时记录一次事件（用于 relay_status、pb8_level 等开关量）
+debounce 为连续满足条件的帧数，达到后才触发/解除/记录变化。
+触发、解除和变化事件写入有界事件日志，按递增的事件号查询。
+"""
+import itertools
+import threading
+import uuid
+from collections import deque
+
+from sensor_store import FIELDS, format_timestamp
+
+RULE_KINDS = ('band', 'change')
+SCOPES = ('global', 'building', 'device')
+SEVERITIES = ('info', 'warning', 'critical')
+
+DEFAULT_EVENT_CAPACITY = 10000
+
+
+class Rule:
+    __slots__ = ('id', 'scope', 'target', 'field', 'kind', 'low', 'high', 'hysteresis', 'debounce',
+                 'severity', 'name')
+
+    @classmethod
+    def from_dict(cls, data):
+        """校验并创建规则，参数不合法时抛出 ValueError"""
+        rule = cls()
+        rule.id = str(data.get('id') or uuid.uuid4())
+        rule.scope = data.get('scope', 'global')
+        if rule.scope not in SCOPES:
+            raise ValueError(f"scope must be one of {', '.join(SCOPES)}")
+        rule.target = data.get('target')
+        if rule.scope != 'global' and not rule.target:
+            raise ValueError(f"target is required for scope {rule.scope}")
+        if rule.scope == 'global':
+            rule.target = None
+        rule.field = data.get('field')
+        if rule.field not in FIELDS:
+            raise ValueError(f"field must be one of {', '.join(FIELDS)}")
+        rule.kind = data.get('kind', 'band')
+        if rule.kind not in RULE_KINDS:
+            raise ValueError(f"kind must be one of {', '.join(RULE_KINDS)}")
+        rule.low = _optional_number(data, 'low')
+        rule.high = _optional_number(data, 'high')
+        rule.hysteresis = _optional_number(data, 'hysteresis') or 0.0
+        if rule.kind == 'band':
+            if rule.low is None and rule.high is None:
+                raise ValueError("band rules need low and/or high")
+            if rule.low is not None and rule.high is not None and rule.low > rule.high:
+                raise ValueError("low must not be greater than high")
+            if rule.hysteresis < 0:
+                raise ValueError("hysteresis must not be negative")
+        rule.debounce = data.get('debounce', 1)
+        if not isinstance(rule.debounce, int) or isinstance(rule.debounce, bool) or rule.debounce < 1:
+            raise ValueError("debounce must be a positive integer")
+        rule.severity = data.get('severity', 'warning')
+        if rule.severity not in SEVERITIES:
+            raise ValueError(f"severity must be one of {', '.join(SEVERITIES)}")
+        rule.name = data.get('name') or f"{rule.field} {rule.kind}"
+        return rule
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def compile(self):
+        """返回 (是否越界, 是否已恢复) 两个只接受数值的函数；change 规则返回 None"""
+        if self.kind != 'band':
+            return None
+        low, high, h = self.low, self.high, self.hysteresis
+        if low is None:
+            return (lambda v: v > high), (lambda v: v <= high - h)
+        if high is None:
+            return (lambda v: v < low), (lambda v: v >= low + h)
+        return (lambda v: v < low or v > high), (lambda v: low + h <= v <= high - h)
+
+
+def _optional_number(data, key):
+    value = data.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{key} must be a number")
+    return float(value)
+
+
+class _State:
+    """单台设备上一条规则的状态"""
+    __slots__ = ('active', 'streak', 'value', 'pending')
+
+    def __init__(self):
+        self.active = False
+        self.streak = 0
+        self.value = None
+        self.pending = None
+
+
+class _Check:
+    """编译后的检查项：规则 + 比较函数 + 该设备上的状态"""
+    __slots__ = ('rule', 'breached', 'recovered', 'state')
+
+    def __init__(self, rule):
+        self.rule = rule
+        compiled = rule.compile()
+        self.breached, self.recovered = compiled if compiled else (None, None)
+        self.state = _State()
+
+
+class AlertEngine:
+
+    def __init__(self, event_capacity=DEFAULT_EVENT_CAPACITY, on_event=None):
+        """on_event(event): 每产生一个事件时调用（日志、指标）"""
+        self.on_event = on_event
+        self._rules = {}
+        self._global = []
+        self._by_building = {}
+        self._by_device = {}
+        self._version = 0
+        # device_id -> (规则版本, 楼宇, {字段: [_Check]})
+        self._compiled = {}
+        self._events = deque(maxlen=event_capacity)
+        self._event_ids = itertools.count(1)
+        self._last_event_id = 0
+        self._lock = threading.Lock()
+
+    # ---- 规则管理 ----
+
+    def rules(self):
+        return [rule.to_dict() for rule in self._rules.values()]
+
+    def add_rule(self, data):
+        """新增或替换规则，返回 Rule；参数不合法时抛出 ValueError"""
+        rule = Rule.from_dict(data)
+        with self._lock:
+            self._unindex(self._rules.get(rule.id))
+            self._rules[rule.id] = rule
+            if rule.scope == 'global':
+                self._global.append(rule)
+            elif rule.scope == 'building':
+                self._by_building.setdefault(rule.target, []).append(rule)
+            else:
+                self._by_device.setdefault(rule.target, []).append(rule)
+            self._version += 1
+        return rule
+
+    def remove_rule(self, rule_id):
+        with self._lock:
+            rule = self._rules.pop(rule_id, None)
+            if rule is None:
+                return False
+            self._unindex(rule)
+            self._version += 1
+            return True
+
+    def _unindex(self, rule):
+        """需持有锁"""
+        if rule is None:
+            return
+        if rule.scope == 'global':
+            bucket, owner, key = self._global, None, None
+        elif rule.scope == 'building':
+            owner, key = self._by_building, rule.target
+            bucket = owner.get(key, [])
+        else:
+            owner, key = self._by_device, rule.target
+            bucket = owner.get(key, [])
+        bucket[:] = [r for r in bucket if r.id != rule.id]
+        if owner is not None and not bucket:
+            owner.pop(key, None)
+
+    def forget(self, device_id):
+        """设备被删除"""
+        self._compiled.pop(device_id, None)
+
+    # ---- 接入路径 ----
+
+    def _checks(self, device_id, building):
+        compiled = self._compiled.get(device_id)
+        if compiled is not None and compiled[0] == self._version and compiled[1] == building:
+            return compiled[2]
+        with self._lock:
+            version = self._version
+            rules = [*self._global, *self._by_building.get(building, ()), *self._by_device.get(device_id, ())]
+        # 规则没有变化的检查项保留原有状态
+        previous = {}
+        if compiled is not None:
+            for checks in compiled[2].values():
+                for check in checks:
+                    previous[check.rule.id] = check
+        checks = {}
+        for rule in rules:
+            check = previous.get(rule.id)
+            if check is None or check.rule is not rule:
+                check = _Check(rule)
+            checks.setdefault(rule.field, []).append(check)
+        self._compiled[device_id] = (version, building, checks)
+        return checks
+
+    def evaluate(self, device_id, building, updates, timestamp):
+        """
+        检查一帧数据，updates 为本帧解析出的 {字段: 值}；同一设备的调用需由调用方串行化
+        返回本帧产生的事件列表
+        """
+        if not self._rules:
+            return ()
+        checks = self._checks(device_id, building)
+        if not checks:
+            return ()
+        events = []
+        for field, value in updates.items():
+            for check in checks.get(field, ()):
+                event = self._step(check, value)
+                if event is not None:
+                    events.append(self._record(device_id, check.rule, event, value, timestamp))
+        return events
+
+    @staticmethod
+    def _step(check, value):
+        """推进一条规则的状态，返回事件类型或 None"""
+        rule, state = check.rule, check.state
+        if check.breached is None:
+            # change: 新值连续 debounce 帧不变才算一次变化
+            if state.value is None:
+                state.value = value
+                return None
+            if value == state.value:
+                state.pending, state.streak = None, 0
+                return None
+            if value != state.pending:
+                state.pending, state.streak = value, 0
+            state.streak += 1
+            if state.streak < rule.debounce:
+                return None
+            state.value, state.pending, state.streak = value, None, 0
+            return 'changed'
+        toward = check.recovered(value) if state.active else check.breached(value)
+        if not toward:
+            state.streak = 0
+            return None
+        state.streak += 1
+        if state.streak < rule.debounce:
+            return None
+        state.streak = 0
+        state.active = not state.active
+        return 'fired' if state.active else 'cleared'
+
+    def _record(self, device_id, rule, kind, value, timestamp):
+        event = {
+            'device_id': device_id,
+            'rule_id': rule.id,
+            'rule': rule.name,
+            'field': rule.field,
+            'type': kind,
+            'severity': rule.severity,
+            'value': value,
+            'timestamp': timestamp,
+            'time': format_timestamp(timestamp),
+        }
+        with self._lock:
+            event['id'] = self._last_event_id = next(self._event_ids)
+            self._events.append(event)
+        if self.on_event is not None:
+            self.on_event(event)
+        return event
+
+    # ---- 查询 ----
+
+    def events(self, since=0, device_id=None, limit=None):
+        """事件号大于 since 的事件（按时间顺序），返回 (事件列表, 当前最新事件号)"""
+        with self._lock:
+            last = self._last_event_id
+            events = list(self._events)
+        # 事件号连续，直接定位到 since 之后的位置
+        if events and since >= events[0]['id']:
+            events = events[since - events[0]['id'] + 1:]
+        if device_id is not None:
+            events = [event for event in events if event['device_id'] == device_id]
+        if limit is not None:
+            events = events[:limit]
+        return events, last
+
+    def active(self):
+        """当前处于触发状态的告警"""
+        result = []
+        rules = self._rules
+        for device_id, (_, _, checks) in list(self._compiled.items()):
+            for field_checks in list(checks.values()):
+                for check in field_checks:
+                    # 已删除或被替换的规则在设备下一帧重新编译前仍留在缓存中
+                    if check.state.active and rules.get(check.rule.id) is check.rule:
+                        result.append({'device_id': device_id, 'rule_id': check.rule.id, 'rule': check.rule.name,
+                                       'field': check.rule.field, 'severity': check.rule.severity})
+        return result
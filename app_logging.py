@@ -0,0 +1,108 @@
+"""
+日志配置
+
+- 所有模块通过 get_logger 获取 "sensor" 命名空间下的 logger
+- setup_logging 安装队列 handler：业务线程只把日志记录放入有界队列，
+  由后台线程写 stdout；队列满时丢弃并计数，不会阻塞接入路径
+- 逐条消息级别的日志使用 DEBUG 级别并经过 RateLimitedLog 限流，
+  默认 INFO 级别下被过滤的日志不做任何格式化
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+ROOT_LOGGER = 'sensor'
+DEFAULT_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_listener = None
+
+
+def get_logger(name):
+    return logging.getLogger(f'{ROOT_LOGGER}.{name}')
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志记录而不是阻塞或报错"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=None, queue_size=10000, stream=None):
+    """
+    为 "sensor" logger 安装队列 handler，重复调用只会调整日志级别
+    level 默认取环境变量 LOG_LEVEL，未设置时为 INFO
+    """
+    global _listener
+    level = (level or os.environ.get('LOG_LEVEL') or 'INFO').upper()
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    if _listener is not None:
+        return logger
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(logging.Formatter(DEFAULT_FORMAT))
+    log_queue = queue.Queue(maxsize=queue_size)
+    logger.addHandler(DroppingQueueHandler(log_queue))
+    logger.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return logger
+
+
+def shutdown_logging():
+    """停止后台写日志线程并写完队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class RateLimitedLog:
+    """
+    按 key 限流的日志：每个 key 在 interval 秒内最多输出 burst 条，
+    被限流的条数在下一次输出时一并报告
+    """
+
+    def __init__(self, logger, interval=10.0, burst=5):
+        self.logger = logger
+        self.interval = interval
+        self.burst = burst
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def log(self, level, key, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._state.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if count >= self.burst:
+                self._state[key] = (window_start, count, suppressed + 1)
+                return
+            self._state[key] = (window_start, count + 1, 0)
+        if suppressed:
+            msg = f'{msg} (另有 {suppressed} 条相同日志被限流)'
+        self.logger.log(level, msg, *args)
+
+    def debug(self, key, msg, *args):
+        self.log(logging.DEBUG, key, msg, *args)
+
+    def warning(self, key, msg, *args):
+        self.log(logging.WARNING, key, msg, *args)
+
+    def error(self, key, msg, *args):
+        self.log(logging.ERROR, key, msg, *args)
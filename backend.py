@@ -1,28 +1,143 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
+import atexit
+import contextlib
+import gc
+import itertools
 import json
+import os
 import threading
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
 from flask_cors import CORS  # 添加CORS支持
+import numpy as np
+import sensor_parser
+import batch_codec
+import history
+import rollup
+import expiry
+import stream
+import change_tracker
+import response_cache
+import sensor_store
+import registry
+import device_index
+import alerts
+import metrics
+import persistence as persistence_store
+import snapshot
+import ingest_shards
+import topic_router
+import binary_frame
+import dedupe
+import commands
+from app_logging import RateLimitedLog, get_logger, setup_logging
 
 app = Flask(__name__)
 CORS(app)  # 启用CORS
 
-# 设备存储
-devices = {}
+logger = get_logger('backend')
+# 逐条消息级别的告警按设备限流，避免异常设备刷屏
+ingest_log = RateLimitedLog(logger)
 
-# 传感器数据存储
-sensor_data = {}
+# 注册表分片锁数量
+REGISTRY_STRIPES = 64
 
-# 记录最后接收数据的时间
+# 设备存储（线程安全注册表，按设备ID分片加锁）
+devices = registry.DeviceRegistry(stripes=REGISTRY_STRIPES)
+
+# 按楼宇/楼层/房间/状态/协议筛选设备列表的二级索引
+devices_by = device_index.DeviceIndex()
+
+# 传感器数据存储（按设备槽位的列式存储）
+sensor_data = sensor_store.SensorStore()
+
+# 记录最后接收数据的时间（秒级时间戳）
 last_data_received_time = {}
 
+# 设备列表分页每页最多的设备数
+DEVICE_PAGE_MAX = 1000
+
 # 数据过期时间（60秒，增加超时时间以避免频繁重置）
 DATA_EXPIRATION_SECONDS = 60
 
+# 过期检查间隔（秒），每次只处理到期的设备
+EXPIRATION_CHECK_INTERVAL = 1
+
+# 设备变更版本号，用于增量查询和 ETag
+device_versions = change_tracker.ChangeTracker()
+
+# 设备数据过期调度，收到数据时重新计时
+expiration_wheel = expiry.ExpirationWheel(DATA_EXPIRATION_SECONDS, resolution=EXPIRATION_CHECK_INTERVAL)
+
+# 每个设备保留的历史记录条数（按2秒上报一次约为1小时）
+HISTORY_CAPACITY = 1800
+
+# 传感器数据历史记录
+device_history = history.HistoryStore(capacity=HISTORY_CAPACITY)
+
+# 每种粒度保留的聚合桶数（分钟桶 2 小时，小时桶 2 天）
+ROLLUP_RETENTION = {'minute': 120, 'hour': 48}
+
+# 按分钟/小时增量维护的 min/max/mean/count
+device_rollups = rollup.RollupStore(ROLLUP_RETENTION)
+
+# 持久化存储 (persistence_store.WriteBehindStore)，未开启时为 None
+persistence = None
+
+# 多进程分片接入 (ingest_shards.ShardedIngest)，未开启时为 None
+sharded_ingest = None
+
+# MQTT 主题 -> 设备ID和解码器，启动时从 config.TOPIC_ROUTES 加载
+topic_routes = topic_router.TopicRouter()
+
+# 解析前的重复帧/乱序帧过滤 (dedupe.FrameFilter)，未开启时为 None
+frame_filter = None
+
+# 下行控制命令 (commands.CommandDispatcher)，未开启时为 None
+command_dispatcher = None
+
+# 接入路径指标，计数器按线程分片，解析热路径上不加锁
+FRAMES_RECEIVED = metrics.REGISTRY.counter('sensor_frames_received_total', '收到的传感器数据帧数')
+FRAMES_PARSED = metrics.REGISTRY.counter('sensor_frames_parsed_total', '至少解析出一个字段的帧数')
+FRAMES_FAILED = metrics.REGISTRY.counter(
+    'sensor_frames_failed_total', '未解析出任何字段的帧数', ('reason',))
+FIELDS_PARSED = metrics.REGISTRY.counter(
+    'sensor_fields_parsed_total', '按字段统计的解析成功次数', ('field',))
+FIELDS_FAILED = metrics.REGISTRY.counter(
+    'sensor_fields_failed_total', '按字段统计的数值转换失败次数', ('field',))
+FRAMES_DEDUPED = metrics.REGISTRY.counter(
+    'sensor_frames_deduplicated_total', '解析前被丢弃的帧数 (duplicate/stale)', ('reason',))
+PARSE_SECONDS = metrics.REGISTRY.histogram('sensor_parse_duration_seconds', '单帧解析耗时（秒）')
+EXPIRATIONS = metrics.REGISTRY.counter('sensor_device_expirations_total', '设备数据过期并转为离线的次数')
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'http_request_duration_seconds', '按路由统计的请求耗时（秒）', ('method', 'route', 'status'))
+ALERT_EVENTS = metrics.REGISTRY.counter(
+    'sensor_alert_events_total', '按类型统计的告警事件数 (fired/cleared/changed)', ('type',))
+COMMANDS = metrics.REGISTRY.counter(
+    'sensor_commands_total', '按状态统计的下行命令数（每条命令进入该状态时计一次）', ('status',))
+
+# 告警事件写日志并计数
+def _on_alert_event(event):
+    ALERT_EVENTS.inc((event['type'],))
+    if event['type'] == 'fired':
+        logger.warning("🚨 告警触发 [%s] %s: %s = %s", event['severity'], event['device_id'], event['rule'], event['value'])
+    elif event['type'] == 'cleared':
+        logger.info("✅ 告警解除 %s: %s = %s", event['device_id'], event['rule'], event['value'])
+    else:
+        logger.info("🔁 %s 的 %s 变为 %s", event['device_id'], event['field'], event['value'])
+
+# 每个告警事件日志保留的事件数
+ALERT_EVENT_CAPACITY = 10000
+
+# 告警规则，接入时按设备编译好的检查列表逐帧检查
+alert_engine = alerts.AlertEngine(event_capacity=ALERT_EVENT_CAPACITY, on_event=_on_alert_event)
+
 # 设备模型类
 class Device:
+    __slots__ = ('id', 'name', 'protocol', 'location', 'properties',
+                 'created_at', 'last_active_at', 'status', 'config')
+    
     def __init__(self, device_id: str, name: str, protocol: str, 
                  location: dict = None, properties: dict = None):
         self.id = device_id
@@ -35,268 +150,537 @@ class Device:
             'position': '未知位置'
         }
         self.properties = properties or {}
-        self.created_time = datetime.now().isoformat()
-        self.last_active_time = None
+        # 时间保存为秒级时间戳，序列化时再格式化
+        self.created_at = time.time()
+        self.last_active_at = None
         self.status = "offline"
         self.config = {}
+    
+    @property
+    def created_time(self):
+        return sensor_store.format_timestamp(self.created_at)
+    
+    @property
+    def last_active_time(self):
+        return sensor_store.format_timestamp(self.last_active_at)
 
 def create_device(device_id, name, protocol, location=None, properties=None):
     """创建设备"""
-    if device_id in devices:
-        return False, "Device already exists"
-    
     device = Device(device_id, name, protocol, location, properties)
-    devices[device_id] = device
-    sensor_data[device_id] = {
-        'temperature1': 0.0,
-        'humidity1': 0.0,
-        'temperature2': 0.0,
-        'humidity2': 0.0,
-        'relay_status': 0,
-        'pb8_level': 0,
-        'timestamp': None
-    }
+    with devices.lock(device_id), devices.membership:
+        if not devices.add(device):
+            return False, "Device already exists"
+        sensor_data.allocate(device_id)
+        devices_by.update(device)
+        # 在成员锁内入队，与同一设备的删除和后续数据保持先后顺序
+        if persistence is not None:
+            persistence.save_device(device)
     return True, "Device created successfully"
 
 def update_device_status(device_id, status):
     """更新设备状态"""
-    if device_id in devices:
-        devices[device_id].status = status
-        devices[device_id].last_active_time = datetime.now().isoformat()
+    with devices.lock(device_id):
+        device = devices.get(device_id)
+        if device is not None:
+            if device.status != status:
+                device.status = status
+                devices_by.update(device)
+            device.last_active_at = time.time()
+
+# 去重和乱序检查（见 dedupe），返回丢弃原因，接受时为 None
+# 调用方持有该设备的锁，检查通过的帧在同一把锁内写入，按检查的顺序生效
+def screen_frame(device_id, payload_str):
+    reason = frame_filter.check(device_id, payload_str)
+    if reason is not None:
+        FRAMES_DEDUPED.inc((reason,))
+    return reason
+
+# 解析一帧数据并计入接入指标，返回 (device_id, updates)
+# device_id 为已确定的设备ID时不再从主题或载荷中确定
+def _parse_frame(payload_str, topic, device_id=None):
+    errors = []
+    started = time.perf_counter()
+    device_id, updates = topic_routes.parse(payload_str, topic, errors, device_id)
+    PARSE_SECONDS.observe(time.perf_counter() - started)
+    FRAMES_RECEIVED.inc()
+    if errors:
+        FIELDS_FAILED.inc_each(errors)
+    if device_id is None:
+        FRAMES_FAILED.inc(('no_data',))
+    elif updates:
+        FRAMES_PARSED.inc()
+        FIELDS_PARSED.inc_each(updates)
+    else:
+        FRAMES_FAILED.inc(('no_fields',))
+    return device_id, updates
+
+# 解析一帧数据并写入存储
+def ingest_frame(payload_str, topic=None):
+    """
+    解析一帧传感器数据并更新设备状态与传感器数据
+    topic 匹配到主题路由时按路由解码，设备ID取自主题；否则从载荷首行提取设备ID
+    返回 (device_id, 成功解析的字段数)，没有任何有效数据行时 device_id 为 None，
+    被去重/乱序检查丢弃时字段数为 None
+    """
+    if frame_filter is not None:
+        device_id = topic_routes.identify(payload_str, topic)
+        if device_id:
+            # 检查、解析和写入在同一把设备锁内完成，设备ID只确定一次
+            with devices.lock(device_id):
+                if screen_frame(device_id, payload_str) is not None:
+                    FRAMES_RECEIVED.inc()
+                    return device_id, None
+                device_id, updates = _parse_frame(payload_str, topic, device_id)
+                if device_id is None:
+                    return None, 0
+                count = _apply_locked(device_id, updates, time.time())
+            mark_device_changed(device_id)
+            return device_id, count
+    device_id, updates = _parse_frame(payload_str, topic)
+    if device_id is None:
+        return None, 0
+    return device_id, apply_updates(device_id, updates)
+
+# 把一帧解析出的字段写入存储并更新设备状态，返回写入的字段数
+# （分片接入模式下由收集线程以共享内存表中的最新数据调用）
+def apply_updates(device_id, updates, timestamp=None):
+    if timestamp is None:
+        timestamp = time.time()
+    with devices.lock(device_id):
+        count = _apply_locked(device_id, updates, timestamp)
+    # 响应缓存重新编码时先持有缓存锁再取设备锁，这里不能在设备锁内调用
+    mark_device_changed(device_id)
+    return count
+
+# apply_updates 的主体，需持有该设备的锁
+def _apply_locked(device_id, updates, timestamp):
+    # 如果设备不存在，自动注册
+    if device_id not in devices:
+        create_device(
+            device_id=device_id,
+            name=f"自动注册设备-{device_id}",
+            protocol="mqtt",
+            location={'building': f'未知楼宇({device_id})', 'floor': '未知楼层', 'room': '未知房间', 'position': '未知位置'}
+        )
+        logger.info("✅ 自动注册新设备: %s", device_id)
+    
+    # 更新设备状态为在线
+    update_device_status(device_id, "online")
+    
+    # 只有在成功解析到数据时才更新时间戳和最后接收时间
+    if updates:
+        sensor_data.write(device_id, updates, timestamp)
+        last_data_received_time[device_id] = timestamp
+        expiration_wheel.arm(device_id, timestamp)
+        values = sensor_data.values(device_id)
+        device = devices.get(device_id)
+        # 同一设备的帧在分片锁内按顺序检查告警规则、记录历史和聚合、写入持久化队列
+        location = device.location
+        alert_engine.evaluate(device_id, location.get('building') if isinstance(location, dict) else None,
+                              updates, timestamp)
+        device_history.record(device_id, timestamp, values)
+        device_rollups.record(device_id, timestamp, updates)
+        if persistence is not None:
+            persistence.save_frame(device_id, device.last_active_at, timestamp, values)
+        if command_dispatcher is not None:
+            command_dispatcher.observe(device_id, updates)
+    return len(updates)
+
+# 分片接入：帧交给工作进程解析；开启去重时在设备锁内检查并入队，返回是否入队
+def submit_frame(payload_str, topic=None):
+    device_id = topic_routes.identify(payload_str, topic) if frame_filter is not None else None
+    if not device_id:
+        sharded_ingest.submit(payload_str, topic)
+        return True
+    with devices.lock(device_id):
+        if screen_frame(device_id, payload_str) is not None:
+            return False
+        sharded_ingest.submit(payload_str, topic, device_id)
+    return True
 
 # 解析从MQTT接收到的数据
-def parse_sensor_data(payload_str):
+def parse_sensor_data(payload_str, topic=None):
     """
     解析传感器数据字符串
     格式示例: "stm32/1 Temperature1: 22.10 C, Humidity1: 16.10 %\nTemperature2: 21.80 C, Humidity2: 23.40 %\nRelay Status: 1\nPB8 Level: 1"
+    具体的字段解析由 sensor_parser 的字段表完成
+    topic 为消息的 MQTT 主题，见 topic_router
+    开启分片接入时只按设备分发给工作进程，由工作进程解析
     """
-    global sensor_data, last_data_received_time
-    
-    print(f"📥 接收到原始数据: {repr(payload_str)}")
-    
+    if sharded_ingest is not None:
+        submit_frame(payload_str, topic)
+        return
     try:
-        # 从payload中解析传感器ID，格式为 "stm32/1 Temperature1:..."
-        # 使用更灵活的换行符处理
-        import re
-        # 分割行，保留非空行
-        payload_lines = [line for line in re.split(r'\r?\n|\r', payload_str) if line.strip()]
-        
-        if not payload_lines:
-            print("⚠️ 未找到任何有效数据行")
-            return
-        
-        first_line = payload_lines[0]
-        print(f"🔍 第一行: {repr(first_line)}")
-        
-        # 提取传感器ID，格式为 "topic_name ..."，查找第一个空格前的部分
-        # 正确的格式应该是 "stm32/1 Temperature1: 26.10 C, Humidity1: 15.90 %"
-        space_index = first_line.find(' ')
-        if space_index != -1:
-            device_id = first_line[:space_index].replace('/', '_')  # 将 "stm32/1" 转换为 "stm32_1"
-        else:
-            # 如果没有找到空格，说明格式不正确
-            device_id = 'default'
-            print(f"⚠️ 无法从第一行解析设备ID，使用默认ID: {device_id}")
-        
-        print(f"🏷️ 解析到的设备ID: {device_id}")
-        
-        # 如果设备不存在，自动注册
-        if device_id not in devices:
-            create_device(
-                device_id=device_id,
-                name=f"自动注册设备-{device_id}",
-                protocol="mqtt",
-                location={'building': f'未知楼宇({device_id})', 'floor': '未知楼层', 'room': '未知房间', 'position': '未知位置'}
-            )
-            print(f"✅ 自动注册新设备: {device_id}")
-        
-        # 更新设备状态为在线
-        update_device_status(device_id, "online")
-        
-        # 记录是否成功解析到任何数据
-        parsed_any_data = False
-        
-        # 遍历所有行进行解析
-        for line_idx, line in enumerate(payload_lines):
-            line = line.strip()
-            if not line:
-                continue
-                
-            print(f"🔍 处理第{line_idx+1}行: {repr(line)}")
-            
-            # 检查是否是包含多个传感器数据的复合行（如第一行）
-            if 'Temperature1:' in line and 'Humidity1:' in line:
-                # 处理复合行，例如 "Temperature1: 22.10 C, Humidity1: 16.10 %"
-                parts = line.split(', ')
-                for part in parts:
-                    part = part.strip()
-                    if part.startswith('Temperature1:'):
-                        try:
-                            # 提取 "Temperature1: 22.10 C" 中的数值
-                            value_str = part.split(':', 1)[1].strip().split(' ')[0]
-                            sensor_data[device_id]['temperature1'] = float(value_str)
-                            parsed_any_data = True
-                            print(f"  -> Temperature1값: {value_str}")
-                        except (ValueError, IndexError):
-                            print(f"  -> 无法解析Temperature1: {part}")
-                    elif part.startswith('Humidity1:'):
-                        try:
-                            value_str = part.split(':', 1)[1].strip().split(' ')[0]
-                            sensor_data[device_id]['humidity1'] = float(value_str)
-                            parsed_any_data = True
-                            print(f"  -> Humidity1값: {value_str}")
-                        except (ValueError, IndexError):
-                            print(f"  -> 无法解析Humidity1: {part}")
-            elif 'Temperature2:' in line and 'Humidity2:' in line:
-                # 处理可能的复合行 "Temperature2: 21.80 C, Humidity2: 23.40 %"
-                parts = line.split(', ')
-                for part in parts:
-                    part = part.strip()
-                    if part.startswith('Temperature2:'):
-                        try:
-                            value_str = part.split(':', 1)[1].strip().split(' ')[0]
-                            sensor_data[device_id]['temperature2'] = float(value_str)
-                            parsed_any_data = True
-                            print(f"  -> Temperature2값: {value_str}")
-                        except (ValueError, IndexError):
-                            print(f"  -> 无法解析Temperature2: {part}")
-                    elif part.startswith('Humidity2:'):
-                        try:
-                            value_str = part.split(':', 1)[1].strip().split(' ')[0]
-                            sensor_data[device_id]['humidity2'] = float(value_str)
-                            parsed_any_data = True
-                            print(f"  -> Humidity2값: {value_str}")
-                        except (ValueError, IndexError):
-                            print(f"  -> 无法解析Humidity2: {part}")
-            else:
-                # 处理单个值的行
-                if line.startswith('Temperature2:'):
-                    try:
-                        value_str = line.split(':', 1)[1].strip().split(' ')[0]
-                        sensor_data[device_id]['temperature2'] = float(value_str)
-                        parsed_any_data = True
-                        print(f"  -> Temperature2값: {value_str}")
-                    except (ValueError, IndexError):
-                        print(f"  -> 无法解析Temperature2: {line}")
-                elif line.startswith('Humidity2:'):
-                    try:
-                        value_str = line.split(':', 1)[1].strip().split(' ')[0]
-                        sensor_data[device_id]['humidity2'] = float(value_str)
-                        parsed_any_data = True
-                        print(f"  -> Humidity2값: {value_str}")
-                    except (ValueError, IndexError):
-                        print(f"  -> 无法解析Humidity2: {line}")
-                elif line.startswith('Temperature1:'):
-                    try:
-                        value_str = line.split(':', 1)[1].strip().split(' ')[0]
-                        sensor_data[device_id]['temperature1'] = float(value_str)
-                        parsed_any_data = True
-                        print(f"  -> Temperature1값: {value_str}")
-                    except (ValueError, IndexError):
-                        print(f"  -> 无法解析Temperature1: {line}")
-                elif line.startswith('Humidity1:'):
-                    try:
-                        value_str = line.split(':', 1)[1].strip().split(' ')[0]
-                        sensor_data[device_id]['humidity1'] = float(value_str)
-                        parsed_any_data = True
-                        print(f"  -> Humidity1값: {value_str}")
-                    except (ValueError, IndexError):
-                        print(f"  -> 无法解析Humidity1: {line}")
-                elif line.startswith('Relay Status:'):
-                    try:
-                        value_str = line.split(':', 1)[1].strip()
-                        sensor_data[device_id]['relay_status'] = int(value_str)
-                        parsed_any_data = True
-                        print(f"  -> Relay Status값: {value_str}")
-                    except (ValueError, IndexError):
-                        print(f"  -> 无法解析Relay Status: {line}")
-                elif line.startswith('PB8 Level:'):
-                    try:
-                        value_str = line.split(':', 1)[1].strip()
-                        sensor_data[device_id]['pb8_level'] = int(value_str)
-                        parsed_any_data = True
-                        print(f"  -> PB8 Level값: {value_str}")
-                    except (ValueError, IndexError):
-                        print(f"  -> 无法解析PB8 Level: {line}")
+        device_id, parsed_count = ingest_frame(payload_str, topic)
         
-        # 只有在成功解析到数据时才更新时间戳和最后接收时间
-        if parsed_any_data:
-            sensor_data[device_id]['timestamp'] = datetime.now().isoformat()
-            last_data_received_time[device_id] = datetime.now()
-            print(f"✅ Updated sensor data for {device_id}: {sensor_data[device_id]}")
-        else:
-            print(f"⚠️ 未解析到任何数据来自: {payload_str[:100]}...")
+        if parsed_count is None:
+            pass
+        elif device_id is None:
+            ingest_log.warning('empty', "⚠️ 未找到任何有效数据行")
+        elif not parsed_count:
+            ingest_log.warning(device_id, "⚠️ 未解析到任何数据来自: %.100s...", payload_str)
         
-    except Exception as e:
-        print(f"解析传感器数据时出错: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        FRAMES_FAILED.inc(('error',))
+        logger.exception("解析传感器数据时出错")
+
+# 设备数据过期，重置为默认值并标记为离线
+def expire_device(device_id, now):
+    with devices.lock(device_id):
+        # 检查期间又收到了数据已重新计时，或设备已被删除
+        if device_id in expiration_wheel or device_id not in devices:
+            return
+        logger.info("⚠️ Device %s data expired, marking as offline", device_id)
+        EXPIRATIONS.inc()
+        sensor_data.reset(device_id, now.timestamp())
+        # 更新设备状态为离线
+        update_device_status(device_id, "offline")
+        if persistence is not None:
+            device = devices.get(device_id)
+            persistence.save_latest(device_id, 'offline', device.last_active_at, now.timestamp(),
+                                    sensor_data.values(device_id))
+    mark_device_changed(device_id)
 
 # 定期检查数据是否过期
 def check_data_expiration():
-    global sensor_data, last_data_received_time
     while True:
-        time.sleep(5)  # 每5秒检查一次
+        time.sleep(EXPIRATION_CHECK_INTERVAL)
         now = datetime.now()
         
-        # 遍历所有传感器，检查是否过期
-        for device_id in list(last_data_received_time.keys()):
-            if device_id in last_data_received_time:
-                if now - last_data_received_time[device_id] > timedelta(seconds=DATA_EXPIRATION_SECONDS):
-                    # 数据已过期，重置为默认值
-                    print(f"⚠️ Device {device_id} data expired, marking as offline")
-                    if device_id in sensor_data:
-                        sensor_data[device_id].update({
-                            'temperature1': 0.0,
-                            'humidity1': 0.0,
-                            'temperature2': 0.0,
-                            'humidity2': 0.0,
-                            'relay_status': 0,
-                            'pb8_level': 0,
-                            'timestamp': now.isoformat()
-                        })
-                    # 更新设备状态为离线
-                    update_device_status(device_id, "offline")
+        # 只处理时间轮中到期的设备，每个设备每次过期只处理一次
+        for device_id in expiration_wheel.expire(now.timestamp()):
+            expire_device(device_id, now)
 
 # 启动数据过期检查线程
 def start_expiration_checker():
     thread = threading.Thread(target=check_data_expiration, daemon=True)
     thread.start()
 
-# 获取所有设备信息
-@app.route('/api/devices', methods=['GET'])
-def get_devices():
-    """获取所有设备列表"""
-    result = []
-    for device_id, device in devices.items():
-        # 获取设备最新数据
-        data = sensor_data.get(device_id, {})
-        device_info = {
-            'id': device.id,
-            'name': device.name,
-            'protocol': device.protocol,
-            'location': device.location,
-            'properties': device.properties,
-            'status': device.status,
-            'last_active_time': device.last_active_time,
-            'created_time': device.created_time,
-            'current_data': data
-        }
-        result.append(device_info)
+# 开启解析前的重复帧/乱序帧过滤
+def start_dedupe(window_seconds=dedupe.DEFAULT_WINDOW_SECONDS, window_frames=dedupe.DEFAULT_WINDOW_FRAMES):
+    global frame_filter
+    frame_filter = dedupe.FrameFilter(window_seconds, window_frames)
+    logger.info("🧹 重复帧过滤已开启: 窗口 %s 秒 / %s 帧", window_seconds, window_frames)
+    return frame_filter
+
+# 命令状态变化计数
+def _on_command_status(command, previous):
+    COMMANDS.inc((command.status,))
+
+# 开启下行控制命令，使用 config.MQTT_CONFIG 连接代理，命令主题取 config.COMMAND_TOPIC
+def start_commands(window=commands.DEFAULT_WINDOW, timeout=commands.DEFAULT_TIMEOUT, client_factory=None,
+                   mqtt_config=None):
+    global command_dispatcher
+    if mqtt_config is None:
+        from config import MQTT_CONFIG as mqtt_config
+    try:
+        from config import COMMAND_TOPIC as topic
+    except ImportError:
+        topic = commands.DEFAULT_TOPIC
+    command_dispatcher = commands.CommandDispatcher(
+        mqtt_config, topic, window=window, timeout=timeout, client_factory=client_factory,
+        on_status=_on_command_status)
+    logger.info("📤 下行命令已开启: 主题 %s", topic)
+    return command_dispatcher.start()
+
+# 恢复一台设备的状态和最新数据（启动时从数据库或快照变更日志读取）
+def _restore_latest(device, status, last_active_at, timestamp, updates):
+    device.status = status
+    device.last_active_at = last_active_at
+    sensor_data.write(device.id, updates, timestamp if timestamp is not None else float('nan'))
+    # 在线设备按最后上报时间重新计时，停机期间已超时的在第一次检查时转为离线
+    if status == 'online' and timestamp is not None and timestamp == timestamp:
+        last_data_received_time[device.id] = timestamp
+        expiration_wheel.arm(device.id, timestamp)
+    else:
+        last_data_received_time.pop(device.id, None)
+        expiration_wheel.cancel(device.id)
+
+# 从持久化存储恢复设备和最新数据
+def restore_devices(store):
+    device_rows, latest_rows = store.load()
+    for row in device_rows:
+        device = Device(row['id'], row['name'], row['protocol'],
+                        json.loads(row['location']) if row['location'] else None,
+                        json.loads(row['properties']) if row['properties'] else None)
+        device.created_at = row['created_at']
+        with devices.membership:
+            if not devices.add(device):
+                continue
+            sensor_data.allocate(device.id)
+        
+        latest = latest_rows.get(device.id)
+        if latest is not None:
+            updates = {name: latest[name] for name in sensor_store.FIELDS if latest[name] is not None}
+            _restore_latest(device, latest['status'], latest['last_active_at'], latest['timestamp'], updates)
+        mark_device_changed(device.id)
+    devices_by.invalidate()
+    return len(device_rows)
+
+# 从快照恢复的设备：名称、位置等元数据在第一次访问时才从快照解码
+class SnapshotDevice(Device):
+    __slots__ = ('_source',)
     
-    return jsonify(result)
+    def __init__(self, device_id, source, created_at, last_active_at, status):
+        # source 为 (snapshot.Snapshot, 序号)
+        self.id = device_id
+        self._source = source
+        self.created_at = created_at
+        self.last_active_at = None if last_active_at != last_active_at else last_active_at
+        self.status = status
+        self.config = {}
+    
+    def _decode(self):
+        snap, index = self._source
+        self._source = None
+        name, protocol, location, properties = snap.meta(index)
+        for slot, value in ((_NAME, name), (_PROTOCOL, protocol), (_LOCATION, location), (_PROPERTIES, properties)):
+            slot.__set__(self, value)
+    
+    def meta_bytes(self):
+        """未解码时直接返回快照中的原始元数据，写新快照时无需解码再编码"""
+        source = self._source
+        if source is not None:
+            return source[0].meta_bytes(source[1])
+        return snapshot.encode_meta(self.name, self.protocol, self.location, self.properties)
 
-# 获取单个设备信息
-@app.route('/api/devices/<device_id>', methods=['GET'])
-def get_device(device_id):
-    """获取单个设备信息"""
-    if device_id not in devices:
-        return jsonify({'error': 'Device not found'}), 404
+def _lazy_field(slot):
+    def get(self):
+        if self._source is not None:
+            self._decode()
+        return slot.__get__(self, Device)
+    
+    def set(self, value):
+        if self._source is not None:
+            self._decode()
+        slot.__set__(self, value)
+    return property(get, set)
+
+_NAME, _PROTOCOL, _LOCATION, _PROPERTIES = Device.name, Device.protocol, Device.location, Device.properties
+SnapshotDevice.name = _lazy_field(_NAME)
+SnapshotDevice.protocol = _lazy_field(_PROTOCOL)
+SnapshotDevice.location = _lazy_field(_LOCATION)
+SnapshotDevice.properties = _lazy_field(_PROPERTIES)
+
+# 从快照整列恢复设备，不逐台解析元数据
+def restore_snapshot(path):
+    snap = snapshot.Snapshot(path)
+    ids = snap.ids
+    records = snap.records
+    created = records['created_at'].tolist()
+    last_active = records['last_active_at'].tolist()
+    statuses = snap.statuses()
+    sources = zip(itertools.repeat(snap), range(len(ids)))
+    with devices.membership:
+        devices.load(dict(zip(ids, map(SnapshotDevice, ids, sources, created, last_active, statuses))))
+        sensor_data.load(ids, {name: snap.column(name) for name in sensor_store.FIELDS}, snap.column('timestamp'))
+    
+    # 在线设备按最后上报时间重新计时
+    online = (records['status'] == snapshot.STATUSES.index('online')) & ~np.isnan(records['timestamp'])
+    online_ids = [device_id for device_id, is_online in zip(ids, online.tolist()) if is_online]
+    online_times = records['timestamp'][online]
+    last_data_received_time.update(zip(online_ids, online_times.tolist()))
+    expiration_wheel.arm_many(online_ids, online_times)
+    device_responses.mark_all_dirty()
+    device_versions.touch_many(ids)
+    devices_by.invalidate()
+    return len(ids)
+
+# 按顺序重放快照之后的变更日志（启动时调用，没有订阅者，变更的设备最后统一分配版本号）
+def replay_journal(path):
+    count = 0
+    changed = {}
+    for record in snapshot.read_journal(path):
+        count += 1
+        kind, device_id = record[0], record[1]
+        if kind == 'latest':
+            _, _, status, last_active_at, timestamp, values = record
+            with devices.lock(device_id):
+                device = devices.get(device_id)
+                if device is not None:
+                    _restore_latest(device, status, last_active_at, timestamp, dict(zip(sensor_store.FIELDS, values)))
+        elif kind == 'device':
+            _, _, created_at, meta = record
+            name, protocol, location, properties = snapshot.decode_meta(meta)
+            with devices.membership:
+                device = devices.get(device_id)
+                if device is None:
+                    device = Device(device_id, name, protocol, location, properties)
+                    devices.add(device)
+                    sensor_data.allocate(device_id)
+                else:
+                    device.name, device.protocol = name, protocol
+                    device.location, device.properties = location, properties
+                device.created_at = created_at
+        elif kind == 'delete':
+            with devices.lock(device_id), devices.membership:
+                devices.remove(device_id)
+                if device_id in sensor_data:
+                    del sensor_data[device_id]
+                last_data_received_time.pop(device_id, None)
+                expiration_wheel.cancel(device_id)
+            changed.pop(device_id, None)
+            device_versions.remove(device_id)
+            device_history.remove(device_id)
+            device_rollups.remove(device_id)
+            continue
+        changed[device_id] = None
+    device_responses.mark_all_dirty()
+    device_versions.touch_many(list(changed))
+    devices_by.invalidate()
+    return count
+
+# 当前注册表写成快照：先切换变更日志，再逐台在分片锁内读取
+def take_snapshot():
+    journal = snapshot_journal
+    if journal is not None and not journal.rotate():
+        logger.error("❌ 切换快照变更日志超时，跳过本次快照")
+        return None
+    
+    def entries():
+        for device_id, device in devices.snapshot().items():
+            with devices.lock(device_id):
+                if device_id not in devices or device_id not in sensor_data:
+                    continue
+                meta = device.meta_bytes() if isinstance(device, SnapshotDevice) else \
+                    snapshot.encode_meta(device.name, device.protocol, device.location, device.properties)
+                yield (device_id, meta, device.created_at, device.last_active_at, device.status,
+                       sensor_data.timestamp(device_id), sensor_data.values(device_id))
     
-    device = devices[device_id]
-    data = sensor_data.get(device_id, {})
+    started = time.perf_counter()
+    count = snapshot.write_snapshot(snapshot_path, entries())
+    if journal is not None:
+        journal.discard_old()
+    logger.info("📸 快照已写入 %s: %s 台设备 (%.2f 秒)", snapshot_path, count, time.perf_counter() - started)
+    return count
+
+# 定期生成快照
+def _snapshot_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            take_snapshot()
+        except Exception:
+            logger.exception("生成快照时出错")
+
+# 快照文件路径和变更日志，未开启时为 None
+snapshot_path = None
+snapshot_journal = None
+
+# 开启快照：有快照时整列恢复，然后重放变更日志；之后的变更写入日志并定期生成新快照
+def start_snapshots(path, interval=snapshot.DEFAULT_INTERVAL, fsync=False, restore=True):
+    global snapshot_path, snapshot_journal
+    snapshot_path = path
+    if restore:
+        started = time.perf_counter()
+        with _bulk_restore():
+            count = restore_snapshot(path) if os.path.exists(path) else 0
+            replayed = sum(replay_journal(journal) for journal in snapshot.journal_paths(path))
+        logger.info("📸 从快照 %s 恢复了 %s 台设备，重放 %s 条变更 (%.2f 秒)",
+                    path, count, replayed, time.perf_counter() - started)
     
-    device_info = {
+    journal = snapshot_journal = snapshot.Journal(path, fsync=fsync).start()
+    atexit.register(journal.close)
+    _add_persistence(journal)
+    if not os.path.exists(path):
+        # 第一次开启快照时立即生成一份，之后的变更日志以它为起点
+        take_snapshot()
+    threading.Thread(target=_snapshot_loop, args=(interval,), name='snapshot', daemon=True).start()
+    return journal
+
+def _add_persistence(store):
+    global persistence
+    if persistence is None:
+        persistence = store
+    elif isinstance(persistence, persistence_store.Fanout):
+        persistence.add(store)
+    else:
+        persistence = persistence_store.Fanout(persistence, store)
+
+# 批量恢复期间暂停循环垃圾回收（大量新建对象会反复触发全代扫描），
+# 结束后把恢复出的长期对象移出回收器的扫描范围
+@contextlib.contextmanager
+def _bulk_restore():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+        gc.freeze()
+
+# 开启 SQLite 持久化：恢复已保存的设备，之后的变更由后台线程批量写入
+def start_persistence(path, restore=True, **options):
+    store = persistence_store.WriteBehindStore(path, **options)
+    if restore:
+        started = time.perf_counter()
+        with _bulk_restore():
+            count = restore_devices(store)
+        logger.info("💾 从 %s 恢复了 %s 台设备 (%.2f 秒)", path, count, time.perf_counter() - started)
+    _add_persistence(store.start())
+    atexit.register(store.close)
+    return store
+
+# 开启多进程分片接入：帧按设备分给工作进程解析，最新数据经共享内存表汇总到本进程
+def start_ingest_workers(workers, capacity=ingest_shards.DEFAULT_SLOTS):
+    global sharded_ingest
+    sharded_ingest = ingest_shards.ShardedIngest(apply_updates, workers, capacity,
+                                                 routes=topic_routes.routes()).start()
+    atexit.register(sharded_ingest.stop)
+    return sharded_ingest
+
+def _shard_frame_counts():
+    if sharded_ingest is None:
+        return []
+    return [((str(worker), name), value)
+            for worker, stats in enumerate(sharded_ingest.stats()) for name, value in stats.items()]
+
+metrics.REGISTRY.gauge_callback(
+    'sensor_shard_frames_total', '分片接入各工作进程的帧数 (received/parsed/dropped)',
+    _shard_frame_counts, ('worker', 'outcome'), kind='counter')
+
+# 按命令行参数开启持久化和快照，未指定时分别取环境变量 SENSOR_DB / SENSOR_SNAPSHOT
+# 两者都开启时，有快照就从快照恢复，否则从数据库恢复后再重放变更日志
+def start_persistence_from_args(args):
+    db_path = args.db or os.environ.get('SENSOR_DB')
+    snapshot_file = args.snapshot or os.environ.get('SENSOR_SNAPSHOT')
+    has_snapshot = bool(snapshot_file) and os.path.exists(snapshot_file)
+    if db_path:
+        start_persistence(
+            db_path,
+            restore=not has_snapshot,
+            batch_size=args.db_batch_size,
+            flush_interval=args.db_flush_interval,
+            synchronous=args.db_synchronous,
+            keep_readings=not args.db_no_readings,
+            readings_retention=args.db_readings_retention,
+        )
+    if snapshot_file:
+        start_snapshots(snapshot_file, interval=args.snapshot_interval, fsync=args.journal_fsync)
+    return persistence
+
+# 启动内嵌MQTT接入，直接订阅 config 中的主题并在接入线程中解析
+# 从 config.TOPIC_ROUTES 加载主题路由，需在开启分片接入之前调用
+def load_topic_routes():
+    try:
+        from config import TOPIC_ROUTES
+    except ImportError:
+        return
+    topic_routes.load(TOPIC_ROUTES)
+    for route in topic_routes.routes():
+        logger.info("🧭 主题路由: %s -> %s", route['filter'], route['decoder'])
+
+def start_mqtt_ingest(client_factory=None):
+    from config import MQTT_CONFIG, SUB_TOPICS
+    from mqtt_ingest import MqttIngestor
+    
+    ingestor = MqttIngestor(parse_sensor_data, MQTT_CONFIG, SUB_TOPICS, client_factory=client_factory)
+    return ingestor.start()
+
+# 设备信息序列化为API返回的字典
+def device_to_dict(device, data):
+    return {
         'id': device.id,
         'name': device.name,
         'protocol': device.protocol,
@@ -307,8 +691,231 @@ def get_device(device_id):
         'created_time': device.created_time,
         'current_data': data
     }
+
+# 设备发生变更：分配新版本号并推送给订阅者
+def mark_device_changed(device_id):
+    # 先让缓存失效再分配新版本号：读到新版本号(ETag)的请求一定拿到新的响应体
+    device_responses.mark_dirty(device_id)
+    device_versions.touch(device_id)
+    stream_hub.publish(device_id)
+
+# 推送用的设备快照，设备已删除时返回 None
+def device_snapshot(device_id):
+    with devices.lock(device_id):
+        device = devices.get(device_id)
+        if device is None:
+            return None
+        return device_to_dict(device, sensor_data.get(device_id, {}))
+
+# 设备变更推送
+stream_hub = stream.StreamHub(device_snapshot)
+
+# 设备列表和设备详情的预序列化响应
+device_responses = response_cache.DeviceResponseCache(app.json.dumps, device_snapshot, lambda: list(devices.snapshot()))
+
+# 抓取时计算的设备指标
+def _device_status_counts():
+    counts = {'online': 0, 'offline': 0}
+    for device in devices.snapshot().values():
+        counts[device.status] = counts.get(device.status, 0) + 1
+    return [((status,), count) for status, count in sorted(counts.items())]
+
+def _device_last_seen_ages():
+    now = time.time()
+    return [((device_id,), now - timestamp) for device_id, timestamp in list(last_data_received_time.items())]
+
+metrics.REGISTRY.gauge_callback('sensor_devices', '按状态统计的设备数', _device_status_counts, ('status',))
+metrics.REGISTRY.gauge_callback(
+    'sensor_persistence_pending', '等待写入数据库的记录数',
+    lambda: persistence.pending() if persistence is not None else 0)
+metrics.REGISTRY.gauge_callback(
+    'sensor_device_last_seen_age_seconds', '距设备最后一次上报数据的秒数', _device_last_seen_ages, ('device',))
+metrics.REGISTRY.gauge_callback(
+    'sensor_commands_inflight', '已发布、等待 PUBACK 的下行命令数',
+    lambda: command_dispatcher.inflight() if command_dispatcher is not None else 0)
+metrics.REGISTRY.gauge_callback(
+    'sensor_commands_queued', '等待发布的下行命令数',
+    lambda: command_dispatcher.qsize() if command_dispatcher is not None else 0)
+
+# 记录每个请求按路由的耗时
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _observe_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                (request.method, route, str(response.status_code)))
+    return response
+
+def _json_body_response(body):
+    return Response(body, mimetype='application/json')
+
+# 设置 ETag，要求客户端每次都向服务端验证
+def _with_etag(response, etag):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _not_modified(etag):
+    return _with_etag(Response(status=304), etag)
+
+# 获取所有设备信息
+@app.route('/api/devices', methods=['GET'])
+def get_devices():
+    """
+    获取所有设备列表
+    支持 If-None-Match: 没有任何变更时返回 304
+    支持 ?since=<版本号>: 只返回该版本之后变更和删除的设备
+    支持 ?building=&floor=&room=&status=&protocol= 筛选，?limit=&cursor= 按设备ID分页，
+    此时返回 {"devices": [...], "next_cursor": 下一页游标或 null}
+    """
+    version = device_versions.version
+    etag = f'v{version}'
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    
+    filters = {name: request.args[name] for name in device_index.FIELDS if name in request.args}
+    since = request.args.get('since')
+    if filters or 'limit' in request.args or 'cursor' in request.args:
+        if since is not None:
+            return jsonify({'error': 'since cannot be combined with filters or pagination'}), 400
+        limit = request.args.get('limit')
+        if limit is not None:
+            if not limit.isdigit() or not 0 < int(limit) <= DEVICE_PAGE_MAX:
+                return jsonify({'error': f'limit must be between 1 and {DEVICE_PAGE_MAX}'}), 400
+            limit = int(limit)
+        # 只遍历匹配的设备，索引过期（刚从快照恢复）时先重建
+        device_ids, next_cursor = devices_by.query(filters, request.args.get('cursor'), limit,
+                                                   devices=devices.values)
+        body = (b'{"devices":[' + b','.join(device_responses.bodies(device_ids)) + b'],"next_cursor":'
+                + app.json.dumps(next_cursor).encode('utf-8') + b'}\n')
+        return _with_etag(_json_body_response(body), etag)
+    
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return jsonify({'error': 'Invalid since version'}), 400
+        version, changed, removed, complete = device_versions.changed_since(since)
+        if not complete:
+            changed, removed = list(devices.snapshot()), []
+        result = []
+        for device_id in changed:
+            info = device_snapshot(device_id)
+            if info is not None:
+                result.append(info)
+        response = jsonify({'version': version, 'full': not complete, 'devices': result, 'removed': removed})
+        return _with_etag(response, f'v{version}')
     
-    return jsonify(device_info)
+    # 设备没有变更时直接返回缓存的响应体
+    return _with_etag(_json_body_response(device_responses.list_body()), etag)
+
+# 获取单个设备信息
+@app.route('/api/devices/<device_id>', methods=['GET'])
+def get_device(device_id):
+    """获取单个设备信息"""
+    if device_id not in devices:
+        return jsonify({'error': 'Device not found'}), 404
+    
+    etag = f'{device_id}-v{device_versions.get(device_id)}'
+    if request.if_none_match.contains(etag):
+        return _not_modified(etag)
+    
+    body = device_responses.device_body(device_id)
+    if body is None:
+        return jsonify({'error': 'Device not found'}), 404
+    
+    return _with_etag(_json_body_response(body + b'\n'), etag)
+
+# 解析查询参数中的时间，支持秒级时间戳或ISO格式
+def _parse_time_arg(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+# 获取设备历史数据
+@app.route('/api/devices/<device_id>/history', methods=['GET'])
+def get_device_history(device_id):
+    """
+    获取设备历史数据
+    参数: start/end (秒级时间戳或ISO时间), fields (逗号分隔), max_points, method (minmax/lttb)
+    """
+    if device_id not in devices:
+        return jsonify({'error': 'Device not found'}), 404
+    
+    try:
+        start = _parse_time_arg(request.args.get('start'))
+        end = _parse_time_arg(request.args.get('end'))
+        max_points = int(request.args.get('max_points', 500))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    
+    method = request.args.get('method', 'minmax')
+    if method not in history.DOWNSAMPLE_METHODS:
+        return jsonify({'error': f'Unknown method: {method}'}), 400
+    
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(history.FIELDS)
+    unknown = [f for f in fields if f not in history.FIELD_INDEX]
+    if unknown:
+        return jsonify({'error': f'Unknown fields: {", ".join(unknown)}'}), 400
+    
+    count, series = device_history.query(device_id, start, end, fields, max_points, method)
+    return jsonify({
+        'device_id': device_id,
+        'start': start,
+        'end': end,
+        'method': method,
+        'count': count,
+        'series': series
+    })
+
+# 获取设备按分钟/小时的聚合数据
+@app.route('/api/devices/<device_id>/aggregates', methods=['GET'])
+def get_device_aggregates(device_id):
+    """
+    获取设备聚合数据
+    参数: resolution (minute/hour), start/end (秒级时间戳或ISO时间), fields (逗号分隔)
+    """
+    if device_id not in devices:
+        return jsonify({'error': 'Device not found'}), 404
+    
+    try:
+        start = _parse_time_arg(request.args.get('start'))
+        end = _parse_time_arg(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    
+    resolution = request.args.get('resolution', 'minute')
+    if resolution not in device_rollups.retention:
+        return jsonify({'error': f'Unknown resolution: {resolution}'}), 400
+    
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(rollup.FIELDS)
+    unknown = [f for f in fields if f not in rollup.FIELD_INDEX]
+    if unknown:
+        return jsonify({'error': f'Unknown fields: {", ".join(unknown)}'}), 400
+    
+    open_start, t, series = device_rollups.query(device_id, resolution, time.time(), start, end, fields)
+    return jsonify({
+        'device_id': device_id,
+        'resolution': resolution,
+        'bucket_seconds': rollup.RESOLUTIONS[resolution],
+        'retention': device_rollups.retention[resolution],
+        'start': start,
+        'end': end,
+        # 仍在累加的桶（最后一个）的起始毫秒时间戳，没有时为 null
+        'open': None if open_start is None else round(open_start * 1000),
+        't': t,
+        'series': series
+    })
 
 # 注册新设备
 @app.route('/api/devices', methods=['POST'])
@@ -324,11 +931,12 @@ def register_device():
         
         success, message = create_device(device_id, name, protocol, location, properties)
         if success:
+            mark_device_changed(device_id)
             return jsonify({'status': 'success', 'message': message, 'device_id': device_id})
         else:
             return jsonify({'status': 'error', 'message': message}), 400
     except Exception as e:
-        print(f"注册设备时出错: {e}")
+        logger.error("注册设备时出错: %s", e)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 # 更新设备信息
@@ -340,19 +948,26 @@ def update_device(device_id):
     
     try:
         data = request.json
-        device = devices[device_id]
-        
-        # 更新可修改的字段
-        if 'name' in data:
-            device.name = data['name']
-        if 'location' in data:
-            device.location = data['location']
-        if 'properties' in data:
-            device.properties = data['properties']
+        with devices.lock(device_id):
+            device = devices.get(device_id)
+            if device is None:
+                return jsonify({'error': 'Device not found'}), 404
+            
+            # 更新可修改的字段
+            if 'name' in data:
+                device.name = data['name']
+            if 'location' in data:
+                device.location = data['location']
+            if 'properties' in data:
+                device.properties = data['properties']
+            devices_by.update(device)
+            if persistence is not None:
+                persistence.save_device(device)
+        mark_device_changed(device_id)
         
         return jsonify({'status': 'success', 'message': 'Device updated successfully'})
     except Exception as e:
-        print(f"更新设备时出错: {e}")
+        logger.error("更新设备时出错: %s", e)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 # 删除设备
@@ -363,34 +978,264 @@ def delete_device(device_id):
         return jsonify({'error': 'Device not found'}), 404
     
     # 从所有存储中删除设备
-    del devices[device_id]
-    if device_id in sensor_data:
-        del sensor_data[device_id]
-    if device_id in last_data_received_time:
-        del last_data_received_time[device_id]
+    with devices.lock(device_id), devices.membership:
+        if devices.remove(device_id) is None:
+            return jsonify({'error': 'Device not found'}), 404
+        devices_by.remove(device_id)
+        alert_engine.forget(device_id)
+        if frame_filter is not None:
+            frame_filter.forget(device_id)
+        if device_id in sensor_data:
+            del sensor_data[device_id]
+        last_data_received_time.pop(device_id, None)
+        expiration_wheel.cancel(device_id)
+        if persistence is not None:
+            persistence.delete_device(device_id)
+    device_history.remove(device_id)
+    device_rollups.remove(device_id)
+    device_responses.mark_dirty(device_id)
+    device_versions.remove(device_id)
+    stream_hub.publish(device_id)
     
     return jsonify({'status': 'success', 'message': 'Device deleted successfully'})
 
+# 告警规则列表
+@app.route('/api/alerts/rules', methods=['GET'])
+def get_alert_rules():
+    return jsonify(alert_engine.rules())
+
+# 新增或替换告警规则
+@app.route('/api/alerts/rules', methods=['POST'])
+def add_alert_rule():
+    """
+    规则字段: id (可选), scope (global/building/device), target (楼宇名或设备ID), field,
+    kind (band/change), low, high, hysteresis, debounce (连续帧数), severity, name
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Invalid JSON'}), 400
+    try:
+        rule = alert_engine.add_rule(data)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    logger.info("📏 告警规则已保存: %s (%s)", rule.id, rule.name)
+    return jsonify({'status': 'success', 'rule': rule.to_dict()})
+
+# 删除告警规则
+@app.route('/api/alerts/rules/<rule_id>', methods=['DELETE'])
+def delete_alert_rule(rule_id):
+    if not alert_engine.remove_rule(rule_id):
+        return jsonify({'error': 'Rule not found'}), 404
+    return jsonify({'status': 'success', 'message': 'Rule deleted successfully'})
+
+# 告警事件，?since=<事件号> 只返回之后的事件
+@app.route('/api/alerts/events', methods=['GET'])
+def get_alert_events():
+    try:
+        since = int(request.args.get('since', 0))
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    events, last_id = alert_engine.events(since, request.args.get('device_id'), limit)
+    return jsonify({'last_id': last_id, 'events': events})
+
+# 当前处于触发状态的告警
+@app.route('/api/alerts/active', methods=['GET'])
+def get_active_alerts():
+    return jsonify(alert_engine.active())
+
+# 读取命令请求体中的目标值，返回 (values, 错误响应)
+def _command_values(data):
+    if not isinstance(data, dict):
+        return None, (jsonify({'status': 'error', 'message': 'Invalid JSON'}), 400)
+    try:
+        return commands.validate({k: v for k, v in data.items() if k not in ('device_ids', 'filter')}), None
+    except ValueError as e:
+        return None, (jsonify({'status': 'error', 'message': str(e)}), 400)
+
+def _commands_disabled():
+    return jsonify({'error': 'Commands are not enabled (start with --commands)'}), 503
+
+# 向单台设备下发命令，请求体如 {"relay_status": 1}
+@app.route('/api/devices/<device_id>/commands', methods=['POST'])
+def send_device_command(device_id):
+    """命令入队后立即返回 202，状态通过 GET /api/commands/<id> 查询"""
+    if command_dispatcher is None:
+        return _commands_disabled()
+    if device_id not in devices:
+        return jsonify({'error': 'Device not found'}), 404
+    values, error = _command_values(request.get_json(silent=True))
+    if error is not None:
+        return error
+    _, (command,) = command_dispatcher.submit([device_id], values)
+    return jsonify({'status': 'accepted', 'command': command.to_dict()}), 202
+
+# 批量下发命令
+@app.route('/api/commands', methods=['POST'])
+def send_bulk_command():
+    """
+    请求体: 目标值（如 "relay_status": 0），加上 device_ids（设备ID列表）或 filter（按 building/floor/room/status/protocol 筛选）之一，
+    两者都没有时下发给全部设备；返回批次号，进度通过 GET /api/commands?batch=<批次号> 查询
+    """
+    if command_dispatcher is None:
+        return _commands_disabled()
+    data = request.get_json(silent=True)
+    values, error = _command_values(data)
+    if error is not None:
+        return error
+    device_ids, filters = data.get('device_ids'), data.get('filter')
+    if device_ids is not None and filters is not None:
+        return jsonify({'status': 'error', 'message': 'device_ids cannot be combined with filter'}), 400
+    if device_ids is not None:
+        if not isinstance(device_ids, list) or not all(isinstance(i, str) for i in device_ids):
+            return jsonify({'status': 'error', 'message': 'device_ids must be a list of device ids'}), 400
+        unknown = [device_id for device_id in device_ids if device_id not in devices]
+        if unknown:
+            return jsonify({'status': 'error', 'message': 'Device not found', 'device_ids': unknown[:100]}), 404
+        device_ids = list(dict.fromkeys(device_ids))
+    else:
+        filters = filters or {}
+        if not isinstance(filters, dict) or any(name not in device_index.FIELDS for name in filters):
+            return jsonify({'status': 'error',
+                            'message': f"filter fields must be among {', '.join(device_index.FIELDS)}"}), 400
+        device_ids, _ = devices_by.query(filters, devices=devices.values)
+    if not device_ids:
+        return jsonify({'status': 'error', 'message': 'No matching devices'}), 404
+    batch, queued = command_dispatcher.submit(device_ids, values, bulk=True)
+    logger.info("📤 批量命令 %s 已入队: %s 台设备 %s", batch, len(queued), values)
+    return jsonify({'status': 'accepted', 'batch': batch, 'count': len(queued)}), 202
+
+# 单条命令的状态
+@app.route('/api/commands/<command_id>', methods=['GET'])
+def get_command(command_id):
+    if command_dispatcher is None:
+        return _commands_disabled()
+    command = command_dispatcher.get(command_id)
+    if command is None:
+        return jsonify({'error': 'Command not found'}), 404
+    return jsonify(command)
+
+# 批量命令各状态的数量，?batch=<批次号>
+@app.route('/api/commands', methods=['GET'])
+def get_command_batch():
+    if command_dispatcher is None:
+        return _commands_disabled()
+    try:
+        batch = int(request.args['batch'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'batch parameter is required'}), 400
+    summary = command_dispatcher.batch_summary(batch)
+    if summary is None:
+        return jsonify({'error': 'Batch not found'}), 404
+    return jsonify(summary)
+
 # 新增API端点：接收MQTT桥接程序发送的数据
 @app.route('/api/update-sensor-data', methods=['POST'])
 def update_sensor_data():
     """接收MQTT数据并更新传感器数据"""
     try:
-        payload_str = request.data.decode('utf-8')
-        parse_sensor_data(payload_str)
+        payload_str = binary_frame.text_or_frame(request.get_data())
+        parse_sensor_data(payload_str, request.args.get('topic'))
         return jsonify({'status': 'success', 'message': 'Sensor data updated successfully'})
     except Exception as e:
-        print(f"更新传感器数据时出错: {e}")
+        ingest_log.error('update-sensor-data', "更新传感器数据时出错: %s", e)
         return jsonify({'status': 'error', 'message': str(e)}), 400
 
+# 批量接收MQTT桥接程序发送的数据
+@app.route('/api/update-sensor-data/batch', methods=['POST'])
+def update_sensor_data_batch():
+    """
+    一次请求接收多帧传感器数据，逐帧返回解析结果
+    分帧方式见 batch_codec: 长度前缀 (默认) 或 application/x-ndjson，每帧可以带 MQTT 主题
+    """
+    try:
+        frames = batch_codec.decode_body(request.get_data(), request.content_type)
+    except batch_codec.FramingError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    # 分片接入模式下由工作进程异步解析，没有逐帧结果
+    if sharded_ingest is not None:
+        queued = 0
+        for topic, frame in frames:
+            if submit_frame(binary_frame.text_or_frame(frame), topic):
+                queued += 1
+        return jsonify({'status': 'success', 'received': len(frames), 'queued': queued})
+    
+    results = []
+    accepted = 0
+    for index, (topic, frame) in enumerate(frames):
+        try:
+            device_id, parsed_count = ingest_frame(binary_frame.text_or_frame(frame), topic)
+        except Exception as e:
+            FRAMES_FAILED.inc(('error',))
+            results.append({'index': index, 'status': 'error', 'message': str(e)})
+            continue
+        if parsed_count is None:
+            results.append({'index': index, 'status': 'skipped', 'device_id': device_id})
+        elif parsed_count:
+            accepted += 1
+            results.append({'index': index, 'status': 'success', 'device_id': device_id, 'fields': parsed_count})
+        else:
+            results.append({'index': index, 'status': 'empty', 'device_id': device_id})
+    
+    return jsonify({'status': 'success', 'received': len(frames), 'accepted': accepted, 'results': results})
+
+# 设备变更推送流 (Server-Sent Events)
+@app.route('/api/stream', methods=['GET'])
+def device_stream():
+    """
+    订阅设备变更：首帧 snapshot 为全部设备，之后 update 帧只包含变更的设备
+    同一 tick 内的多次变更合并为一帧
+    """
+    subscription = stream_hub.subscribe()
+    initial = [device_snapshot(device_id) for device_id in list(devices)]
+    initial = [info for info in initial if info is not None]
+    return Response(
+        stream_hub.events(subscription, initial),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Prometheus 指标
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文本格式的接入与请求指标"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查端点"""
     return jsonify({'status': 'OK'})
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='传感器数据后端服务')
+    parser.add_argument('--mqtt', action='store_true',
+                        help='内嵌MQTT订阅，直接从代理接入数据，无需运行 mqtt_bridge.py')
+    parser.add_argument('--log-level', default=None,
+                        help='日志级别 (DEBUG/INFO/WARNING/ERROR)，默认取环境变量 LOG_LEVEL 或 INFO')
+    persistence_store.add_arguments(parser)
+    snapshot.add_arguments(parser)
+    ingest_shards.add_arguments(parser)
+    dedupe.add_arguments(parser)
+    commands.add_arguments(parser)
+    args = parser.parse_args()
+    
+    setup_logging(args.log_level)
+    load_topic_routes()
+    start_persistence_from_args(args)
     # 启动数据过期检查器
     start_expiration_checker()
+    if args.dedupe:
+        start_dedupe(args.dedupe_window, args.dedupe_frames)
+    if args.ingest_workers:
+        start_ingest_workers(args.ingest_workers, args.ingest_slots)
+    if args.mqtt:
+        start_mqtt_ingest()
+    if args.commands:
+        start_commands(args.command_window, args.command_timeout)
     # 使用不同的端口以避免与macOS AirPlay Receiver冲突
     # 绑定到所有网络接口，确保可以从其他地址访问
-    app.run(debug=True, host='0.0.0.0', port=5002)
+    # 内嵌MQTT或分片接入时关闭重载器，避免父子进程各建立一个MQTT连接、各启动一组工作进程
+    app.run(debug=True, host='0.0.0.0', port=5002, use_reloader=not (args.mqtt or args.ingest_workers or args.commands))
@@ -0,0 +1,106 @@
+"""
+批量上报的分帧编解码
+
+一个请求体中携带多帧传感器数据，支持两种分帧方式：
+- 长度前缀 (application/octet-stream): 每帧为 "<字节数>\\n<帧内容>"，带主题时为 "<字节数> <主题>\\n<帧内容>"
+- 按行分帧 (application/x-ndjson): 每行是一个 JSON 字符串，带主题时为 {"topic": ..., "payload": ...}，帧内换行被转义
+每帧可以是载荷本身，也可以是 (MQTT 主题, 载荷)；解码结果统一为 (主题或 None, 载荷) 列表
+"""
+import json
+
+LENGTH_PREFIXED = 'application/octet-stream'
+NDJSON = 'application/x-ndjson'
+
+
+class FramingError(ValueError):
+    """请求体分帧格式错误"""
+
+
+def _split_frame(frame):
+    if isinstance(frame, tuple):
+        return frame
+    return None, frame
+
+
+def encode_length_prefixed(payloads):
+    """将多帧文本编码为长度前缀格式的 bytes"""
+    chunks = []
+    for frame in payloads:
+        topic, payload = _split_frame(frame)
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        if topic is None:
+            chunks.append(b'%d\n' % len(payload))
+        else:
+            if '\n' in topic:
+                raise ValueError(f"Topic must not contain a newline: {topic!r}")
+            chunks.append(b'%d %s\n' % (len(payload), topic.encode('utf-8')))
+        chunks.append(payload)
+    return b''.join(chunks)
+
+
+def decode_length_prefixed(body):
+    """解析长度前缀格式，返回 (主题或 None, 原始 bytes) 列表"""
+    frames = []
+    pos = 0
+    end = len(body)
+    while pos < end:
+        newline = body.find(b'\n', pos)
+        if newline == -1:
+            raise FramingError(f"Missing length header at offset {pos}")
+        header = body[pos:newline]
+        length, sep, topic = header.partition(b' ')
+        if not length.isdigit() or (sep and not topic):
+            raise FramingError(f"Invalid length header at offset {pos}: {header[:20]!r}")
+        if sep:
+            try:
+                topic = topic.decode('utf-8')
+            except UnicodeDecodeError:
+                raise FramingError(f"Invalid topic at offset {pos}: {topic[:20]!r}")
+        start = newline + 1
+        stop = start + int(length)
+        if stop > end:
+            raise FramingError(f"Frame at offset {pos} exceeds body length")
+        frames.append((topic if sep else None, body[start:stop]))
+        pos = stop
+    return frames
+
+
+def encode_ndjson(payloads):
+    """将多帧文本编码为每行一个 JSON 字符串"""
+    lines = []
+    for frame in payloads:
+        topic, payload = _split_frame(frame)
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8')
+        lines.append(json.dumps(payload if topic is None else {'topic': topic, 'payload': payload}, ensure_ascii=False))
+    return '\n'.join(lines).encode('utf-8')
+
+
+def decode_ndjson(body):
+    """解析按行分帧格式，返回 (主题或 None, 文本) 列表"""
+    frames = []
+    for line_no, line in enumerate(body.split(b'\n'), 1):
+        if not line.strip():
+            continue
+        try:
+            payload = json.loads(line)
+        except ValueError as e:
+            raise FramingError(f"Invalid JSON on line {line_no}: {e}")
+        if isinstance(payload, dict):
+            topic, payload = payload.get('topic'), payload.get('payload')
+            if not isinstance(payload, str) or not isinstance(topic, (str, type(None))):
+                raise FramingError(f"Line {line_no} needs a string payload and an optional string topic")
+        elif isinstance(payload, str):
+            topic = None
+        else:
+            raise FramingError(f"Line {line_no} is not a JSON string")
+        frames.append((topic, payload))
+    return frames
+
+
+def decode_body(body, content_type):
+    """按 Content-Type 选择分帧方式，默认为长度前缀"""
+    if content_type and content_type.split(';', 1)[0].strip() == NDJSON:
+        return decode_ndjson(body)
+    return decode_length_prefixed(body)
@@ -0,0 +1,72 @@
+"""
+告警规则检查开销基准：单帧检查耗时应只与该设备适用的规则数有关，与规则总数无关
+
+每台设备固定适用 1 条全局规则、1 条楼宇规则和 1 条设备规则，其余规则属于其他楼宇和设备。
+规则总数从几条增加到几万条，比较单帧检查耗时，增长超过 MAX_RATIO 倍时以非零状态退出。
+运行: python benchmarks/bench_alerts.py [帧数]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import alerts  # noqa: E402
+
+FLEET = 1000
+BUILDINGS = 50
+MAX_RATIO = 1.5
+
+
+def make_engine(extra_rules):
+    engine = alerts.AlertEngine()
+    engine.add_rule({'field': 'humidity1', 'high': 80, 'hysteresis': 2, 'debounce': 3})
+    for b in range(BUILDINGS):
+        engine.add_rule({'scope': 'building', 'target': f'B{b}', 'field': 'temperature1', 'low': 10, 'high': 35})
+    for d in range(FLEET):
+        engine.add_rule({'scope': 'device', 'target': f'stm32_{d}', 'field': 'relay_status', 'kind': 'change'})
+    # 不适用于被测设备的规则
+    for i in range(extra_rules):
+        engine.add_rule({'scope': 'device', 'target': f'other_{i}', 'field': 'temperature2', 'high': 30})
+    return engine
+
+
+def run(engine, frames):
+    # 第一轮编译各设备的检查列表，不计时
+    for device_id, building, updates, timestamp in frames[:FLEET]:
+        engine.evaluate(device_id, building, updates, timestamp)
+    started = time.perf_counter()
+    for device_id, building, updates, timestamp in frames:
+        engine.evaluate(device_id, building, updates, timestamp)
+    return (time.perf_counter() - started) / len(frames)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(42)
+    frames = []
+    for i in range(count):
+        d = i % FLEET
+        updates = {'temperature1': rng.uniform(5, 40), 'humidity1': rng.uniform(60, 90),
+                   'temperature2': rng.uniform(20, 35), 'relay_status': rng.randint(0, 1)}
+        frames.append((f'stm32_{d}', f'B{d % BUILDINGS}', updates, 1.7e9 + i))
+
+    print(f"帧数: {count}, 设备数: {FLEET}, 每台设备适用规则: 3")
+    print(f"{'规则总数':>10} {'单帧检查 (us)':>14}")
+    results = []
+    for extra in (0, 10000, 50000):
+        engine = make_engine(extra)
+        per_frame = run(engine, frames)
+        results.append(per_frame)
+        print(f"{len(engine.rules()):>10} {per_frame * 1e6:>14.2f}")
+
+    ratio = max(results) / results[0]
+    if ratio > MAX_RATIO:
+        sys.exit(f"❌ 规则总数增加后单帧检查耗时增长 {ratio:.2f} 倍")
+    print(f"✅ 单帧检查耗时与规则总数无关（最大 {ratio:.2f} 倍）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+批量上报基准：逐帧 POST /api/update-sensor-data 与 POST /api/update-sensor-data/batch 对比
+
+通过 Flask test client 运行，不需要启动服务
+运行: python benchmarks/bench_batch.py [帧数] [每批帧数]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+import batch_codec  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng = random.Random(7)
+    frames = [make_frame(rng.randint(1, 500), rng) for _ in range(count)]
+    client = backend.app.test_client()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for frame in frames:
+            client.post('/api/update-sensor-data', data=frame, headers={'Content-Type': 'text/plain'})
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(0, count, batch_size):
+            body = batch_codec.encode_length_prefixed(frames[i:i + batch_size])
+            client.post('/api/update-sensor-data/batch', data=body, content_type=batch_codec.LENGTH_PREFIXED)
+        batched = time.perf_counter() - start
+
+    print(f"帧数: {count}, 每批: {batch_size}")
+    print(f"逐帧请求: {count / single:10.0f} 帧/秒")
+    print(f"批量请求: {count / batched:10.0f} 帧/秒")
+    print(f"加速比: {single / batched:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+二进制帧基准：每帧字节数和解析耗时，与文本帧对比
+
+同一批合成帧分别以文本和二进制（binary_frame.from_text 转换）表示，
+比较平均字节数和 parse_payload / binary_frame.decode 的单帧耗时，
+并核对两种格式解析出的设备ID和字段值一致。结果不一致或二进制解析更慢时以非零状态退出。
+运行: python benchmarks/bench_binary_frame.py [帧数]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import binary_frame  # noqa: E402
+import sensor_parser  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+FLEET = 1000
+
+
+def per_frame(func, frames):
+    started = time.perf_counter()
+    for frame in frames:
+        func(frame)
+    return (time.perf_counter() - started) / len(frames)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(42)
+    texts = [make_frame(rng.randrange(FLEET), rng) for _ in range(count)]
+    frames = [binary_frame.from_text(text) for text in texts]
+
+    text_bytes = sum(len(text.encode('utf-8')) for text in texts) / count
+    text_time = per_frame(sensor_parser.parse_payload, texts)
+    binary_time = per_frame(binary_frame.decode, frames)
+
+    print(f"帧数: {count}")
+    print(f"{'格式':<6} {'字节/帧':>8} {'解析 (us/帧)':>14}")
+    print(f"{'文本':<6} {text_bytes:>8.1f} {text_time * 1e6:>14.2f}")
+    print(f"{'二进制':<6} {binary_frame.FRAME_SIZE:>8} {binary_time * 1e6:>14.2f}")
+
+    failures = []
+    mismatched = sum(sensor_parser.parse_payload(text) != binary_frame.decode(frame)
+                     for text, frame in zip(texts, frames))
+    if mismatched:
+        failures.append(f"{mismatched} 帧的二进制解析结果与文本不一致")
+    if binary_time >= text_time:
+        failures.append("二进制帧解析没有比文本帧快")
+    if failures:
+        sys.exit("❌ " + "; ".join(failures))
+    print(f"✅ 结果一致，字节数为文本的 {binary_frame.FRAME_SIZE / text_bytes:.0%}，"
+          f"解析快 {text_time / binary_time:.1f} 倍")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+下行命令基准：向整个设备群下发同一条继电器命令，比较不同在途窗口的完成时间
+
+用模拟代理代替真实的 MQTT 连接：每条 QoS 1 消息在 RTT 之后回 PUBACK，
+并把命令转给模拟设备，设备随即上报一帧带新继电器状态的数据（经 backend.ingest_frame 接入）。
+通过 POST /api/commands 批量下发，记录全部命令收到 PUBACK 和全部被设备确认的耗时。
+窗口为 1 时每条命令都要等一个 RTT，只对一小部分设备运行并按比例推算整个设备群的耗时。
+有命令没有被确认、设备状态不对或大窗口下发超过 LIMIT_SECONDS 时以非零状态退出。
+运行: python benchmarks/bench_commands.py [设备数] [RTT毫秒]
+"""
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import paho.mqtt.client as mqtt  # noqa: E402
+
+import backend  # noqa: E402
+import commands  # noqa: E402
+from suite import reset_backend  # noqa: E402
+
+MQTT_CONFIG = {'server': 'broker.invalid', 'port': 1883}
+SERIAL_SAMPLE = 200
+LIMIT_SECONDS = 10.0
+
+
+class FakeBrokerClient:
+    """模拟 paho 客户端和代理：publish 之后经过 rtt 秒回调 on_publish，并由模拟设备上报新状态"""
+
+    def __init__(self, client_id=None, rtt=0.005):
+        self.client_id = client_id
+        self.rtt = rtt
+        self.on_connect = self.on_disconnect = self.on_publish = None
+        self._mid = 0
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+        self._running = False
+
+    def max_inflight_messages_set(self, inflight):
+        pass
+
+    def max_queued_messages_set(self, queue_size):
+        pass
+
+    def username_pw_set(self, username, password):
+        pass
+
+    def connect_async(self, host, port, keepalive=60):
+        self.on_connect(self, None, {}, 0)
+
+    def loop_start(self):
+        self._running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def loop_stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def disconnect(self):
+        pass
+
+    def publish(self, topic, payload, qos=0):
+        with self._cond:
+            self._mid = self._mid % 65535 + 1
+            self._pending.append((time.monotonic() + self.rtt, self._mid, topic, payload))
+            self._cond.notify()
+            return mqtt.MQTT_ERR_SUCCESS, self._mid
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                due, mid, topic, payload = self._pending[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                self._pending.popleft()
+            self.on_publish(self, None, mid)
+            # 设备执行命令后上报一帧，主题 stm32/<n>/cmd -> 设备 stm32_<n>
+            relay = json.loads(payload)['relay_status']
+            backend.ingest_frame(f"{topic.rsplit('/', 1)[0]} x\nRelay Status: {relay}")
+
+
+def wait_batch(client, batch, status, total, timeout):
+    """等待批次中 status 状态（及之后的状态）的命令数达到 total，返回是否达到"""
+    later = {'acked': ('acked', 'confirmed'), 'confirmed': ('confirmed',)}[status]
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        summary = client.get(f'/api/commands?batch={batch}').get_json()
+        if sum(summary['statuses'][s] for s in later) >= total:
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def run(fleet, window, rtt, relay):
+    """向前 fleet 台设备下发 relay_status=relay，返回 (全部 PUBACK 耗时, 全部确认耗时, 批次统计)"""
+    dispatcher = backend.start_commands(
+        window=window, client_factory=lambda client_id: FakeBrokerClient(client_id, rtt),
+        mqtt_config=MQTT_CONFIG)
+    client = backend.app.test_client()
+    device_ids = [f'stm32_{d}' for d in range(fleet)]
+    started = time.perf_counter()
+    response = client.post('/api/commands', json={'relay_status': relay, 'device_ids': device_ids})
+    assert response.status_code == 202, response.get_json()
+    batch = response.get_json()['batch']
+    acked = confirmed = float('nan')
+    timeout = fleet * rtt * 2 / window + 30
+    if wait_batch(client, batch, 'acked', fleet, timeout):
+        acked = time.perf_counter() - started
+    if wait_batch(client, batch, 'confirmed', fleet, timeout):
+        confirmed = time.perf_counter() - started
+    summary = client.get(f'/api/commands?batch={batch}').get_json()
+    dispatcher.stop()
+    backend.command_dispatcher = None
+    return acked, confirmed, summary
+
+
+def main():
+    logging.getLogger('sensor').setLevel(logging.ERROR)
+    logging.getLogger('commands').setLevel(logging.ERROR)
+    fleet = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rtt = float(sys.argv[2]) / 1e3 if len(sys.argv) > 2 else 0.005
+    reset_backend()
+    for d in range(fleet):
+        backend.ingest_frame(f"stm32/{d} x\nRelay Status: 0")
+    failures = []
+
+    print(f"设备数: {fleet}, 模拟 RTT: {rtt * 1e3:.1f} ms")
+    print(f"{'窗口':>6} {'命令数':>8} {'全部 PUBACK (s)':>16} {'全部确认 (s)':>14} {'推算全部设备 (s)':>18}")
+    results = {}
+    for window, count, relay in ((1, min(SERIAL_SAMPLE, fleet), 1), (commands.DEFAULT_WINDOW, fleet, 1)):
+        acked, confirmed, summary = run(count, window, rtt, relay)
+        results[window] = confirmed * fleet / count
+        print(f"{window:>6} {count:>8} {acked:>16.2f} {confirmed:>14.2f} {results[window]:>18.1f}")
+        if summary['statuses']['confirmed'] != count:
+            failures.append(f"窗口 {window}: 只有 {summary['statuses']['confirmed']}/{count} 条命令被确认 "
+                            f"({summary['statuses']})")
+    wrong = sum(backend.sensor_data.get(f'stm32_{d}')['relay_status'] != 1 for d in range(fleet))
+    if wrong:
+        failures.append(f"{wrong} 台设备的继电器状态不是 1")
+    large = results[commands.DEFAULT_WINDOW]
+    if not large <= LIMIT_SECONDS:
+        failures.append(f"窗口 {commands.DEFAULT_WINDOW} 下发全部设备用了 {large:.1f} 秒，超过 {LIMIT_SECONDS} 秒")
+    if failures:
+        sys.exit("❌ " + "; ".join(failures))
+    print(f"✅ {fleet} 台设备全部确认，用时 {large:.1f} 秒，比逐条等待 PUBACK 快 {results[1] / large:.0f} 倍")
+
+
+if __name__ == '__main__':
+    main()
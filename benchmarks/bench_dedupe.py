@@ -0,0 +1,139 @@
+"""
+重复帧/乱序帧过滤基准
+
+模拟 QoS 1 重复投递和乱序到达：每台设备按序号生成帧，随机交换相邻帧的顺序，并重复投递一部分帧。
+分别在关闭和开启过滤时把整批帧交给 ingest_frame，报告总耗时（交替运行 REPEAT 次取最短），并检查:
+- 开启过滤后，每台设备的最新数据来自序号最大的帧（乱序的旧帧没有覆盖新读数）
+- duplicate / stale 计数与按投递顺序推算的数量一致
+- 不带序号的帧按内容去重时，重复投递的帧都被识别出来
+运行: python benchmarks/bench_dedupe.py [设备数] [每台设备帧数]
+"""
+import itertools
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+import dedupe  # noqa: E402
+import metrics  # noqa: E402
+import sensor_parser  # noqa: E402
+from frames import make_frame  # noqa: E402
+from suite import reset_backend  # noqa: E402
+
+DUPLICATE_RATE = 0.2
+SWAP_RATE = 0.1
+REPEAT = 3
+
+
+def with_sequence(frame, seq):
+    return f"{frame}\nSeq: {seq}"
+
+
+def simulate(fleet, per_device, rng, sequenced):
+    """
+    返回 (投递顺序的帧, 重复投递数, 应判为 duplicate 的帧数, 应判为 stale 的帧数, {设备ID: 最大序号的帧})
+    带序号时，序号等于已到达的最大序号为 duplicate，小于为 stale（包括乱序旧帧的重复投递）
+    """
+    deliveries = []
+    latest = {}
+    repeats = duplicates = stale = 0
+    for d in range(fleet):
+        frames = [make_frame(d, rng) for _ in range(per_device)]
+        if sequenced:
+            frames = [with_sequence(frame, seq) for seq, frame in enumerate(frames, 1)]
+        latest[f'stm32_{d}'] = frames[-1]
+        order = list(range(per_device))
+        # 交换相邻两帧：后一帧先到，先发的帧到达时已经过时
+        i = 0
+        while i < per_device - 1:
+            if rng.random() < SWAP_RATE:
+                order[i], order[i + 1] = order[i + 1], order[i]
+                i += 2
+            else:
+                i += 1
+        stream = []
+        newest = -1
+        for index in order:
+            copies = 2 if rng.random() < DUPLICATE_RATE else 1
+            repeats += copies - 1
+            for copy in range(copies):
+                stream.append(frames[index])
+                if index < newest:
+                    stale += 1
+                elif copy or index == newest:
+                    duplicates += 1
+                newest = max(newest, index)
+        deliveries.append(stream)
+    # 设备之间交错投递，同一设备内保持上面的顺序
+    merged = [frame for group in itertools.zip_longest(*deliveries) for frame in group if frame is not None]
+    return merged, repeats, duplicates, stale, latest
+
+
+def deduped(reason):
+    return metrics.REGISTRY.value('sensor_frames_deduplicated_total', (reason,))
+
+
+def run(frames, window=None):
+    reset_backend()
+    backend.frame_filter = None if window is None else dedupe.FrameFilter(window)
+    counts = {reason: deduped(reason) for reason in (dedupe.DUPLICATE, dedupe.STALE)}
+    started = time.perf_counter()
+    for frame in frames:
+        backend.ingest_frame(frame)
+    elapsed = time.perf_counter() - started
+    hits = {reason: deduped(reason) - before for reason, before in counts.items()}
+    backend.frame_filter = None
+    return elapsed, hits
+
+
+def main():
+    logging.getLogger('sensor').setLevel(logging.ERROR)
+    fleet = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    per_device = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rng = random.Random(42)
+    failures = []
+
+    frames, repeats, duplicates, stale, latest = simulate(fleet, per_device, rng, sequenced=True)
+    print(f"设备数: {fleet}, 帧数: {len(frames)}, 重复投递: {repeats}, "
+          f"应判为 duplicate: {duplicates}, 应判为 stale: {stale}")
+    # 交替运行，各取最短耗时
+    plain = filtered = float('inf')
+    for _ in range(REPEAT):
+        plain = min(plain, run(frames)[0])
+        elapsed, hits = run(frames, window=dedupe.DEFAULT_WINDOW_SECONDS)
+        filtered = min(filtered, elapsed)
+    print(f"关闭过滤: {plain * 1e3:8.1f} ms  ({plain / len(frames) * 1e6:.2f} us/帧)")
+    print(f"开启过滤: {filtered * 1e3:8.1f} ms  ({filtered / len(frames) * 1e6:.2f} us/帧)  "
+          f"duplicate {hits[dedupe.DUPLICATE]}, stale {hits[dedupe.STALE]}")
+    if hits != {dedupe.DUPLICATE: duplicates, dedupe.STALE: stale}:
+        failures.append(f"带序号的帧: 丢弃计数 {hits} 与预期的 duplicate {duplicates} / stale {stale} 不一致")
+    wrong = 0
+    for device_id, frame in latest.items():
+        expected = sensor_parser.parse_payload(frame)[1]
+        current = backend.sensor_data.get(device_id)
+        if any(current[name] != value for name, value in expected.items()):
+            wrong += 1
+    if wrong:
+        failures.append(f"{wrong} 台设备的最新数据被乱序到达的旧帧覆盖")
+
+    # 不带序号：只能按内容去重
+    frames, repeats, _, _, _ = simulate(fleet, per_device, rng, sequenced=False)
+    _, hits = run(frames, window=dedupe.DEFAULT_WINDOW_SECONDS)
+    print(f"不带序号: 重复投递 {repeats}, 识别 {hits[dedupe.DUPLICATE]}")
+    if hits != {dedupe.DUPLICATE: repeats, dedupe.STALE: 0}:
+        failures.append(f"按内容去重: 丢弃计数 {hits}，重复投递 {repeats} 帧")
+
+    if failures:
+        sys.exit("❌ " + "; ".join(failures))
+    # 节省的解析开销只有几个百分点，在计时噪声范围内，耗时只报告不作为检查项
+    print(f"✅ 重复帧和乱序帧都在解析前丢弃，开启过滤后整批耗时 {filtered / plain - 1:+.0%}")
+
+
+if __name__ == '__main__':
+    main()
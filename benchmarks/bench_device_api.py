@@ -0,0 +1,82 @@
+"""
+设备列表/详情接口吞吐基准：预序列化缓存与逐请求构造 + jsonify 对比，
+以及按楼宇筛选（二级索引，只匹配一台设备）的吞吐，应与设备总数基本无关
+
+运行: python benchmarks/bench_device_api.py [设备数 ...]
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import jsonify  # noqa: E402
+
+import backend  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+
+def legacy_get_devices():
+    """改造前 get_devices 的做法：每次请求构造全部字典并 jsonify"""
+    result = []
+    for device_id, device in list(backend.devices.items()):
+        result.append(backend.device_to_dict(device, backend.sensor_data.get(device_id, {})))
+    return jsonify(result)
+
+
+backend.app.add_url_rule('/bench/legacy-devices', 'bench_legacy_devices', legacy_get_devices)
+
+
+def populate(fleet):
+    for store in (backend.devices, backend.sensor_data, backend.last_data_received_time):
+        store.clear()
+    backend.devices_by.clear()
+    backend.device_responses._bodies = None
+    backend.device_responses._list_body = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(fleet):
+            backend.ingest_frame(make_frame(i))
+
+
+def rate(client, path, seconds=1.0, between=None):
+    count = 0
+    start = time.perf_counter()
+    while True:
+        if between:
+            between(count)
+        client.get(path)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds and count >= 3:
+            return count / elapsed
+
+
+def main():
+    fleets = [int(a) for a in sys.argv[1:]] or [1000, 10000, 100000]
+    client = backend.app.test_client()
+    print(f"{'设备数':>8} {'旧版列表':>10} {'缓存列表':>10} {'缓存列表(每次10台变更)':>22} {'缓存详情':>10}"
+          f" {'按楼宇筛选':>10}   (请求/秒)")
+    for fleet in fleets:
+        populate(fleet)
+        legacy = rate(client, '/bench/legacy-devices')
+        client.get('/api/devices')
+        cached = rate(client, '/api/devices')
+
+        def churn(n):
+            with contextlib.redirect_stdout(io.StringIO()):
+                for j in range(10):
+                    backend.ingest_frame(make_frame((n * 10 + j) % fleet))
+        churned = rate(client, '/api/devices', between=churn)
+        detail = rate(client, f'/api/devices/stm32_{fleet // 2}')
+        building = quote(f'未知楼宇(stm32_{fleet // 2})')
+        filtered = rate(client, f'/api/devices?building={building}&limit=100', between=churn)
+        print(f"{fleet:>8} {legacy:>10.1f} {cached:>10.1f} {churned:>22.1f} {detail:>10.1f} {filtered:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
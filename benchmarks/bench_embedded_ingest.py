@@ -0,0 +1,117 @@
+"""
+端到端延迟基准：内嵌MQTT接入 与 mqtt_bridge -> HTTP -> backend 路径对比
+
+使用假 paho 客户端模拟代理投递消息，HTTP 路径使用本地 werkzeug 服务，
+测量从收到消息到 sensor_data 更新完成的延迟。
+运行: python benchmarks/bench_embedded_ingest.py [消息数]
+"""
+import contextlib
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import requests  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import backend  # noqa: E402
+from frames import make_frame  # noqa: E402
+from mqtt_ingest import MqttIngestor  # noqa: E402
+
+MQTT_CONFIG = {'server': 'fake-broker', 'port': 1883, 'client_id': 'bench', 'keepalive': 60}
+
+
+class FakeMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class FakeClient:
+    """模拟 paho 客户端：connect 后立即回调 on_connect，deliver 模拟代理投递"""
+
+    def __init__(self, client_id=None):
+        self.client_id = client_id
+        self.subscriptions = []
+        self.on_connect = self.on_disconnect = self.on_message = None
+
+    def username_pw_set(self, username, password):
+        pass
+
+    def connect_async(self, host, port, keepalive=60):
+        self.on_connect(self, None, {}, 0)
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.append((topic, qos))
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def deliver(self, topic, payload):
+        self.on_message(self, None, FakeMessage(topic, payload.encode('utf-8')))
+
+
+def wait_updated(device_id, previous):
+    while backend.sensor_data.get(device_id, {}).get('timestamp') == previous:
+        time.sleep(0)
+
+
+def bench_embedded(frames):
+    ingestor = MqttIngestor(backend.parse_sensor_data, MQTT_CONFIG, ['stm32/+'], client_factory=FakeClient).start()
+    latencies = []
+    for device_id, frame in frames:
+        previous = backend.sensor_data.get(device_id, {}).get('timestamp')
+        start = time.perf_counter()
+        ingestor.client.deliver(device_id.replace('_', '/'), frame)
+        wait_updated(device_id, previous)
+        latencies.append(time.perf_counter() - start)
+    ingestor.stop()
+    return latencies
+
+
+def bench_http(frames, port=5098):
+    server = make_server('127.0.0.1', port, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{port}/api/update-sensor-data'
+    latencies = []
+    for device_id, frame in frames:
+        start = time.perf_counter()
+        # 与改造前的 mqtt_bridge 一致：每条消息一个独立请求
+        requests.post(url, data=frame, headers={'Content-Type': 'text/plain'})
+        latencies.append(time.perf_counter() - start)
+    server.shutdown()
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name}: 平均 {statistics.mean(latencies) * 1e6:8.1f} us  "
+          f"中位数 {statistics.median(latencies) * 1e6:8.1f} us  p99 {p99 * 1e6:8.1f} us")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    frames = [(f'stm32_{i % 50}', make_frame(i % 50)) for i in range(count)]
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        embedded = bench_embedded(frames)
+        http = bench_http(frames)
+    print(f"消息数: {count}")
+    report("内嵌MQTT接入", embedded)
+    report("HTTP桥接路径", http)
+
+
+if __name__ == '__main__':
+    main()
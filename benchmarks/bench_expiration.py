@@ -0,0 +1,83 @@
+"""
+过期检查开销基准：时间轮与旧版全量扫描对比
+
+在不同设备规模下测量一次检查（tick）的耗时。所有设备都在线、只有固定数量的设备到期时，
+时间轮的单次检查耗时应与设备总数无关；若随规模增长超过阈值则以非零状态退出。
+运行: python benchmarks/bench_expiration.py
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from expiry import ExpirationWheel  # noqa: E402
+
+TIMEOUT = 60
+FLEET_SIZES = (1000, 10000, 100000)
+EXPIRING = 100
+TICKS = 50
+
+
+def legacy_tick(last_received, now):
+    """旧版 check_data_expiration 的单次遍历"""
+    expired = []
+    for device_id in list(last_received.keys()):
+        if device_id in last_received:
+            if now - last_received[device_id] > timedelta(seconds=TIMEOUT):
+                expired.append(device_id)
+    return expired
+
+
+def bench_wheel(fleet):
+    wheel = ExpirationWheel(TIMEOUT)
+    base = 1_000_000.0
+    # 在线设备的过期时间分布在未来 30~60 秒，EXPIRING 个设备在 base+TIMEOUT+0.5 到期
+    for i in range(fleet - EXPIRING):
+        wheel.arm(f'dev{i}', base + 30 + (i % 30))
+    for i in range(EXPIRING):
+        wheel.arm(f'exp{i}', base + 0.5)
+    wheel.expire(base + TIMEOUT)
+
+    quiet = time.perf_counter()
+    for _ in range(TICKS):
+        wheel.expire(base + TIMEOUT)
+    quiet = (time.perf_counter() - quiet) / TICKS
+
+    start = time.perf_counter()
+    expired = wheel.expire(base + TIMEOUT + 1)
+    firing = time.perf_counter() - start
+    assert len(expired) == EXPIRING, len(expired)
+    assert not wheel.expire(base + TIMEOUT + 2), "devices must fire only once"
+    return quiet, firing
+
+
+def bench_legacy(fleet):
+    now = datetime.now()
+    last_received = {f'dev{i}': now for i in range(fleet)}
+    start = time.perf_counter()
+    for _ in range(3):
+        legacy_tick(last_received, now)
+    return (time.perf_counter() - start) / 3
+
+
+def main():
+    print(f"{'设备数':>8} {'旧版全量扫描':>14} {'时间轮空闲tick':>16} {f'时间轮{EXPIRING}个到期':>16}")
+    firing_costs = []
+    for fleet in FLEET_SIZES:
+        legacy = bench_legacy(fleet)
+        quiet, firing = bench_wheel(fleet)
+        firing_costs.append(firing)
+        print(f"{fleet:>8} {legacy * 1e3:>11.3f} ms {quiet * 1e6:>13.2f} us {firing * 1e6:>13.2f} us")
+
+    # 设备数增长100倍，到期处理耗时不应明显增长
+    ratio = firing_costs[-1] / firing_costs[0]
+    print(f"到期tick耗时比 ({FLEET_SIZES[-1]}/{FLEET_SIZES[0]}): {ratio:.2f}")
+    if ratio > 5:
+        sys.exit("❌ 时间轮单次检查耗时随设备规模增长")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+转发管道基准：mqtt_bridge 的 BatchForwarder -> HTTP 批量接口 -> backend
+
+每台设备按顺序上报若干帧，第 k 帧的 temperature2 为 k，
+经多个转发线程并发送到本地 werkzeug 多线程服务。全部发送完后检查:
+- 没有消息被丢弃或发送失败
+- 每台设备写入后端的 temperature2 依次递增（同一设备的帧按顺序到达），最新值是最后一帧的值
+运行: python benchmarks/bench_forwarder.py [设备数] [每台设备帧数] [转发线程数]
+"""
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.serving import make_server  # noqa: E402
+
+import backend  # noqa: E402
+from forwarder import BLOCK, BatchForwarder  # noqa: E402
+from suite import reset_backend  # noqa: E402
+
+PORT = 5097
+
+
+def main():
+    fleet = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    per_device = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    reset_backend()
+    backend.topic_routes.add('stm32/+')
+    # 记录每台设备按写入顺序收到的 temperature2
+    arrivals = {f'stm32_{d}': [] for d in range(fleet)}
+    apply_updates = backend.apply_updates
+
+    def recording(device_id, updates, timestamp=None):
+        arrivals[device_id].append(updates.get('temperature2'))
+        return apply_updates(device_id, updates, timestamp)
+    backend.apply_updates = recording
+    server = make_server('127.0.0.1', PORT, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    total = fleet * per_device
+    forwarder = BatchForwarder(f'http://127.0.0.1:{PORT}/api/update-sensor-data/batch', workers=workers,
+                               queue_size=total, batch_size=50, policy=BLOCK, put_timeout=5).start()
+    started = time.perf_counter()
+    with contextlib.redirect_stderr(io.StringIO()):
+        for k in range(per_device):
+            for d in range(fleet):
+                forwarder.submit((f'stm32/{d}', f"Temperature2: {k}.00 C, Humidity2: 50.00 %"))
+        forwarder.stop(timeout=120)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    backend.apply_updates = apply_updates
+
+    stats = forwarder.stats()
+    print(f"设备数: {fleet}, 帧数: {total}, 转发线程: {workers}")
+    print(f"耗时 {elapsed:.2f} s ({total / elapsed:.0f} 帧/秒), 批次 {stats['batches']}, "
+          f"丢弃 {stats['dropped']}, 失败 {stats['failed']}")
+    failures = []
+    if stats['forwarded'] != total:
+        failures.append(f"只转发了 {stats['forwarded']}/{total} 帧 (丢弃 {stats['dropped']}, 失败 {stats['failed']})")
+    reordered = sum(any(a > b for a, b in zip(values, values[1:])) for values in arrivals.values())
+    if reordered:
+        failures.append(f"{reordered} 台设备的帧乱序到达后端")
+    last = float(per_device - 1)
+    wrong = sum(backend.sensor_data.get(f'stm32_{d}', {}).get('temperature2') != last for d in range(fleet))
+    if wrong:
+        failures.append(f"{wrong} 台设备的最新读数不是最后一帧（旧帧覆盖了新帧）")
+    if failures:
+        sys.exit("❌ " + "; ".join(failures))
+    print("✅ 全部帧已转发，每台设备的帧都按顺序到达，最新读数来自最后一帧")
+
+
+if __name__ == '__main__':
+    main()
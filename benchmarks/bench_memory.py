@@ -0,0 +1,117 @@
+"""
+每台设备内存占用回归检查
+
+分别测量设备注册表 + 最新数据（Device 与 sensor_data）在新旧两种表示下的每台设备内存，
+以及整个后端（含版本号、过期调度、响应缓存，不含历史缓冲区和聚合缓冲区）每台设备的内存。
+超过 DEVICE_BYTES_BUDGET 时以非零状态退出。
+运行: python benchmarks/bench_memory.py [设备数]
+"""
+import contextlib
+import gc
+import io
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+import rollup  # noqa: E402
+import sensor_store  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+# 设备注册表 + 最新数据的每台设备内存上限（字节）
+DEVICE_BYTES_BUDGET = 950
+
+
+class LegacyDevice:
+    """改造前的 Device：每个实例一个 __dict__，时间为 ISO 字符串"""
+
+    def __init__(self, device_id, name, protocol, location=None, properties=None):
+        self.id = device_id
+        self.name = name
+        self.protocol = protocol
+        self.location = location or {'building': '未知楼宇', 'floor': '未知楼层', 'room': '未知房间', 'position': '未知位置'}
+        self.properties = properties or {}
+        self.created_time = datetime.now().isoformat()
+        self.last_active_time = datetime.now().isoformat()
+        self.status = "online"
+        self.config = {}
+
+
+def measure(build, count):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    keep = build(count)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del keep
+    return (after - before) / count
+
+
+def _location(device_id):
+    return {'building': f'未知楼宇({device_id})', 'floor': '未知楼层', 'room': '未知房间', 'position': '未知位置'}
+
+
+def build_legacy(count):
+    devices, data = {}, {}
+    for i in range(count):
+        device_id = f'stm32_{i}'
+        devices[device_id] = LegacyDevice(device_id, f"自动注册设备-{device_id}", "mqtt", _location(device_id))
+        data[device_id] = {
+            'temperature1': 21.5 + i % 7, 'humidity1': 40.25 + i % 5, 'temperature2': 22.5 + i % 3,
+            'humidity2': 41.75 + i % 11, 'relay_status': i % 2, 'pb8_level': 1,
+            'timestamp': datetime.now().isoformat()
+        }
+    return devices, data
+
+
+def build_compact(count):
+    devices, data = {}, sensor_store.SensorStore()
+    for i in range(count):
+        device_id = f'stm32_{i}'
+        devices[device_id] = backend.Device(device_id, f"自动注册设备-{device_id}", "mqtt", _location(device_id))
+        data.allocate(device_id)
+        data.write(device_id, {
+            'temperature1': 21.5 + i % 7, 'humidity1': 40.25 + i % 5, 'temperature2': 22.5 + i % 3,
+            'humidity2': 41.75 + i % 11, 'relay_status': i % 2, 'pb8_level': 1
+        }, 1.7e9 + i)
+    return devices, data
+
+
+def build_backend(count):
+    # 历史缓冲区和聚合缓冲区单独统计，这里关闭
+    backend.device_history.record = lambda *args: None
+    backend.device_rollups.record = lambda *args: None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(count):
+            backend.ingest_frame(make_frame(i))
+    backend.device_responses.list_body()
+    return None
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    legacy = measure(build_legacy, count)
+    compact = measure(build_compact, count)
+    full = measure(build_backend, count)
+    history_bytes = backend.HISTORY_CAPACITY * (8 + 4 * len(sensor_store.FIELDS))
+    rollup_bytes = rollup.DeviceRollups(backend.ROLLUP_RETENTION).nbytes
+
+    print(f"设备数: {count}")
+    print(f"旧版 Device + sensor_data 字典:   {legacy:8.0f} 字节/台")
+    print(f"__slots__ Device + 列式存储:      {compact:8.0f} 字节/台")
+    print(f"后端整体（不含历史和聚合缓冲区）: {full:8.0f} 字节/台")
+    print(f"历史缓冲区 ({backend.HISTORY_CAPACITY} 条):          {history_bytes:8.0f} 字节/台")
+    print(f"聚合缓冲区:                       {rollup_bytes:8.0f} 字节/台")
+    if compact > DEVICE_BYTES_BUDGET:
+        sys.exit(f"❌ 每台设备内存 {compact:.0f} 字节超过上限 {DEVICE_BYTES_BUDGET}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+指标开销基准：对比单帧接入耗时与其中指标埋点的耗时，并检查多线程计数无丢失
+
+运行: python benchmarks/bench_metrics.py [帧数]
+"""
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+import metrics  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+# 埋点耗时占单帧接入耗时的上限
+MAX_OVERHEAD_RATIO = 0.15
+
+
+def check_threaded_counts(threads=8, per_thread=20000):
+    """多个线程并发计数，合并后的总数必须精确；线程结束后分片并入归档"""
+    registry = metrics.Registry()
+    counter = registry.counter('test_total', 'test', ('kind',))
+    histogram = registry.histogram('test_seconds', 'test')
+
+    def work():
+        for _ in range(per_thread):
+            counter.inc(('a',))
+            histogram.observe(0.001)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    expected = threads * per_thread
+    assert registry.value('test_total', ('a',)) == expected
+    assert registry.value('test_seconds')[-1] == expected
+    assert not registry._shards, "已结束线程的分片应并入归档"
+    assert registry.value('test_total', ('a',)) == expected
+
+
+def instrumentation(updates, errors):
+    # 与 backend.ingest_frame 中的埋点一致
+    started = time.perf_counter()
+    backend.PARSE_SECONDS.observe(time.perf_counter() - started)
+    backend.FRAMES_RECEIVED.inc()
+    if errors:
+        backend.FIELDS_FAILED.inc_each(errors)
+    backend.FRAMES_PARSED.inc()
+    backend.FIELDS_PARSED.inc_each(updates)
+
+
+def best_of(func, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    logging.getLogger('sensor').setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(42)
+    frames = [make_frame(rng.randint(1, 500), rng) for _ in range(count)]
+
+    check_threaded_counts()
+    print("✅ 多线程计数无丢失，结束线程的分片已归档")
+
+    parsed = [backend.sensor_parser.parse_payload(frame)[1] or {} for frame in frames]
+
+    def ingest():
+        for frame in frames:
+            backend.parse_sensor_data(frame)
+
+    def instrument():
+        for updates in parsed:
+            instrumentation(updates, ())
+
+    ingest_time = best_of(ingest)
+    metric_time = best_of(instrument)
+    ratio = metric_time / ingest_time
+    render_start = time.perf_counter()
+    body = metrics.REGISTRY.render()
+    render_time = time.perf_counter() - render_start
+
+    print(f"帧数: {count}")
+    print(f"单帧接入: {ingest_time * 1e6 / count:8.2f} us/帧")
+    print(f"指标埋点: {metric_time * 1e6 / count:8.2f} us/帧  ({ratio:.1%})")
+    print(f"/api/metrics 渲染: {render_time * 1e3:.1f} ms, {len(body)} 字节")
+    if ratio > MAX_OVERHEAD_RATIO:
+        print(f"❌ 埋点开销超过 {MAX_OVERHEAD_RATIO:.0%}")
+        sys.exit(1)
+    print("✅ 埋点开销在预算内")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+解析器微基准：对比旧版 parse_sensor_data 与字段表解析引擎
+
+运行: python benchmarks/bench_parser.py [帧数]
+"""
+import contextlib
+import io
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+import legacy_parser  # noqa: E402
+from frames import EDGE_FRAMES, make_frame  # noqa: E402
+
+
+def _strip_timestamps(data):
+    # 用 repr 比较，使 nan 也能判等
+    return {k: {f: repr(v) for f, v in d.items() if f != 'timestamp'} for k, d in data.items()}
+
+
+def check_equivalence(frames):
+    """逐帧对比两种实现产生的 sensor_data 与时间戳更新"""
+    for frame in frames:
+        legacy_parser.reset()
+        backend.devices.clear()
+        backend.sensor_data.clear()
+        backend.last_data_received_time.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy_parser.parse_sensor_data(frame)
+            backend.parse_sensor_data(frame)
+        old, new = legacy_parser.sensor_data, backend.sensor_data
+        assert _strip_timestamps(old) == _strip_timestamps(new), (frame, old, new)
+        assert old.keys() == new.keys(), frame
+        for device_id in old:
+            assert (old[device_id]['timestamp'] is None) == (new[device_id]['timestamp'] is None), frame
+        assert legacy_parser.last_data_received_time.keys() == backend.last_data_received_time.keys(), frame
+
+
+def bench(func, frames, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for frame in frames:
+                func(frame)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    # 边界帧会触发解析告警，基准中只保留错误日志
+    logging.getLogger('sensor').setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = random.Random(42)
+    frames = [make_frame(rng.randint(1, 500), rng) for _ in range(count)]
+
+    check_equivalence(EDGE_FRAMES + frames[:1000])
+    print(f"✅ 新旧解析结果一致 ({len(EDGE_FRAMES) + 1000} 帧)")
+
+    legacy = bench(legacy_parser.parse_sensor_data, frames)
+    engine = bench(backend.parse_sensor_data, frames)
+    print(f"帧数: {count}")
+    print(f"旧版解析器: {legacy * 1e6 / count:8.2f} us/帧  {count / legacy:10.0f} 帧/秒")
+    print(f"字段表引擎: {engine * 1e6 / count:8.2f} us/帧  {count / engine:10.0f} 帧/秒")
+    print(f"加速比: {legacy / engine:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+持久化开销基准：关闭/开启 SQLite 后台批量提交时的接入吞吐
+
+接入吞吐只计 parse_sensor_data 本身（写入在后台线程完成），另外给出后台把全部记录
+落盘所需的时间，并检查重启恢复的设备数与每帧记录数。
+运行: python benchmarks/bench_persistence.py [帧数] [设备数]
+"""
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+
+def reset():
+    for store in (backend.devices, backend.sensor_data, backend.last_data_received_time):
+        store.clear()
+    backend.persistence = None
+
+
+def run(frames, db_path=None, **options):
+    """返回 (接入耗时, 落盘耗时)"""
+    reset()
+    store = backend.start_persistence(db_path, **options) if db_path else None
+    start = time.perf_counter()
+    for frame in frames:
+        backend.parse_sensor_data(frame)
+    ingest = time.perf_counter() - start
+    drain = 0.0
+    if store is not None:
+        store.flush(timeout=300)
+        drain = time.perf_counter() - start
+        store.close()
+    return ingest, drain
+
+
+def main():
+    logging.getLogger('sensor').setLevel(logging.ERROR)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    fleet = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = random.Random(42)
+    frames = [make_frame(rng.randint(1, fleet), rng) for _ in range(count)]
+
+    print(f"帧数: {count}, 设备数: {fleet}")
+    print(f"{'模式':<28} {'接入 (帧/秒)':>14} {'全部落盘耗时':>14}")
+    baseline, _ = run(frames)
+    print(f"{'关闭持久化':<28} {count / baseline:>14.0f} {'-':>14}")
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, options in (('WAL, synchronous=NORMAL', {'synchronous': 'NORMAL'}),
+                              ('WAL, synchronous=FULL', {'synchronous': 'FULL'}),
+                              ('WAL, NORMAL, 不保存每帧记录', {'synchronous': 'NORMAL', 'keep_readings': False})):
+            path = os.path.join(tmp, f"{len(os.listdir(tmp))}.db")
+            ingest, drain = run(frames, path, **options)
+            print(f"{name:<28} {count / ingest:>14.0f} {drain:>12.2f} 秒")
+
+            expected = len(backend.devices)
+            reset()
+            started = time.perf_counter()
+            restored = backend.start_persistence(path)
+            restore_time = time.perf_counter() - started
+            restored.close()
+            readings = sqlite3.connect(path).execute('SELECT COUNT(*) FROM readings').fetchone()[0]
+            want_readings = count if options.get('keep_readings', True) else 0
+            if len(backend.devices) != expected or readings != want_readings:
+                failures.append(f"{name}: 恢复 {len(backend.devices)}/{expected} 台设备, {readings}/{want_readings} 条记录")
+            print(f"{'':<28} 恢复 {len(backend.devices)} 台设备 {restore_time * 1e3:.0f} ms")
+    reset()
+
+    if failures:
+        sys.exit("❌ " + "; ".join(failures))
+    print("✅ 重启后设备和每帧记录完整")
+
+
+if __name__ == '__main__':
+    main()
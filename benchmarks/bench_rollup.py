@@ -0,0 +1,94 @@
+"""
+增量聚合基准：单帧更新耗时、长时间运行的内存占用，以及与原始数据重新计算的结果对比
+
+模拟若干设备每 2 秒上报一次、连续运行数天，中途记录已分配内存，
+保留期写满之后内存不应再增长；最后用保留期内的原始数据重新计算各桶核对结果。
+运行: python benchmarks/bench_rollup.py [设备数] [模拟小时数]
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rollup  # noqa: E402
+
+INTERVAL = 2.0
+BASE = 1_700_000_000.0
+
+
+def main():
+    fleet = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    hours = int(sys.argv[2]) if len(sys.argv) > 2 else 96
+    store = rollup.RollupStore()
+    rng = random.Random(42)
+    frames_per_hour = int(3600 / INTERVAL)
+    retention_hours = max(store.retention['hour'], store.retention['minute'] / 60)
+    # 最后一台设备保留期内的原始数据，用于核对
+    raw = deque(maxlen=int(retention_hours * frames_per_hour))
+
+    samples = []
+    elapsed = 0.0
+    timed = None
+    now = BASE
+    for hour in range(hours):
+        for _ in range(frames_per_hour):
+            now += INTERVAL
+            for device in range(fleet):
+                updates = {'temperature1': round(rng.uniform(15, 35), 2), 'relay_status': rng.randint(0, 1)}
+                started = time.perf_counter()
+                store.record(f'stm32_{device}', now, updates)
+                elapsed += time.perf_counter() - started
+            raw.append((now, updates['temperature1']))
+        # 保留期写满后开始跟踪内存，此前的更新耗时不受 tracemalloc 影响
+        if hour + 1 == retention_hours:
+            timed = (hour + 1) * frames_per_hour * fleet, elapsed
+            tracemalloc.start()
+        if hour + 1 >= retention_hours:
+            samples.append(tracemalloc.get_traced_memory()[0])
+    tracemalloc.stop()
+
+    frames = hours * frames_per_hour * fleet
+    print(f"设备数: {fleet}, 模拟 {hours} 小时, {frames} 帧")
+    if timed:
+        print(f"单帧聚合更新: {timed[1] / timed[0] * 1e6:.2f} us")
+    print(f"每台设备聚合缓冲区: {store.get('stm32_0').nbytes / 1024:.1f} KB")
+
+    failures = []
+    if samples:
+        growth = samples[-1] - samples[0]
+        print(f"保留期写满后的内存变化: {growth / 1024:+.1f} KB ({len(samples)} 个采样点)")
+        # 允许少量解释器内部波动，不应随运行时长增长
+        if growth > 64 * 1024:
+            failures.append(f"内存增长 {growth / 1024:.0f} KB")
+
+    times = np.array([t for t, _ in raw])
+    values = np.array([v for _, v in raw])
+    for resolution, width in rollup.RESOLUTIONS.items():
+        _, starts, series = store.query(f'stm32_{fleet - 1}', resolution, now + width)
+        column = series['temperature1']
+        mismatch = None
+        for i, start in enumerate(starts):
+            mask = (times >= start / 1000) & (times < start / 1000 + width)
+            expected = values[mask]
+            got = (column['count'][i], column['min'][i], column['max'][i], column['mean'][i])
+            want = (len(expected), round(expected.min(), 2), round(expected.max(), 2), round(expected.mean(), 2))
+            if got[0] != want[0] or not np.allclose(got[1:], want[1:], atol=0.011):
+                mismatch = f"{resolution} 桶 {start}: {got} != {want}"
+                failures.append(mismatch)
+                break
+        print(mismatch or f"{resolution}: {len(starts)} 个桶与原始数据一致")
+
+    if failures:
+        sys.exit("❌ " + "; ".join(failures))
+    print("✅ 聚合结果正确，内存不随运行时长增长")
+
+
+if __name__ == '__main__':
+    main()
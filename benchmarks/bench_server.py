@@ -0,0 +1,121 @@
+"""
+服务模式对比基准：Flask 开发服务器 (app.run(debug=True)) 与 server.py 异步服务
+
+分别在子进程中启动两种服务，预先注册一批设备，然后用 asyncio 客户端以固定并发
+（keep-alive 连接）压测设备列表和单帧上报接口，输出吞吐与延迟。
+运行: python benchmarks/bench_server.py [并发数] [秒数] [设备数]
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import batch_codec  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+DEV_SERVER = "import backend; backend.app.run(debug=True, host='127.0.0.1', port={port}, use_reloader=False)"
+
+
+def start(cmd, port):
+    proc = subprocess.Popen(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            requests.get(f'http://127.0.0.1:{port}/api/health', timeout=0.5)
+            return proc
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def http_request(reader, writer, method, path, body=b''):
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length, close = 0, False
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-length':
+            length = int(value)
+        elif name == b'connection' and value.strip().lower() == b'close':
+            close = True
+    await reader.readexactly(length)
+    return status, close
+
+
+async def client_loop(port, deadline, latencies, errors, index):
+    reader = writer = None
+    n = 0
+    while time.perf_counter() < deadline:
+        if writer is None:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        if n % 2:
+            method, path, body = 'GET', '/api/devices', b''
+        else:
+            method, path, body = 'POST', '/api/update-sensor-data', make_frame((index * 7919 + n) % 1000).encode()
+        n += 1
+        start = time.perf_counter()
+        try:
+            status, close = await http_request(reader, writer, method, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            errors.append('connection')
+            writer.close()
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status >= 500:
+            errors.append(status)
+        if close:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(port, concurrency, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(port, deadline, latencies, errors, i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def run(name, cmd, port, concurrency, seconds, fleet):
+    proc = start(cmd, port)
+    try:
+        body = batch_codec.encode_length_prefixed([make_frame(i) for i in range(fleet)])
+        requests.post(f'http://127.0.0.1:{port}/api/update-sensor-data/batch', data=body,
+                      headers={'Content-Type': batch_codec.LENGTH_PREFIXED})
+        latencies, errors, elapsed = asyncio.run(load(port, concurrency, seconds))
+    finally:
+        proc.terminate()
+        proc.wait()
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] if latencies else float('nan')
+    print(f"{name:<28} {len(latencies) / elapsed:>9.0f} 请求/秒  中位数 {statistics.median(latencies) * 1e3:7.2f} ms"
+          f"  p99 {p99 * 1e3:7.2f} ms  错误 {len(errors)}")
+
+
+def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    fleet = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    print(f"并发连接: {concurrency}, 时长: {seconds}s, 设备数: {fleet}, 请求: GET /api/devices 与单帧上报各半")
+    run("开发服务器 (debug=True)", [sys.executable, '-c', DEV_SERVER.format(port=5201)], 5201, concurrency, seconds, fleet)
+    run("server.py (8 工作线程)", [sys.executable, 'server.py', '--host', '127.0.0.1', '--port', '5202'],
+        5202, concurrency, seconds, fleet)
+
+
+if __name__ == '__main__':
+    main()
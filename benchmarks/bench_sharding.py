@@ -0,0 +1,106 @@
+"""
+分片接入扩展性基准：1 到 N 个工作进程的接入吞吐
+
+每种进程数先让所有设备各上报一帧（启动工作进程、分配槽位，不计时），
+再计时分发全部帧直到各工作进程都解析完，并与主进程内逐帧 ingest_frame 的吞吐对比。
+最后核对共享内存表中每台设备的最新数据与逐帧解析的结果一致。
+有 2 个以上 CPU 时，2 个工作进程的吞吐应至少是 1 个的 MIN_SPEEDUP 倍。
+运行: python benchmarks/bench_sharding.py [最大进程数] [帧数] [设备数]
+"""
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ingest_shards  # noqa: E402
+import sensor_parser  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+MIN_SPEEDUP = 1.3
+
+
+def in_process(frames):
+    import backend
+    from suite import reset_backend
+    reset_backend()
+    started = time.perf_counter()
+    for frame in frames:
+        backend.ingest_frame(frame)
+    return len(frames) / (time.perf_counter() - started)
+
+
+def wait_received(shards, total, timeout=600):
+    deadline = time.monotonic() + timeout
+    while sum(stats['received'] for stats in shards.stats()) < total:
+        if time.monotonic() > deadline:
+            raise RuntimeError("workers did not finish in time")
+        time.sleep(0.001)
+
+
+def sharded(workers, warmup, frames, fleet):
+    """返回 (帧/秒, 收集到的 {设备ID: 最新数据})"""
+    latest = {}
+    shards = ingest_shards.ShardedIngest(lambda device_id, values, _: latest.__setitem__(device_id, values),
+                                         workers, capacity=max(fleet * 2, 1000)).start()
+    try:
+        for frame in warmup:
+            shards.submit(frame)
+        shards.flush()
+        wait_received(shards, len(warmup))
+
+        started = time.perf_counter()
+        for frame in frames:
+            shards.submit(frame)
+        shards.flush()
+        wait_received(shards, len(warmup) + len(frames))
+        rate = len(frames) / (time.perf_counter() - started)
+        shards.collect()
+        return rate, latest
+    finally:
+        shards.stop()
+
+
+def main():
+    logging.getLogger('sensor').setLevel(logging.ERROR)
+    cpus = os.cpu_count() or 1
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else max(2, cpus)
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    fleet = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    rng = random.Random(42)
+    warmup = [make_frame(i, rng) for i in range(fleet)]
+    frames = [make_frame(rng.randrange(fleet), rng) for _ in range(count)]
+
+    expected = {}
+    for frame in warmup + frames:
+        device_id, updates = sensor_parser.parse_payload(frame)
+        expected.setdefault(device_id, {}).update(updates)
+
+    print(f"CPU: {cpus}, 帧数: {count}, 设备数: {fleet}")
+    print(f"{'模式':<16} {'帧/秒':>10} {'相对1个进程':>12}")
+    print(f"{'主进程内解析':<16} {in_process(frames):>10.0f} {'-':>12}")
+
+    failures = []
+    rates = {}
+    for workers in range(1, max_workers + 1):
+        rate, latest = sharded(workers, warmup, frames, fleet)
+        rates[workers] = rate
+        print(f"{f'{workers} 个工作进程':<16} {rate:>10.0f} {rate / rates[1]:>11.2f}x")
+        if latest != expected:
+            failures.append(f"{workers} 个工作进程: 共享内存表中的最新数据与逐帧解析不一致")
+
+    if cpus >= 2 and 2 in rates and rates[2] < rates[1] * MIN_SPEEDUP:
+        failures.append(f"2 个工作进程只有 1 个的 {rates[2] / rates[1]:.2f} 倍")
+    if failures:
+        sys.exit("❌ " + "; ".join(failures))
+    if cpus < 2:
+        print("⚠️ 只有 1 个 CPU，无法检查多进程的扩展性")
+    print("✅ 分片接入结果正确")
+
+
+if __name__ == '__main__':
+    main()
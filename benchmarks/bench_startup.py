@@ -0,0 +1,109 @@
+"""
+重启耗时基准：从快照 (mmap + 变更日志) 与从 SQLite 逐行恢复的首个请求可用时间
+
+先在进程内生成指定规模的设备并同时写入 SQLite 和快照，快照之后再上报一批数据进入变更日志；
+然后分别以 --snapshot 和 --db 启动 server.py 子进程，测量从启动到 /api/health 首次返回的时间，
+并核对恢复出的设备数和抽样设备的数据。快照启动超过 TARGET_SECONDS 时以非零状态退出。
+运行: python benchmarks/bench_startup.py [设备数] [快照后的变更帧数]
+"""
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+TARGET_SECONDS = 1.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def build_state(tmp, fleet, changes):
+    """生成设备并写入数据库和快照，返回 (数据库路径, 快照路径, 抽样设备的期望数据)"""
+    db_path = os.path.join(tmp, 'sensor.db')
+    snapshot_path = os.path.join(tmp, 'sensor.snap')
+    backend.start_persistence(db_path, keep_readings=False)
+    backend.start_snapshots(snapshot_path, interval=3600)
+    rng = random.Random(42)
+    for i in range(fleet):
+        backend.ingest_frame(make_frame(i, rng))
+    backend.take_snapshot()
+    # 快照之后的变更只存在于变更日志中
+    for i in range(changes):
+        backend.ingest_frame(make_frame(rng.randrange(fleet), rng))
+    backend.persistence.flush(timeout=600)
+    samples = {f'stm32_{i}': backend.sensor_data.get(f'stm32_{i}') for i in rng.sample(range(fleet), 20)}
+    return db_path, snapshot_path, samples
+
+
+def measure(args, fleet, samples):
+    """启动 server.py，返回首个请求可用的秒数；恢复结果不一致时抛出 AssertionError"""
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, 'server.py', '--host', '127.0.0.1', '--port', str(port),
+                             '--snapshot-interval', '3600', '--log-level', 'WARNING', *args],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        session = requests.Session()
+        while True:
+            try:
+                if session.get(f'http://127.0.0.1:{port}/api/health', timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if proc.poll() is not None:
+                raise RuntimeError(f"server.py exited with {proc.returncode}")
+            time.sleep(0.01)
+        ready = time.perf_counter() - started
+
+        metrics = session.get(f'http://127.0.0.1:{port}/api/metrics').text
+        counts = [float(line.split()[-1]) for line in metrics.splitlines() if line.startswith('sensor_devices{')]
+        assert sum(counts) == fleet, (sum(counts), fleet)
+        for device_id, expected in samples.items():
+            data = session.get(f'http://127.0.0.1:{port}/api/devices/{device_id}').json()['current_data']
+            assert data == expected, (device_id, data, expected)
+        return ready
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    logging.getLogger('sensor').setLevel(logging.ERROR)
+    fleet = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    changes = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        db_path, snapshot_path, samples = build_state(tmp, fleet, changes)
+        print(f"设备数: {fleet}, 快照后变更: {changes} 帧 (准备耗时 {time.perf_counter() - started:.1f} 秒)")
+        print(f"快照大小: {os.path.getsize(snapshot_path) / 1e6:.1f} MB, "
+              f"变更日志: {os.path.getsize(snapshot_path + '.journal') / 1e3:.0f} KB")
+
+        from_snapshot = measure(['--snapshot', snapshot_path], fleet, samples)
+        print(f"从快照启动:  首个请求可用 {from_snapshot:.2f} 秒")
+        from_db = measure(['--db', db_path], fleet, samples)
+        print(f"从数据库启动: 首个请求可用 {from_db:.2f} 秒")
+
+    if from_snapshot > TARGET_SECONDS:
+        sys.exit(f"❌ 从快照启动超过 {TARGET_SECONDS} 秒")
+    print(f"✅ 从快照启动在 {TARGET_SECONDS} 秒内")
+
+
+if __name__ == '__main__':
+    main()
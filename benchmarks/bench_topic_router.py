@@ -0,0 +1,84 @@
+"""
+主题路由基准：匹配耗时只与主题层数有关，与路由总数无关
+
+路由表中除被测的几条通配符路由外，再加入几十到几万条不相关的精确路由，
+比较不走缓存的 match() 耗时，增长超过 MAX_RATIO 倍时以非零状态退出。
+同时比较带主题的 parse() 与从载荷首行提取设备ID的 parse_payload()，并核对两者结果一致。
+运行: python benchmarks/bench_topic_router.py [次数]
+"""
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import sensor_parser  # noqa: E402
+import topic_router  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+FLEET = 1000
+MAX_RATIO = 1.5
+
+
+def make_router(extra_routes):
+    router = topic_router.TopicRouter([
+        {'filter': 'stm32/+'},
+        {'filter': 'site/+/+/+/sensor/#', 'decoder': 'json', 'device': '{1}_{5}'},
+    ])
+    for i in range(extra_routes):
+        router.add(f'other/{i}/stm32/{i % 7}')
+        router.add(f'site/b{i}/f1/r1/status')
+    return router
+
+
+def time_match(router, topics):
+    started = time.perf_counter()
+    for topic in topics:
+        router.match(topic)
+    return (time.perf_counter() - started) / len(topics)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(42)
+    shallow = [f'stm32/{rng.randrange(FLEET)}' for _ in range(count)]
+    deep = [f'site/b{rng.randrange(50)}/f{rng.randrange(10)}/r{rng.randrange(20)}/sensor/{rng.randrange(FLEET)}'
+            for _ in range(count)]
+
+    print(f"次数: {count}")
+    print(f"{'路由总数':>10} {'2 层 (us)':>10} {'6 层 (us)':>10}")
+    results = []
+    for extra in (0, 5000, 25000):
+        router = make_router(extra)
+        per_shallow, per_deep = time_match(router, shallow), time_match(router, deep)
+        results.append((per_shallow, per_deep))
+        print(f"{len(router):>10} {per_shallow * 1e6:>10.2f} {per_deep * 1e6:>10.2f}")
+
+    failures = []
+    ratio = max(max(s / results[0][0], d / results[0][1]) for s, d in results)
+    if ratio > MAX_RATIO:
+        failures.append(f"路由总数增加后匹配耗时增长 {ratio:.2f} 倍")
+
+    # 带主题解析与从载荷提取设备ID对比
+    router = make_router(0)
+    frames = [(f'stm32/{d}', make_frame(d, rng)) for d in (rng.randrange(FLEET) for _ in range(count // 4))]
+    started = time.perf_counter()
+    routed = [router.parse(frame, topic) for topic, frame in frames]
+    per_routed = (time.perf_counter() - started) / len(frames)
+    started = time.perf_counter()
+    legacy = [sensor_parser.parse_payload(frame) for _, frame in frames]
+    per_legacy = (time.perf_counter() - started) / len(frames)
+    print(f"带主题解析: {per_routed * 1e6:.2f} us/帧, 从载荷提取设备ID: {per_legacy * 1e6:.2f} us/帧")
+    if routed != legacy:
+        failures.append("带主题解析的结果与 parse_payload 不一致")
+
+    if failures:
+        sys.exit("❌ " + "; ".join(failures))
+    print(f"✅ 匹配耗时与路由总数无关（最大 {ratio:.2f} 倍），解析结果一致")
+
+
+if __name__ == '__main__':
+    main()
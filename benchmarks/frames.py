@@ -0,0 +1,33 @@
+"""
+合成 STM32 传感器帧生成器
+"""
+import random
+
+
+def make_frame(device_no, rng=random, newline='\n'):
+    """生成一帧与固件输出格式一致的文本"""
+    return newline.join((
+        f"stm32/{device_no} Temperature1: {rng.uniform(15, 35):.2f} C, Humidity1: {rng.uniform(10, 90):.2f} %",
+        f"Temperature2: {rng.uniform(15, 35):.2f} C, Humidity2: {rng.uniform(10, 90):.2f} %",
+        f"Relay Status: {rng.randint(0, 1)}",
+        f"PB8 Level: {rng.randint(0, 1)}",
+    ))
+
+
+# 覆盖各类边界情况的帧，用于新旧解析器结果一致性校验
+EDGE_FRAMES = [
+    "stm32/1 Temperature1: 22.10 C, Humidity1: 16.10 %\nTemperature2: 21.80 C, Humidity2: 23.40 %\nRelay Status: 1\nPB8 Level: 1",
+    "stm32/2 Temperature1: 22.10 C, Humidity1: 16.10 %\r\nTemperature2: 21.80 C, Humidity2: 23.40 %\r\nRelay Status: 0\r\nPB8 Level: 0\r\n",
+    "stm32/3 Temperature1: 22.10 C, Humidity1: 16.10 %\rTemperature2: 21.80 C\rHumidity2: 23.40 %\rRelay Status: 1",
+    "stm32/4\nTemperature1: 25.5 C\nHumidity1: 40 %\nTemperature2: 26 C\nHumidity2: 41 %\nRelay Status: 1\nPB8 Level: 0",
+    "stm32/5 Temperature1: abc C, Humidity1: 16.10 %\nTemperature2: , Humidity2: x\nRelay Status: on\nPB8 Level: 1.0",
+    "stm32/6 x\nTemperature1: 20 C,Humidity1: 30 %\n  Temperature2: 21 C ,  Humidity2: 31 %  \nRelay Status:  1 \nPB8 Level:1",
+    "stm32/7 x\nTemperature1: 20 C, Humidity2: 30 %\nTemperature2: 1 C, Humidity1: 2 %, Relay Status: 1",
+    "stm32/8 x\nTemperature1: 1e3 C\nHumidity1: nan %\nRelay Status: 1_0\nPB8 Level: -1",
+    "nodevice",
+    " leading Temperature1: 1 C\nPB8 Level: 1",
+    "\n\n  \r\n",
+    "",
+    "stm32/9 Relay Status: 1\nrelay status: 1\nRelay Status 1\nPB8 Level: \n",
+    "stm32/10 x\nTemperature1: 1 C, Humidity1: 2 %, Temperature1: 3 C\nTemperature1: 4 C\x0bHumidity1: 5 %",
+]
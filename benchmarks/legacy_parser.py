@@ -0,0 +1,208 @@
+"""
+旧版 parse_sensor_data 的原样副本，仅供基准测试对比与结果一致性校验使用
+
+存储与设备注册使用本模块内的独立字典，不会影响 backend 的状态
+"""
+from datetime import datetime
+
+devices = {}
+sensor_data = {}
+last_data_received_time = {}
+
+
+def reset():
+    devices.clear()
+    sensor_data.clear()
+    last_data_received_time.clear()
+
+
+def create_device(device_id, name, protocol, location=None, properties=None):
+    if device_id in devices:
+        return False, "Device already exists"
+    devices[device_id] = {'name': name, 'protocol': protocol, 'location': location}
+    sensor_data[device_id] = {
+        'temperature1': 0.0,
+        'humidity1': 0.0,
+        'temperature2': 0.0,
+        'humidity2': 0.0,
+        'relay_status': 0,
+        'pb8_level': 0,
+        'timestamp': None
+    }
+    return True, "Device created successfully"
+
+
+def update_device_status(device_id, status):
+    if device_id in devices:
+        devices[device_id]['status'] = status
+        devices[device_id]['last_active_time'] = datetime.now().isoformat()
+
+
+# 解析从MQTT接收到的数据
+def parse_sensor_data(payload_str):
+    """
+    解析传感器数据字符串
+    格式示例: "stm32/1 Temperature1: 22.10 C, Humidity1: 16.10 %\nTemperature2: 21.80 C, Humidity2: 23.40 %\nRelay Status: 1\nPB8 Level: 1"
+    """
+    global sensor_data, last_data_received_time
+    
+    print(f"📥 接收到原始数据: {repr(payload_str)}")
+    
+    try:
+        # 从payload中解析传感器ID，格式为 "stm32/1 Temperature1:..."
+        # 使用更灵活的换行符处理
+        import re
+        # 分割行，保留非空行
+        payload_lines = [line for line in re.split(r'\r?\n|\r', payload_str) if line.strip()]
+        
+        if not payload_lines:
+            print("⚠️ 未找到任何有效数据行")
+            return
+        
+        first_line = payload_lines[0]
+        print(f"🔍 第一行: {repr(first_line)}")
+        
+        # 提取传感器ID，格式为 "topic_name ..."，查找第一个空格前的部分
+        # 正确的格式应该是 "stm32/1 Temperature1: 26.10 C, Humidity1: 15.90 %"
+        space_index = first_line.find(' ')
+        if space_index != -1:
+            device_id = first_line[:space_index].replace('/', '_')  # 将 "stm32/1" 转换为 "stm32_1"
+        else:
+            # 如果没有找到空格，说明格式不正确
+            device_id = 'default'
+            print(f"⚠️ 无法从第一行解析设备ID，使用默认ID: {device_id}")
+        
+        print(f"🏷️ 解析到的设备ID: {device_id}")
+        
+        # 如果设备不存在，自动注册
+        if device_id not in devices:
+            create_device(
+                device_id=device_id,
+                name=f"自动注册设备-{device_id}",
+                protocol="mqtt",
+                location={'building': f'未知楼宇({device_id})', 'floor': '未知楼层', 'room': '未知房间', 'position': '未知位置'}
+            )
+            print(f"✅ 自动注册新设备: {device_id}")
+        
+        # 更新设备状态为在线
+        update_device_status(device_id, "online")
+        
+        # 记录是否成功解析到任何数据
+        parsed_any_data = False
+        
+        # 遍历所有行进行解析
+        for line_idx, line in enumerate(payload_lines):
+            line = line.strip()
+            if not line:
+                continue
+                
+            print(f"🔍 处理第{line_idx+1}行: {repr(line)}")
+            
+            # 检查是否是包含多个传感器数据的复合行（如第一行）
+            if 'Temperature1:' in line and 'Humidity1:' in line:
+                # 处理复合行，例如 "Temperature1: 22.10 C, Humidity1: 16.10 %"
+                parts = line.split(', ')
+                for part in parts:
+                    part = part.strip()
+                    if part.startswith('Temperature1:'):
+                        try:
+                            # 提取 "Temperature1: 22.10 C" 中的数值
+                            value_str = part.split(':', 1)[1].strip().split(' ')[0]
+                            sensor_data[device_id]['temperature1'] = float(value_str)
+                            parsed_any_data = True
+                            print(f"  -> Temperature1값: {value_str}")
+                        except (ValueError, IndexError):
+                            print(f"  -> 无法解析Temperature1: {part}")
+                    elif part.startswith('Humidity1:'):
+                        try:
+                            value_str = part.split(':', 1)[1].strip().split(' ')[0]
+                            sensor_data[device_id]['humidity1'] = float(value_str)
+                            parsed_any_data = True
+                            print(f"  -> Humidity1값: {value_str}")
+                        except (ValueError, IndexError):
+                            print(f"  -> 无法解析Humidity1: {part}")
+            elif 'Temperature2:' in line and 'Humidity2:' in line:
+                # 处理可能的复合行 "Temperature2: 21.80 C, Humidity2: 23.40 %"
+                parts = line.split(', ')
+                for part in parts:
+                    part = part.strip()
+                    if part.startswith('Temperature2:'):
+                        try:
+                            value_str = part.split(':', 1)[1].strip().split(' ')[0]
+                            sensor_data[device_id]['temperature2'] = float(value_str)
+                            parsed_any_data = True
+                            print(f"  -> Temperature2값: {value_str}")
+                        except (ValueError, IndexError):
+                            print(f"  -> 无法解析Temperature2: {part}")
+                    elif part.startswith('Humidity2:'):
+                        try:
+                            value_str = part.split(':', 1)[1].strip().split(' ')[0]
+                            sensor_data[device_id]['humidity2'] = float(value_str)
+                            parsed_any_data = True
+                            print(f"  -> Humidity2값: {value_str}")
+                        except (ValueError, IndexError):
+                            print(f"  -> 无法解析Humidity2: {part}")
+            else:
+                # 处理单个值的行
+                if line.startswith('Temperature2:'):
+                    try:
+                        value_str = line.split(':', 1)[1].strip().split(' ')[0]
+                        sensor_data[device_id]['temperature2'] = float(value_str)
+                        parsed_any_data = True
+                        print(f"  -> Temperature2값: {value_str}")
+                    except (ValueError, IndexError):
+                        print(f"  -> 无法解析Temperature2: {line}")
+                elif line.startswith('Humidity2:'):
+                    try:
+                        value_str = line.split(':', 1)[1].strip().split(' ')[0]
+                        sensor_data[device_id]['humidity2'] = float(value_str)
+                        parsed_any_data = True
+                        print(f"  -> Humidity2값: {value_str}")
+                    except (ValueError, IndexError):
+                        print(f"  -> 无法解析Humidity2: {line}")
+                elif line.startswith('Temperature1:'):
+                    try:
+                        value_str = line.split(':', 1)[1].strip().split(' ')[0]
+                        sensor_data[device_id]['temperature1'] = float(value_str)
+                        parsed_any_data = True
+                        print(f"  -> Temperature1값: {value_str}")
+                    except (ValueError, IndexError):
+                        print(f"  -> 无法解析Temperature1: {line}")
+                elif line.startswith('Humidity1:'):
+                    try:
+                        value_str = line.split(':', 1)[1].strip().split(' ')[0]
+                        sensor_data[device_id]['humidity1'] = float(value_str)
+                        parsed_any_data = True
+                        print(f"  -> Humidity1값: {value_str}")
+                    except (ValueError, IndexError):
+                        print(f"  -> 无法解析Humidity1: {line}")
+                elif line.startswith('Relay Status:'):
+                    try:
+                        value_str = line.split(':', 1)[1].strip()
+                        sensor_data[device_id]['relay_status'] = int(value_str)
+                        parsed_any_data = True
+                        print(f"  -> Relay Status값: {value_str}")
+                    except (ValueError, IndexError):
+                        print(f"  -> 无法解析Relay Status: {line}")
+                elif line.startswith('PB8 Level:'):
+                    try:
+                        value_str = line.split(':', 1)[1].strip()
+                        sensor_data[device_id]['pb8_level'] = int(value_str)
+                        parsed_any_data = True
+                        print(f"  -> PB8 Level값: {value_str}")
+                    except (ValueError, IndexError):
+                        print(f"  -> 无法解析PB8 Level: {line}")
+        
+        # 只有在成功解析到数据时才更新时间戳和最后接收时间
+        if parsed_any_data:
+            sensor_data[device_id]['timestamp'] = datetime.now().isoformat()
+            last_data_received_time[device_id] = datetime.now()
+            print(f"✅ Updated sensor data for {device_id}: {sensor_data[device_id]}")
+        else:
+            print(f"⚠️ 未解析到任何数据来自: {payload_str[:100]}...")
+        
+    except Exception as e:
+        print(f"解析传感器数据时出错: {e}")
+        import traceback
+        traceback.print_exc()
+
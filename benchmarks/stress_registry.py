@@ -0,0 +1,127 @@
+"""
+设备注册表并发压力测试
+
+多个线程同时通过 Flask test client 执行接入（单帧与批量）、设备增删改和列表/详情查询，
+以及过期处理，结束后检查注册表、数据存储与各索引的一致性。
+出现异常、5xx 响应或不一致时以非零状态退出。
+运行: python benchmarks/stress_registry.py [秒数] [每类线程数]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+import batch_codec  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+DEVICE_RANGE = 200
+
+
+def worker(name, action, deadline, errors, counts):
+    client = backend.app.test_client()
+    rng = random.Random(name)
+    n = 0
+    while time.time() < deadline:
+        try:
+            status = action(client, rng)
+            if status >= 500:
+                errors.append(f"{name}: HTTP {status}")
+        except Exception as e:
+            errors.append(f"{name}: {type(e).__name__}: {e}")
+        n += 1
+    counts[name] = n
+
+
+def ingest(client, rng):
+    return client.post('/api/update-sensor-data', data=make_frame(rng.randrange(DEVICE_RANGE), rng)).status_code
+
+
+def ingest_batch(client, rng):
+    body = batch_codec.encode_length_prefixed([make_frame(rng.randrange(DEVICE_RANGE), rng) for _ in range(20)])
+    return client.post('/api/update-sensor-data/batch', data=body, content_type=batch_codec.LENGTH_PREFIXED).status_code
+
+
+def crud(client, rng):
+    device_id = f'stm32_{rng.randrange(DEVICE_RANGE)}'
+    op = rng.randrange(3)
+    if op == 0:
+        return client.post('/api/devices', json={'id': device_id, 'name': 'stress'}).status_code
+    if op == 1:
+        return client.put(f'/api/devices/{device_id}', json={'name': f'renamed-{rng.random()}'}).status_code
+    return client.delete(f'/api/devices/{device_id}').status_code
+
+
+def read(client, rng):
+    op = rng.randrange(4)
+    if op == 0:
+        response = client.get('/api/devices')
+        response.get_json()
+        return response.status_code
+    if op == 1:
+        return client.get(f'/api/devices?since={max(0, backend.device_versions.version - 50)}').status_code
+    if op == 2:
+        return client.get(f'/api/devices/stm32_{rng.randrange(DEVICE_RANGE)}').status_code
+    return client.get(f'/api/devices/stm32_{rng.randrange(DEVICE_RANGE)}/history').status_code
+
+
+def expire(client, rng):
+    backend.expire_device(f'stm32_{rng.randrange(DEVICE_RANGE)}', datetime.now())
+    time.sleep(0.001)
+    return 200
+
+
+def check_consistency():
+    problems = []
+    device_ids = set(backend.devices.snapshot())
+    store_ids = set(backend.sensor_data.keys())
+    if device_ids != store_ids:
+        problems.append(f"devices/sensor_data mismatch: {device_ids ^ store_ids}")
+    slots = list(backend.sensor_data._slots.values())
+    if len(slots) != len(set(slots)):
+        problems.append("duplicate sensor_data slots")
+    listed = {d['id'] for d in backend.app.test_client().get('/api/devices').get_json()}
+    if listed != device_ids:
+        problems.append(f"cached device list mismatch: {listed ^ device_ids}")
+    return problems
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    per_kind = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    actions = {'ingest': ingest, 'batch': ingest_batch, 'crud': crud, 'read': read, 'expire': expire}
+    errors, counts = [], {}
+    deadline = time.time() + seconds
+    threads = [
+        threading.Thread(target=worker, args=(f'{kind}-{i}', action, deadline, errors, counts))
+        for kind, action in actions.items() for i in range(per_kind)
+    ]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    totals = {}
+    for name, n in counts.items():
+        kind = name.rsplit('-', 1)[0]
+        totals[kind] = totals.get(kind, 0) + n
+    print("操作数: " + ", ".join(f"{kind}={n}" for kind, n in totals.items()))
+    problems = errors + check_consistency()
+    for problem in problems[:20]:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(f"❌ 发现 {len(problems)} 个问题")
+    print("✅ 无异常，注册表与数据存储一致")
+
+
+if __name__ == '__main__':
+    main()
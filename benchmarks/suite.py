@@ -0,0 +1,315 @@
+"""
+离线基准套件：解析、接入接口、设备列表和过期检查，结果保存为 JSON 并与基线对比
+
+全部在进程内运行（Flask 测试客户端），不需要 MQTT 代理或已启动的后端。
+每项取多次运行中的最好值以减少抖动；与基线相比变差超过容差时以非零状态退出。
+每组基准前后各运行一次固定的纯 Python 校准负载并记录在结果中；在不同机器或
+速度会漂移的共享主机上对比时，可用 --calibrate 按校准结果折算机器速度差异。
+
+运行:
+    python benchmarks/suite.py --save-baseline      # 记录本机基线
+    python benchmarks/suite.py                      # 与基线对比，退化时失败
+    python benchmarks/suite.py --quick              # 缩小规模，适合改动后快速检查
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import backend  # noqa: E402
+import batch_codec  # noqa: E402
+import expiry  # noqa: E402
+import history  # noqa: E402
+import sensor_parser  # noqa: E402
+from frames import make_frame  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+# 基线按规模分别保存: baseline-full.json / baseline-quick.json
+BASELINE_PATH = os.path.join(RESULTS_DIR, 'baseline-{config}.json')
+
+# 相对基线变差超过该比例视为性能退化
+DEFAULT_TOLERANCE = 0.25
+
+HIGHER = 'higher'   # 数值越大越好（吞吐）
+LOWER = 'lower'     # 数值越小越好（延迟）
+
+FULL = {'frames': 20000, 'requests': 2000, 'batch': 200, 'fleets': (100, 1000, 10000),
+        'list_requests': 50, 'expiring': 1000, 'repeat': 5}
+QUICK = {'frames': 3000, 'requests': 300, 'batch': 200, 'fleets': (100, 1000),
+         'list_requests': 10, 'expiring': 200, 'repeat': 3}
+
+
+def reset_backend():
+    """清空后端的所有内存状态"""
+    for store in (backend.devices, backend.sensor_data, backend.last_data_received_time):
+        store.clear()
+    backend.devices_by.clear()
+    backend.device_history = history.HistoryStore(capacity=backend.HISTORY_CAPACITY)
+    backend.expiration_wheel = expiry.ExpirationWheel(
+        backend.DATA_EXPIRATION_SECONDS, resolution=backend.EXPIRATION_CHECK_INTERVAL)
+    backend.device_responses._bodies = None
+    backend.device_responses._list_body = None
+
+
+def best_of(repeat, func):
+    """运行 repeat 次，返回最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(repeat=15):
+    """固定的纯 Python 负载 (dict/str/float 操作)，返回每秒执行的轮数"""
+    def work():
+        d = {}
+        for i in range(20000):
+            key = f'k{i % 500}'
+            d[key] = d.get(key, 0.0) + i * 0.5
+        return d
+    return 1 / best_of(repeat, work)
+
+
+def metric(value, unit, better):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def calibrated(bench):
+    """运行一组基准，把前后两次校准的平均值记在该组每个指标上"""
+    before = calibrate()
+    results = bench()
+    calibration = (before + calibrate()) / 2
+    for m in results.values():
+        m['calibration'] = calibration
+    return results
+
+
+def bench_parser(cfg, frames):
+    results = {}
+    elapsed = best_of(cfg['repeat'], lambda: [sensor_parser.parse_payload(f) for f in frames])
+    results['parser.parse_payload'] = metric(len(frames) / elapsed, 'frames/s', HIGHER)
+
+    def ingest():
+        reset_backend()
+        for frame in frames:
+            backend.parse_sensor_data(frame)
+    elapsed = best_of(cfg['repeat'], ingest)
+    results['parser.parse_sensor_data'] = metric(len(frames) / elapsed, 'frames/s', HIGHER)
+    return results
+
+
+def bench_ingest_endpoint(cfg, frames):
+    client = backend.app.test_client()
+    results = {}
+    single = frames[:cfg['requests']]
+
+    def post_single():
+        for frame in single:
+            client.post('/api/update-sensor-data', data=frame.encode('utf-8'))
+    reset_backend()
+    elapsed = best_of(cfg['repeat'], post_single)
+    results['ingest.update_sensor_data'] = metric(len(single) / elapsed, 'requests/s', HIGHER)
+
+    size = cfg['batch']
+    bodies = [batch_codec.encode_length_prefixed(frames[i:i + size]) for i in range(0, len(frames), size)]
+
+    def post_batches():
+        for body in bodies:
+            client.post('/api/update-sensor-data/batch', data=body,
+                        headers={'Content-Type': batch_codec.LENGTH_PREFIXED})
+    reset_backend()
+    elapsed = best_of(cfg['repeat'], post_batches)
+    results['ingest.batch'] = metric(len(frames) / elapsed, 'frames/s', HIGHER)
+    return results
+
+
+def bench_get_devices(cfg, rng):
+    """每个规模下测两种延迟：无变更（缓存命中）和每次请求前有一台设备变更"""
+    client = backend.app.test_client()
+    results = {}
+    for fleet in cfg['fleets']:
+        reset_backend()
+        for i in range(fleet):
+            backend.ingest_frame(make_frame(i, rng))
+        client.get('/api/devices')
+
+        cached, churned = [], []
+        for n in range(cfg['list_requests']):
+            start = time.perf_counter()
+            client.get('/api/devices')
+            cached.append(time.perf_counter() - start)
+
+            backend.ingest_frame(make_frame(n % fleet, rng))
+            start = time.perf_counter()
+            client.get('/api/devices')
+            churned.append(time.perf_counter() - start)
+        results[f'api.get_devices.cached[{fleet}]'] = metric(statistics.median(cached) * 1e3, 'ms', LOWER)
+        results[f'api.get_devices.changed[{fleet}]'] = metric(statistics.median(churned) * 1e3, 'ms', LOWER)
+    return results
+
+
+def bench_expiration(cfg, rng):
+    """过期检查：最大规模下空闲 tick 的耗时，以及每台到期设备的处理耗时"""
+    fleet = cfg['fleets'][-1]
+    expiring = min(cfg['expiring'], fleet)
+    reset_backend()
+    for i in range(fleet):
+        backend.ingest_frame(make_frame(i, rng))
+    base = time.time()
+    timeout = backend.DATA_EXPIRATION_SECONDS
+
+    wheel = backend.expiration_wheel
+    wheel.expire(base)
+    idle = best_of(cfg['repeat'], lambda: [wheel.expire(base) for _ in range(100)]) / 100
+
+    # 前 expiring 台设备在 base 后不再上报，其余设备 30 秒后继续上报；
+    # 超时后的一次 tick 只应处理这 expiring 台设备
+    firing = float('inf')
+    expired_at = datetime.fromtimestamp(base + timeout + 1)
+    for _ in range(cfg['repeat']):
+        wheel = backend.expiration_wheel = expiry.ExpirationWheel(
+            timeout, resolution=backend.EXPIRATION_CHECK_INTERVAL)
+        for i in range(fleet):
+            wheel.arm(f'stm32_{i}', base if i < expiring else base + 30)
+        wheel.expire(base)
+        start = time.perf_counter()
+        expired = wheel.expire(expired_at.timestamp())
+        for device_id in expired:
+            backend.expire_device(device_id, expired_at)
+        firing = min(firing, time.perf_counter() - start)
+        assert len(expired) == expiring, (len(expired), expiring)
+
+    return {
+        f'expiry.idle_tick[{fleet}]': metric(idle * 1e6, 'us', LOWER),
+        'expiry.per_expired_device': metric(firing / expiring * 1e6, 'us', LOWER),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'commit': commit,
+        'time': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def run(cfg, seed=42):
+    rng = random.Random(seed)
+    frames = [make_frame(rng.randint(1, 500), rng) for _ in range(cfg['frames'])]
+    results = {}
+    for name, bench in (('parser', lambda: bench_parser(cfg, frames)),
+                        ('ingest', lambda: bench_ingest_endpoint(cfg, frames)),
+                        ('get_devices', lambda: bench_get_devices(cfg, rng)),
+                        ('expiration', lambda: bench_expiration(cfg, rng))):
+        print(f"▶ {name} ...", flush=True)
+        results.update(calibrated(bench))
+    reset_backend()
+    return results
+
+
+def compare(results, baseline, tolerance, calibrate=False):
+    """
+    返回 [(名称, 基线值, 当前值, 变化比例, 是否退化)]，变化比例为正表示变好
+    calibrate 为真时按两次运行的校准速度比折算变化比例
+    """
+    rows = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None or not base['value']:
+            rows.append((name, None, current['value'], None, False))
+            continue
+        speedup = current['calibration'] / base['calibration'] if calibrate else 1.0
+        if current['better'] == HIGHER:
+            change = current['value'] / speedup / base['value'] - 1
+        else:
+            change = base['value'] / (current['value'] * speedup) - 1
+        rows.append((name, base['value'], current['value'], change, change < -tolerance))
+    return rows
+
+
+def print_results(results, rows=None):
+    if rows is None:
+        for name, m in results.items():
+            print(f"  {name:<36} {m['value']:>12.2f} {m['unit']}")
+        return
+    print(f"  {'指标':<34} {'基线':>12} {'本次':>12} {'变化':>8}")
+    for name, base, current, change, regressed in rows:
+        unit = results[name]['unit']
+        base_str = f"{base:>12.2f}" if base is not None else f"{'-':>12}"
+        change_str = f"{change:>+7.1%}" if change is not None else f"{'新增':>7}"
+        flag = ' ❌' if regressed else ''
+        print(f"  {name:<36} {base_str} {current:>12.2f} {change_str} {unit}{flag}")
+
+
+def save(path, cfg_name, results):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'config': cfg_name, 'environment': environment(), 'results': results},
+                  f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线性能基准套件')
+    parser.add_argument('--quick', action='store_true', help='缩小规模')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--baseline', default=None, help='基线文件路径，默认按规模区分')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='允许的退化比例，默认 0.25 (25%%)')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='按校准负载折算两次运行的机器速度差异后再比较')
+    args = parser.parse_args()
+
+    logging.getLogger('sensor').setLevel(logging.ERROR)
+    cfg_name = 'quick' if args.quick else 'full'
+    baseline_path = args.baseline or BASELINE_PATH.format(config=cfg_name)
+    results = run(QUICK if args.quick else FULL)
+
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    save(os.path.join(RESULTS_DIR, f'{stamp}-{cfg_name}.json'), cfg_name, results)
+
+    if args.save_baseline:
+        save(baseline_path, cfg_name, results)
+        print_results(results)
+        print(f"✅ 基线已保存: {baseline_path}")
+        return
+
+    if not os.path.exists(baseline_path):
+        print_results(results)
+        print(f"⚠️ 没有基线文件 {baseline_path}，使用 --save-baseline 记录")
+        return
+
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('config') != cfg_name:
+        sys.exit(f"❌ 基线规模为 {baseline.get('config')}，本次为 {cfg_name}，结果不可比")
+
+    rows = compare(results, baseline['results'], args.tolerance, args.calibrate)
+    print_results(results, rows)
+    regressed = [row[0] for row in rows if row[4]]
+    if regressed:
+        sys.exit(f"❌ 性能退化超过 {args.tolerance:.0%}: {', '.join(regressed)}")
+    print(f"✅ 与基线相比没有超过 {args.tolerance:.0%} 的退化")
+
+
+if __name__ == '__main__':
+    main()
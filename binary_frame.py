@@ -0,0 +1,146 @@
+"""
+STM32 二进制帧
+
+固定布局、小端，版本 1 共 24 字节（同样内容的文本帧约 120 字节）：
+    偏移  长度  内容
+    0     1     魔数 0xA5
+    1     1     版本号
+    2     1     字段位图，第 i 位表示 FIELDS 中第 i 个字段本帧有值
+    3     1     开关量，第 0 位 relay_status，第 1 位 pb8_level
+    4     4     设备编号 uint32，stm32/<编号> -> stm32_<编号>
+    8     16    temperature1, humidity1, temperature2, humidity2，各为 float32
+版本 2 共 28 字节，在设备编号之后插入 uint32 帧序号（用于去重和乱序检查，见 dedupe），其余不变。
+
+合法的 UTF-8 文本不会以 0xA5 开头，接入时按首字节区分二进制帧和文本帧，两种格式可以同时使用。
+float32 解码后按固件文本输出的精度保留 FLOAT_DIGITS 位小数，与文本帧得到的值一致。
+"""
+import struct
+import sys
+
+import sensor_parser
+from sensor_store import FIELDS, FLOAT_FIELDS, INT_FIELDS
+
+MAGIC = 0xA5
+VERSION = 1
+SEQUENCED_VERSION = 2
+FLOAT_DIGITS = 2
+
+DEVICE_PREFIX = 'stm32_'
+
+# 版本号 -> (帧结构, 解包结果中第一个浮点字段的位置)
+_FORMATS = {
+    VERSION: (struct.Struct('<BBBBI4f'), 5),
+    SEQUENCED_VERSION: (struct.Struct('<BBBBII4f'), 6),
+}
+FRAME_SIZE = _FORMATS[VERSION][0].size
+SEQUENCED_FRAME_SIZE = _FORMATS[SEQUENCED_VERSION][0].size
+
+_FIELD_BIT = {name: 1 << i for i, name in enumerate(FIELDS)}
+_LEVEL_BIT = {name: 1 << i for i, name in enumerate(INT_FIELDS)}
+
+# (版本号, 字段位图) -> ((浮点字段, 在解包结果中的位置), ...), ((开关量字段, 位), ...)
+_LAYOUTS = {}
+
+
+def _layout(version, present):
+    first = _FORMATS[version][1]
+    layout = _LAYOUTS[version, present] = (
+        tuple((name, first + i) for i, name in enumerate(FLOAT_FIELDS) if present & _FIELD_BIT[name]),
+        tuple((name, _LEVEL_BIT[name]) for name in INT_FIELDS if present & _FIELD_BIT[name]),
+    )
+    return layout
+
+
+def is_binary(payload):
+    return not isinstance(payload, str) and len(payload) > 0 and payload[0] == MAGIC
+
+
+def text_or_frame(payload):
+    """二进制帧原样返回，其余按 UTF-8 解码为文本"""
+    if isinstance(payload, str) or is_binary(payload):
+        return payload
+    return payload.decode('utf-8')
+
+
+def _format(payload):
+    """帧对应的帧结构，长度、魔数或版本号不对时返回 None"""
+    if len(payload) < 2 or payload[0] != MAGIC:
+        return None
+    fmt = _FORMATS.get(payload[1])
+    if fmt is None or len(payload) != fmt[0].size:
+        return None
+    return fmt[0]
+
+
+def device_id(payload):
+    """二进制帧中的设备ID，不是合法的帧时返回 None"""
+    if _format(payload) is None:
+        return None
+    return f"{DEVICE_PREFIX}{int.from_bytes(payload[4:8], 'little')}"
+
+
+def sequence(payload):
+    """版本 2 帧的序号，其他帧返回 None"""
+    if len(payload) != SEQUENCED_FRAME_SIZE or payload[0] != MAGIC or payload[1] != SEQUENCED_VERSION:
+        return None
+    return int.from_bytes(payload[8:12], 'little')
+
+
+def decode(payload, errors=None):
+    """
+    解析一帧二进制数据，返回 (device_id, updates)，约定与 sensor_parser.parse_payload 相同
+    长度、魔数或版本号不对时返回 (None, None)
+    """
+    frame = _format(payload)
+    if frame is None:
+        return None, None
+    values = frame.unpack(payload)
+    version, present = values[1], values[2]
+    layout = _LAYOUTS.get((version, present)) or _layout(version, present)
+    levels = values[3]
+    updates = {name: round(values[index], FLOAT_DIGITS) for name, index in layout[0]}
+    for name, bit in layout[1]:
+        updates[name] = 1 if levels & bit else 0
+    return f"{DEVICE_PREFIX}{values[4]}", updates
+
+
+def encode(device_no, updates, seq=None):
+    """
+    按 {sensor_data 键: 值} 生成二进制帧，给出 seq 时生成带序号的版本 2 帧
+    开关量只能是 0 或 1，否则抛出 ValueError
+    """
+    present = levels = 0
+    floats = []
+    for name in FLOAT_FIELDS:
+        value = updates.get(name)
+        if value is not None:
+            present |= _FIELD_BIT[name]
+        floats.append(0.0 if value is None else value)
+    for name in INT_FIELDS:
+        value = updates.get(name)
+        if value is None:
+            continue
+        if value not in (0, 1):
+            raise ValueError(f"{name} must be 0 or 1 in a binary frame, got {value!r}")
+        present |= _FIELD_BIT[name]
+        if value:
+            levels |= _LEVEL_BIT[name]
+    if seq is None:
+        return _FORMATS[VERSION][0].pack(MAGIC, VERSION, present, levels, device_no, *floats)
+    return _FORMATS[SEQUENCED_VERSION][0].pack(MAGIC, SEQUENCED_VERSION, present, levels, device_no, seq, *floats)
+
+
+def from_text(payload_str):
+    """
+    把一帧文本转换为二进制帧，设备ID须为 stm32_<编号>，否则抛出 ValueError
+    文本中有 "Seq: <n>" 行时生成带序号的版本 2 帧
+    """
+    device, updates = sensor_parser.parse_payload(payload_str)
+    if device is None or not device.startswith(DEVICE_PREFIX) or not device[len(DEVICE_PREFIX):].isdigit():
+        raise ValueError(f"cannot convert frame for device {device!r}")
+    return encode(int(device[len(DEVICE_PREFIX):]), updates, sensor_parser.peek_sequence(payload_str))
+
+
+if __name__ == '__main__':
+    # 转换工具: 从标准输入读取一帧文本，输出二进制帧的十六进制，便于核对固件输出
+    print(from_text(sys.stdin.read()).hex(' '))
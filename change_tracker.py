@@ -0,0 +1,80 @@
+"""
+设备变更版本号
+
+全局版本号单调递增，每次设备变更时分配一个新版本号给该设备。
+按版本顺序维护设备列表，查询某版本之后的变更只需从尾部向前遍历变更过的设备。
+已删除的设备保留有限数量的删除记录，超出后更早的增量查询需要全量返回。
+"""
+import threading
+from collections import OrderedDict
+
+
+class ChangeTracker:
+
+    def __init__(self, max_tombstones=10000):
+        self.max_tombstones = max_tombstones
+        self.version = 0
+        # 低于该版本的增量查询不完整（删除记录已被淘汰），需要返回全量
+        self.floor = 0
+        self._versions = OrderedDict()
+        self._removed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, device_id):
+        return self._versions.get(device_id, 0)
+
+    def touch(self, device_id):
+        """设备发生变更，返回新版本号"""
+        with self._lock:
+            self.version += 1
+            self._versions[device_id] = self.version
+            self._versions.move_to_end(device_id)
+            self._removed.pop(device_id, None)
+            return self.version
+
+    def touch_many(self, device_ids):
+        """一批设备同时变更（如启动时恢复），按顺序各分配一个版本号"""
+        with self._lock:
+            start = self.version
+            if not self._versions and not self._removed:
+                # 首次装入时可以直接按顺序整体插入
+                self._versions.update(zip(device_ids, range(start + 1, start + len(device_ids) + 1)))
+                self.version = start + len(device_ids)
+                return self.version
+            for offset, device_id in enumerate(device_ids, 1):
+                self._versions[device_id] = start + offset
+                self._versions.move_to_end(device_id)
+                self._removed.pop(device_id, None)
+            self.version = start + len(device_ids)
+            return self.version
+
+    def remove(self, device_id):
+        """设备被删除，记录删除版本号"""
+        with self._lock:
+            self.version += 1
+            self._versions.pop(device_id, None)
+            self._removed[device_id] = self.version
+            if len(self._removed) > self.max_tombstones:
+                _, dropped_version = self._removed.popitem(last=False)
+                self.floor = dropped_version
+            return self.version
+
+    def changed_since(self, since):
+        """
+        返回 (当前版本, 变更的设备ID, 删除的设备ID, 是否完整)
+        不完整时调用方应返回全量数据
+        """
+        with self._lock:
+            if since < self.floor:
+                return self.version, None, None, False
+            changed = []
+            for device_id in reversed(self._versions):
+                if self._versions[device_id] <= since:
+                    break
+                changed.append(device_id)
+            removed = []
+            for device_id in reversed(self._removed):
+                if self._removed[device_id] <= since:
+                    break
+                removed.append(device_id)
+            return self.version, changed[::-1], removed[::-1], True
@@ -0,0 +1,351 @@
+"""
+下行控制命令
+
+后端保持一个常驻的 paho 客户端，命令经发送队列以 QoS 1 发布，最多 window 条同时等待 PUBACK（流水线），
+不必逐条等待确认，向上万台设备下发同一命令只需数秒。
+每条命令的状态:
+    queued     已入队，尚未发布
+    published  已交给 paho，等待 PUBACK
+    acked      代理已确认 (PUBACK)
+    confirmed  设备随后上报的数据中该字段已是目标值
+    superseded 同一设备在确认之前又收到了新命令
+    failed     发布失败
+    expired    timeout 秒内没有确认
+命令发布之后，设备上报的每一帧都由 observe() 检查，字段值与目标一致即为 confirmed，PUBACK 可能晚于确认到达。
+"""
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from app_logging import RateLimitedLog, get_logger
+from sensor_store import format_timestamp
+
+logger = get_logger('commands')
+_publish_log = RateLimitedLog(logger)
+
+# 可以下发的字段及取值
+COMMAND_FIELDS = {'relay_status': (0, 1)}
+
+# 命令主题模板: {device_id} 为设备ID，{topic} 为设备ID中第一个 _ 换成 /（stm32_1 -> stm32/1）
+DEFAULT_TOPIC = '{topic}/cmd'
+DEFAULT_WINDOW = 1000
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_HISTORY = 100000
+
+STATUSES = ('queued', 'published', 'acked', 'confirmed', 'superseded', 'failed', 'expired')
+FINISHED = frozenset(('confirmed', 'superseded', 'failed', 'expired'))
+
+_STOP = object()
+
+
+def validate(values):
+    """校验命令内容 {字段: 目标值}，返回规范化的 dict；不合法时抛出 ValueError"""
+    if not isinstance(values, dict) or not values:
+        raise ValueError(f"command must set at least one of {', '.join(COMMAND_FIELDS)}")
+    result = {}
+    for field, value in values.items():
+        allowed = COMMAND_FIELDS.get(field)
+        if allowed is None:
+            raise ValueError(f"field must be one of {', '.join(COMMAND_FIELDS)}")
+        if isinstance(value, bool) or value not in allowed:
+            raise ValueError(f"{field} must be one of {', '.join(map(str, allowed))}")
+        result[field] = value
+    return result
+
+
+class Command:
+    __slots__ = ('id', 'device_id', 'values', 'batch', 'status', 'created_at', 'published_at',
+                 'acked_at', 'confirmed_at', 'mid', 'error')
+
+    def __init__(self, device_id, values, batch=None):
+        self.id = uuid.uuid4().hex
+        self.device_id = device_id
+        self.values = values
+        self.batch = batch
+        self.status = 'queued'
+        self.created_at = time.time()
+        self.published_at = self.acked_at = self.confirmed_at = None
+        self.mid = None
+        self.error = None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'values': self.values,
+            'batch': self.batch,
+            'status': self.status,
+            'created_time': format_timestamp(self.created_at),
+            'published_time': format_timestamp(self.published_at) if self.published_at else None,
+            'acked_time': format_timestamp(self.acked_at) if self.acked_at else None,
+            'confirmed_time': format_timestamp(self.confirmed_at) if self.confirmed_at else None,
+            'error': self.error,
+        }
+
+
+class CommandDispatcher:
+    """常驻 MQTT 客户端 + 发送线程 + 在途窗口"""
+
+    def __init__(self, mqtt_config, topic=DEFAULT_TOPIC, window=DEFAULT_WINDOW, timeout=DEFAULT_TIMEOUT,
+                 qos=1, history=DEFAULT_HISTORY, client_factory=None, on_status=None):
+        """
+        client_factory: 创建 paho 客户端的函数，测试时可替换为假客户端
+        on_status(command, previous): 命令状态变化时调用（指标）
+        """
+        self.mqtt_config = mqtt_config
+        self.topic = topic
+        self.window = window
+        self.timeout = timeout
+        self.qos = qos
+        self.history = history
+        self.client_factory = client_factory or mqtt.Client
+        self.on_status = on_status
+        self.client = None
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(window)
+        self._lock = threading.Lock()
+        self._commands = {}     # 命令ID -> Command，按创建顺序，超过 history 时淘汰最早的已结束命令
+        self._by_mid = {}       # paho 消息ID -> 等待 PUBACK 的命令
+        self._early_acks = set()  # 发送线程登记消息ID之前就到达的 PUBACK
+        self._abandoned = set()   # 超时后不再等待 PUBACK 的消息ID，迟到的 PUBACK 忽略
+        self._awaiting = {}     # 设备ID -> 已发布、等待设备确认的命令
+        self._deadlines = deque()  # (截止时间, 命令)，超时时长相同，按入队顺序即按截止时间
+        self._batches = itertools.count(1)
+        self._threads = []
+        self._stopping = threading.Event()
+
+    # ---- 客户端 ----
+
+    def _create_client(self):
+        config = self.mqtt_config
+        client = self.client_factory(client_id=f"backend_commands_{uuid.uuid4().hex[:8]}")
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_publish = self._on_publish
+        # paho 默认只允许 20 条在途消息，放开到与窗口一致，发送线程自己限制在途数量
+        client.max_inflight_messages_set(self.window)
+        client.max_queued_messages_set(0)
+        if config.get('username') and config.get('password'):
+            client.username_pw_set(config['username'], config['password'])
+        if config.get('use_tls', False):
+            client.tls_set(
+                ca_certs=config.get('ca_certs'),
+                certfile=config.get('certfile'),
+                keyfile=config.get('keyfile')
+            )
+        return client
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            logger.info("✅ 命令通道连接成功")
+        else:
+            logger.error("❌ 命令通道连接失败，错误代码: %s", rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        if rc != 0:
+            logger.warning("⚠️ 命令通道意外断开连接，等待自动重连（在途命令由 paho 重发）")
+
+    def start(self):
+        self.client = self._create_client()
+        config = self.mqtt_config
+        logger.info("🔌 命令通道正在连接到 %s:%s (在途窗口 %s)", config['server'], config['port'], self.window)
+        self.client.connect_async(config['server'], config['port'], keepalive=config.get('keepalive', 60))
+        self.client.loop_start()
+        for target, name in ((self._run, 'command-sender'), (self._expire_loop, 'command-expiry')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.client is not None:
+            self.client.disconnect()
+            self.client.loop_stop()
+
+    # ---- 提交 ----
+
+    def submit(self, device_ids, values, bulk=False):
+        """为每台设备创建一条命令并入队，values 需先经 validate；返回 (批次号, 命令列表)，bulk 为 False 时批次号为 None"""
+        batch = next(self._batches) if bulk else None
+        commands = [Command(device_id, values, batch) for device_id in device_ids]
+        with self._lock:
+            for command in commands:
+                self._commands[command.id] = command
+            self._trim()
+        for command in commands:
+            self._changed(command, None)
+            self._queue.put(command)
+        return batch, commands
+
+    def _trim(self):
+        """需持有锁：超过 history 时按创建顺序淘汰已结束的命令"""
+        excess = len(self._commands) - self.history
+        if excess <= 0:
+            return
+        for command_id in [c.id for c in itertools.islice(self._commands.values(), excess * 2)
+                           if c.status in FINISHED][:excess]:
+            del self._commands[command_id]
+
+    # ---- 发送 ----
+
+    def _run(self):
+        topic, qos, slots = self.topic, self.qos, self._slots
+        while True:
+            command = self._queue.get()
+            if command is _STOP:
+                return
+            if command.status != 'queued':
+                continue
+            # 在途窗口已满时等待 PUBACK 或超时释放名额
+            while not slots.acquire(timeout=0.5):
+                if self._stopping.is_set():
+                    return
+            device_id = command.device_id
+            payload = json.dumps({'id': command.id, **command.values})
+            with self._lock:
+                # 同一设备只保留最新的一条等待确认的命令
+                previous = self._awaiting.get(device_id)
+                if previous is not None and previous.status not in FINISHED:
+                    self._set(previous, 'superseded')
+                command.published_at = time.time()
+                self._set(command, 'published')
+                self._awaiting[device_id] = command
+            # publish 时不能持有锁: paho 在持有自己的发送锁时回调 on_publish
+            rc, mid = self.client.publish(
+                topic.format(device_id=device_id, topic=device_id.replace('_', '/', 1)), payload, qos=qos)
+            with self._lock:
+                # 未连接时 paho 仍保留 QoS>0 的消息，重连后发送
+                if rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                    command.error = mqtt.error_string(rc)
+                    if self._awaiting.get(device_id) is command:
+                        del self._awaiting[device_id]
+                    if command.status not in FINISHED:
+                        self._set(command, 'failed')
+                    slots.release()
+                    _publish_log.error('publish', "❌ 命令发布失败: %s %s", device_id, command.error)
+                    continue
+                self._deadlines.append((time.monotonic() + self.timeout, command))
+                # PUBACK 可能在 publish 返回之后、这里加锁之前到达
+                if mid in self._early_acks:
+                    self._early_acks.discard(mid)
+                    self._acked(command)
+                else:
+                    command.mid = mid
+                    self._by_mid[mid] = command
+
+    def _on_publish(self, client, userdata, mid):
+        # 运行在 paho 网络线程中；QoS 1 时在收到 PUBACK 后调用
+        with self._lock:
+            command = self._by_mid.pop(mid, None)
+            if command is not None:
+                self._acked(command)
+            elif mid in self._abandoned:
+                self._abandoned.discard(mid)
+            else:
+                self._early_acks.add(mid)
+
+    def _acked(self, command):
+        """需持有锁"""
+        self._slots.release()
+        command.mid = None
+        command.acked_at = time.time()
+        if command.status == 'published':
+            self._set(command, 'acked')
+
+    # ---- 确认与超时 ----
+
+    def observe(self, device_id, updates):
+        """设备上报一帧数据（接入路径调用），字段值与等待中的命令一致时确认"""
+        command = self._awaiting.get(device_id)
+        if command is None:
+            return
+        values = command.values
+        for field, value in values.items():
+            if updates.get(field, value) != value:
+                return
+        if not any(field in updates for field in values):
+            return
+        with self._lock:
+            if self._awaiting.get(device_id) is not command or command.status in FINISHED:
+                return
+            del self._awaiting[device_id]
+            command.confirmed_at = time.time()
+            self._set(command, 'confirmed')
+
+    def _expire_loop(self):
+        while not self._stopping.wait(1):
+            self.expire(time.monotonic())
+
+    def expire(self, now):
+        """处理超时的命令，返回本次超时的命令数"""
+        expired = 0
+        with self._lock:
+            deadlines = self._deadlines
+            while deadlines and deadlines[0][0] <= now:
+                _, command = deadlines.popleft()
+                if command.mid is not None:
+                    # 迟迟没有 PUBACK（已确认或被取代的命令也一样），释放在途名额
+                    del self._by_mid[command.mid]
+                    self._abandoned.add(command.mid)
+                    command.mid = None
+                    self._slots.release()
+                if command.status in FINISHED:
+                    continue
+                if self._awaiting.get(command.device_id) is command:
+                    del self._awaiting[command.device_id]
+                self._set(command, 'expired')
+                expired += 1
+        return expired
+
+    def _set(self, command, status):
+        previous, command.status = command.status, status
+        self._changed(command, previous)
+
+    def _changed(self, command, previous):
+        if self.on_status is not None:
+            self.on_status(command, previous)
+
+    # ---- 查询 ----
+
+    def get(self, command_id):
+        command = self._commands.get(command_id)
+        return command.to_dict() if command is not None else None
+
+    def batch_summary(self, batch):
+        """批次中各状态的命令数，批次不存在（或已全部淘汰）时返回 None"""
+        with self._lock:
+            statuses = [c.status for c in self._commands.values() if c.batch == batch]
+        if not statuses:
+            return None
+        counts = dict.fromkeys(STATUSES, 0)
+        for status in statuses:
+            counts[status] += 1
+        return {'batch': batch, 'total': len(statuses), 'statuses': counts}
+
+    def inflight(self):
+        """已发布、尚未收到 PUBACK 的命令数"""
+        return len(self._by_mid)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+def add_arguments(parser):
+    """backend.py 和 server.py 共用的命令行参数"""
+    parser.add_argument('--commands', action='store_true',
+                        help='开启下行控制命令 (POST /api/devices/<id>/commands)，使用 config.MQTT_CONFIG 连接代理')
+    parser.add_argument('--command-window', type=int, default=DEFAULT_WINDOW,
+                        help=f'同时等待 PUBACK 的命令数上限，默认 {DEFAULT_WINDOW}')
+    parser.add_argument('--command-timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help=f'命令发布后等待设备确认的时间（秒），默认 {DEFAULT_TIMEOUT}')
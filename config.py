@@ -30,5 +30,17 @@ SUB_TOPICS = [
     'pc/1',
 ]
 
+# 主题路由: MQTT 订阅过滤器 (支持 + 和 #) -> 解码器和设备ID，见 topic_router.py
+# decoder 为 sensor_parser.DECODERS 中的名称 (stm32_text / json)
+# device 为设备ID模板，{0}、{1}... 为主题的各层，省略时为主题中的 / 换成 _ (stm32/1 -> stm32_1)
+# 没有匹配的主题仍从载荷首行提取设备ID
+TOPIC_ROUTES = [
+    {'filter': 'stm32/+', 'decoder': 'stm32_text'},
+]
+
 # 发布主题配置
-PUB_TOPIC = 'pc/1'
\ No newline at end of file
+PUB_TOPIC = 'pc/1'
+
+# 下行控制命令主题 (--commands)，{device_id} 为设备ID，{topic} 为设备ID中第一个 _ 换成 / (stm32_1 -> stm32/1)
+# 载荷为 JSON，如 {"id": "<命令ID>", "relay_status": 1}
+COMMAND_TOPIC = '{topic}/cmd'
\ No newline at end of file
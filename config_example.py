@@ -32,9 +32,21 @@ SUB_TOPICS = [
     'sensor/status',
 ]
 
+# 主题路由: MQTT 订阅过滤器 (支持 + 和 #) -> 解码器和设备ID，见 topic_router.py
+# decoder 为 sensor_parser.DECODERS 中的名称 (stm32_text / json)
+# device 为设备ID模板，{0}、{1}... 为主题的各层，省略时为主题中的 / 换成 _
+TOPIC_ROUTES = [
+    {'filter': 'stm32/+', 'decoder': 'stm32_text'},
+    {'filter': 'sensor/+/json', 'decoder': 'json', 'device': 'sensor_{1}'},
+]
+
 # 发布主题配置
 PUB_TOPIC = 'test/python_client'
 
+# 下行控制命令主题 (--commands)，{device_id} 为设备ID，{topic} 为设备ID中第一个 _ 换成 / (stm32_1 -> stm32/1)
+# 载荷为 JSON，如 {"id": "<命令ID>", "relay_status": 1}
+COMMAND_TOPIC = '{topic}/cmd'
+
 """
 常见问题排查:
 
@@ -0,0 +1,109 @@
+"""
+重复帧和乱序帧过滤
+
+QoS 1 下代理可能重复投递，固件重连后也会重发。帧在解析之前按设备检查，被丢弃的帧不再解析：
+- 带序号的帧（文本帧的 "Seq: <n>" 行、二进制帧版本 2）：与该设备已接受的最大序号相同为 duplicate，
+  更小为 stale（乱序到达的旧帧，不能覆盖更新的读数）。序号按 32 位回绕比较，
+  比最大序号小 RESET_GAP 以上时视为设备重启后重新计数，照常接受。
+- 不带序号的帧：与该设备最近 window_frames 帧中 window_seconds 秒以内的某一帧内容完全相同时为 duplicate。
+  窗口应短于设备的上报间隔，否则读数没有变化的正常帧也会被当作重复帧丢弃。
+不带序号的帧无法判断先后，只做去重。
+"""
+import threading
+import time
+from collections import deque
+
+import binary_frame
+import sensor_parser
+
+DEFAULT_WINDOW_SECONDS = 1.0
+DEFAULT_WINDOW_FRAMES = 8
+
+# 序号比已接受的最大序号小这么多以上时，视为设备重启
+RESET_GAP = 1000
+
+_SEQ_MOD = 1 << 32
+
+DUPLICATE = 'duplicate'
+STALE = 'stale'
+
+
+def frame_sequence(payload):
+    """帧携带的序号，没有时返回 None"""
+    if isinstance(payload, str):
+        return sensor_parser.peek_sequence(payload)
+    return binary_frame.sequence(payload)
+
+
+class _Window:
+    """单台设备的去重状态"""
+    __slots__ = ('last_seq', 'recent')
+
+    def __init__(self):
+        self.last_seq = None
+        self.recent = None
+
+
+class FrameFilter:
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS, window_frames=DEFAULT_WINDOW_FRAMES):
+        self.window_seconds = window_seconds
+        self.window_frames = window_frames
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def check(self, device_id, payload, now=None):
+        """检查一帧，接受时返回 None 并记入窗口，否则返回丢弃原因 DUPLICATE / STALE"""
+        seq = frame_sequence(payload)
+        with self._lock:
+            window = self._devices.get(device_id)
+            if window is None:
+                window = self._devices[device_id] = _Window()
+            if seq is not None:
+                return self._check_sequence(window, seq)
+            if now is None:
+                now = time.monotonic()
+            return self._check_content(window, hash(payload), now)
+
+    @staticmethod
+    def _check_sequence(window, seq):
+        last = window.last_seq
+        if last is not None:
+            ahead = (seq - last) % _SEQ_MOD
+            if ahead == 0:
+                return DUPLICATE
+            behind = _SEQ_MOD - ahead
+            if ahead > _SEQ_MOD // 2 and behind <= RESET_GAP:
+                return STALE
+        window.last_seq = seq
+        return None
+
+    def _check_content(self, window, digest, now):
+        recent = window.recent
+        if recent is None:
+            recent = window.recent = deque(maxlen=self.window_frames)
+        horizon = now - self.window_seconds
+        for seen, at in recent:
+            if seen == digest and at >= horizon:
+                return DUPLICATE
+        recent.append((digest, now))
+        return None
+
+    def forget(self, device_id):
+        """设备被删除"""
+        with self._lock:
+            self._devices.pop(device_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+
+
+def add_arguments(parser):
+    """backend.py 和 server.py 共用的命令行参数"""
+    parser.add_argument('--dedupe', action='store_true',
+                        help='解析前丢弃重复帧和序号更旧的乱序帧')
+    parser.add_argument('--dedupe-window', type=float, default=DEFAULT_WINDOW_SECONDS,
+                        help=f'不带序号的帧按内容去重的时间窗口（秒），应短于上报间隔，默认 {DEFAULT_WINDOW_SECONDS}')
+    parser.add_argument('--dedupe-frames', type=int, default=DEFAULT_WINDOW_FRAMES,
+                        help=f'不带序号的帧按内容去重时每台设备记住的帧数，默认 {DEFAULT_WINDOW_FRAMES}')
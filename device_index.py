@@ -0,0 +1,151 @@
+"""
+设备列表的二级索引
+
+按楼宇、楼层、房间、状态、协议维护 取值 -> 设备ID集合，筛选时从最小的候选集合出发，
+逐个核对其余条件，开销与匹配的设备数有关，与设备总数无关。
+分页按设备ID排序，游标为上一页最后一个设备ID；每个候选集合排好序的结果缓存到集合变化为止。
+
+从快照批量恢复的设备元数据是延迟解码的，恢复后索引只标记为过期，
+第一次筛选时再从注册表整体重建。
+"""
+import bisect
+import threading
+
+# 可筛选的字段，顺序即每台设备索引键的顺序
+FIELDS = ('building', 'floor', 'room', 'status', 'protocol')
+_LOCATION_FIELDS = ('building', 'floor', 'room')
+
+
+def _normalize(value):
+    # 查询参数都是字符串，索引键统一转成字符串比较
+    return None if value is None else str(value)
+
+
+def device_keys(device):
+    """设备在各筛选字段上的取值"""
+    location = device.location if isinstance(device.location, dict) else {}
+    return (*(_normalize(location.get(name)) for name in _LOCATION_FIELDS),
+            _normalize(device.status), _normalize(device.protocol))
+
+
+class DeviceIndex:
+
+    def __init__(self):
+        self._keys = {}
+        self._postings = {name: {} for name in FIELDS}
+        # (字段序号, 取值) -> 排好序的设备ID列表；None 表示全部设备
+        self._sorted = {}
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def invalidate(self):
+        """设备被整批装入或替换，下次查询时从注册表重建"""
+        with self._lock:
+            self._stale = True
+
+    def rebuild(self, devices):
+        """devices: 可迭代的 Device"""
+        with self._lock:
+            self._clear()
+            for device in devices:
+                self._set(device.id, device_keys(device))
+            self._stale = False
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self._stale = False
+
+    def _clear(self):
+        self._keys.clear()
+        for postings in self._postings.values():
+            postings.clear()
+        self._sorted.clear()
+
+    def update(self, device):
+        """设备新增或筛选字段可能变化后调用，调用方持有该设备的分片锁"""
+        with self._lock:
+            if self._stale:
+                return
+            # 在锁内读取设备的当前取值，先读到旧值的并发调用不会覆盖后来的更新
+            keys = device_keys(device)
+            if self._keys.get(device.id) != keys:
+                self._set(device.id, keys)
+
+    def remove(self, device_id):
+        with self._lock:
+            if self._stale:
+                return
+            old = self._keys.pop(device_id, None)
+            if old is not None:
+                self._unlink(device_id, old)
+                self._sorted.pop(None, None)
+
+    def _set(self, device_id, keys):
+        """需持有锁"""
+        old = self._keys.get(device_id)
+        if old is None:
+            self._sorted.pop(None, None)
+        else:
+            self._unlink(device_id, old)
+        self._keys[device_id] = keys
+        for i, (postings, value) in enumerate(zip(self._postings.values(), keys)):
+            postings.setdefault(value, set()).add(device_id)
+            self._sorted.pop((i, value), None)
+
+    def _unlink(self, device_id, keys):
+        """需持有锁"""
+        for i, (postings, value) in enumerate(zip(self._postings.values(), keys)):
+            members = postings.get(value)
+            if members is not None:
+                members.discard(device_id)
+                if not members:
+                    del postings[value]
+            self._sorted.pop((i, value), None)
+
+    def _ordered(self, key):
+        """需持有锁"""
+        ordered = self._sorted.get(key)
+        if ordered is None:
+            if key is None:
+                ordered = sorted(self._keys)
+            else:
+                field, value = key
+                ordered = sorted(self._postings[FIELDS[field]].get(value, ()))
+            self._sorted[key] = ordered
+        return ordered
+
+    def query(self, filters, cursor=None, limit=None, devices=None):
+        """
+        filters: {字段: 取值}，字段取自 FIELDS
+        返回 (按设备ID排序的匹配设备ID, 下一页游标或 None)
+        索引过期时先用 devices() 返回的 Device 重建
+        """
+        if self._stale and devices is not None:
+            self.rebuild(devices())
+        with self._lock:
+            conditions = [(FIELDS.index(name), _normalize(value)) for name, value in filters.items()]
+            if conditions:
+                # 从最小的候选集合出发
+                smallest = min(conditions, key=lambda c: len(self._postings[FIELDS[c[0]]].get(c[1], ())))
+                ordered = self._ordered(smallest)
+            else:
+                ordered = self._ordered(None)
+            keys = self._keys
+
+        start = bisect.bisect_right(ordered, cursor) if cursor is not None else 0
+        matched = []
+        for position in range(start, len(ordered)):
+            device_id = ordered[position]
+            # 取得候选列表之后设备可能已变化，所有条件都重新核对
+            values = keys.get(device_id)
+            if values is None:
+                continue
+            if all(values[i] == value for i, value in conditions):
+                if limit is not None and len(matched) == limit:
+                    return matched, matched[-1]
+                matched.append(device_id)
+        return matched, None
@@ -0,0 +1,95 @@
+"""
+设备数据过期调度
+
+哈希时间轮：每个设备按过期时间落在一个槽中，收到数据时把设备移到新的槽，
+检查线程每次只查看到期的槽，开销只与实际到期的设备数有关，与设备总数无关。
+设备过期只触发一次，再次收到数据后重新计时。
+"""
+import math
+import threading
+
+import numpy as np
+
+
+class ExpirationWheel:
+    """按秒分槽的过期时间轮，时间均为秒级时间戳"""
+
+    def __init__(self, timeout, resolution=1.0):
+        self.timeout = timeout
+        self.resolution = resolution
+        # 槽数覆盖整个超时时间，保证过期时间不会绕回到已处理的槽
+        self._slots = [set() for _ in range(int(math.ceil(timeout / resolution)) + 2)]
+        self._deadline = {}
+        self._slot_of = {}
+        self._cursor = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._deadline)
+
+    def __contains__(self, device_id):
+        return device_id in self._deadline
+
+    def arm(self, device_id, now):
+        """设备收到数据，过期时间重置为 now + timeout"""
+        deadline = now + self.timeout
+        slot = int(deadline // self.resolution) % len(self._slots)
+        with self._lock:
+            self._deadline[device_id] = deadline
+            old = self._slot_of.get(device_id)
+            if old != slot:
+                if old is not None:
+                    self._slots[old].discard(device_id)
+                self._slots[slot].add(device_id)
+                self._slot_of[device_id] = slot
+
+    def arm_many(self, device_ids, times):
+        """批量调用 arm（如启动时恢复大量设备），device_ids 与 times 一一对应"""
+        if not device_ids:
+            return
+        deadlines = np.asarray(times, dtype=np.float64) + self.timeout
+        slots = (deadlines // self.resolution).astype(np.int64) % len(self._slots)
+        # 按槽分组后整组加入集合
+        order = np.argsort(slots, kind='stable')
+        sorted_ids = np.asarray(device_ids, dtype=object)[order]
+        sorted_slots = slots[order]
+        bounds = np.flatnonzero(np.diff(sorted_slots)) + 1
+        starts = [0, *bounds.tolist()]
+        ends = [*bounds.tolist(), len(sorted_ids)]
+        with self._lock:
+            for device_id in [d for d in device_ids if d in self._slot_of]:
+                self._slots[self._slot_of[device_id]].discard(device_id)
+            self._deadline.update(zip(device_ids, deadlines.tolist()))
+            self._slot_of.update(zip(device_ids, slots.tolist()))
+            for start, end in zip(starts, ends):
+                self._slots[int(sorted_slots[start])].update(sorted_ids[start:end].tolist())
+
+    def cancel(self, device_id):
+        """设备被删除，取消过期调度"""
+        with self._lock:
+            slot = self._slot_of.pop(device_id, None)
+            if slot is not None:
+                self._slots[slot].discard(device_id)
+            self._deadline.pop(device_id, None)
+
+    def expire(self, now):
+        """返回在 now 之前已过期的设备，并将其移出时间轮"""
+        target = int(now // self.resolution)
+        expired = []
+        with self._lock:
+            # 首次检查或长时间未检查时最多把所有槽各看一遍
+            cursor = target - len(self._slots) + 1
+            if self._cursor is not None:
+                cursor = max(cursor, self._cursor)
+            for tick in range(cursor, target + 1):
+                slot = self._slots[tick % len(self._slots)]
+                if not slot:
+                    continue
+                for device_id in [d for d in slot if self._deadline[d] < now]:
+                    slot.discard(device_id)
+                    del self._slot_of[device_id]
+                    del self._deadline[device_id]
+                    expired.append(device_id)
+            # 当前槽内可能还有本秒稍后才到期的设备，下次从当前槽继续
+            self._cursor = target
+        return expired
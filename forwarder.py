@@ -0,0 +1,190 @@
+"""
+MQTT -> 后端 HTTP 的非阻塞转发管道
+
+on_message 只负责把载荷放入有界队列，由工作线程按数量或时间攒批，
+通过共享的 keep-alive requests.Session 发送到后端批量接口。
+每个工作线程有自己的队列，同一主题（同一设备）的消息总是进入同一个队列，
+按到达顺序发送，不会因为两批并发请求而让旧读数覆盖新读数。
+队列满时按策略处理，MQTT 网络循环不会因 HTTP 阻塞。
+"""
+import queue
+import threading
+import time
+import zlib
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import binary_frame
+import metrics
+import sensor_parser
+from app_logging import RateLimitedLog, get_logger
+from batch_codec import LENGTH_PREFIXED, encode_length_prefixed
+
+logger = get_logger('forwarder')
+_send_log = RateLimitedLog(logger)
+
+# 每批转发到后端的耗时，按结果 (ok/status/error) 区分
+FORWARD_SECONDS = metrics.REGISTRY.histogram(
+    'forwarder_batch_duration_seconds', '一批消息转发到后端的耗时（秒）', ('outcome',))
+FORWARD_BATCH_FRAMES = metrics.REGISTRY.histogram(
+    'forwarder_batch_frames', '每批转发的帧数', buckets=(1, 5, 10, 25, 50, 100, 200, 500, 1000))
+
+# 队列满时的处理策略
+DROP_NEWEST = 'drop_newest'   # 丢弃新到的消息
+DROP_OLDEST = 'drop_oldest'   # 丢弃队列中最旧的消息
+BLOCK = 'block'               # 最多等待 put_timeout 秒，仍满则丢弃新消息
+
+_STOP = object()
+
+
+def shard_key(payload):
+    """决定消息进入哪个队列的键：有主题时为主题，否则为载荷中的设备ID"""
+    if isinstance(payload, tuple):
+        topic, payload = payload
+        if topic:
+            return topic
+    if isinstance(payload, str):
+        return sensor_parser.peek_device_id(payload)
+    return binary_frame.device_id(payload) or ''
+
+
+class BatchForwarder:
+    """按设备分队列 + 每个队列一个工作线程的批量转发器"""
+
+    def __init__(self, url, workers=2, queue_size=10000, batch_size=200,
+                 max_delay=0.05, policy=DROP_OLDEST, put_timeout=0.05,
+                 request_timeout=5):
+        if policy not in (DROP_NEWEST, DROP_OLDEST, BLOCK):
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.url = url
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.policy = policy
+        self.put_timeout = put_timeout
+        self.request_timeout = request_timeout
+
+        # queue_size 为所有队列的总上限，平均分给各工作线程
+        per_worker = max(1, -(-queue_size // workers))
+        self._queues = [queue.Queue(maxsize=per_worker) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'dropped': 0, 'forwarded': 0, 'failed': 0, 'batches': 0}
+
+        # 所有工作线程共享一个 Session，连接池大小与线程数一致
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def start(self):
+        for i, work_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(work_queue,), name=f"forwarder-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=5):
+        """发送完队列中剩余的消息后停止工作线程"""
+        for work_queue in self._queues[:len(self._threads)]:
+            work_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.session.close()
+
+    def submit(self, payload):
+        """放入一条载荷或 (MQTT 主题, 载荷)，返回是否入队成功；不会无限期阻塞"""
+        work_queue = self._queues[zlib.crc32(shard_key(payload).encode('utf-8')) % self.workers]
+        try:
+            if self.policy == BLOCK:
+                work_queue.put(payload, timeout=self.put_timeout)
+            else:
+                work_queue.put_nowait(payload)
+        except queue.Full:
+            if self.policy != DROP_OLDEST or not self._evict_and_put(work_queue, payload):
+                self._count('dropped')
+                return False
+        self._count('submitted')
+        return True
+
+    def _evict_and_put(self, work_queue, payload):
+        # 队列满时丢弃最旧的一条再放入；与其他生产者竞争失败时放弃
+        try:
+            evicted = work_queue.get_nowait()
+        except queue.Empty:
+            evicted = None
+        if evicted is _STOP:
+            work_queue.put(_STOP)
+            return False
+        if evicted is not None:
+            self._count('dropped')
+        try:
+            work_queue.put_nowait(payload)
+            return True
+        except queue.Full:
+            return False
+
+    def qsize(self):
+        return sum(work_queue.qsize() for work_queue in self._queues)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['queue_depth'] = self.qsize()
+        return stats
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def _next_batch(self, work_queue):
+        """阻塞取第一条，然后在 max_delay 内凑满 batch_size；返回 (batch, 是否收到停止信号)"""
+        first = work_queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = work_queue.get(timeout=remaining) if remaining > 0 else work_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self, work_queue):
+        while True:
+            batch, stopping = self._next_batch(work_queue)
+            if batch:
+                self._send(batch)
+            if stopping:
+                return
+
+    def _send(self, batch):
+        FORWARD_BATCH_FRAMES.observe(len(batch))
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = self.session.post(
+                self.url,
+                data=encode_length_prefixed(batch),
+                headers={'Content-Type': LENGTH_PREFIXED},
+                timeout=self.request_timeout,
+            )
+            if response.status_code == 200:
+                outcome = 'ok'
+                self._count('forwarded', len(batch))
+                self._count('batches')
+                return
+            outcome = 'status'
+            _send_log.error('status', "❌ Failed to send batch to backend: %s, %.200s", response.status_code, response.text)
+        except Exception as e:
+            _send_log.error('exception', "❌ Error sending batch to backend: %s", e)
+        finally:
+            FORWARD_SECONDS.observe(time.perf_counter() - started, (outcome,))
+        self._count('failed', len(batch))
@@ -29,4 +29,29 @@ export const testApiConnection = async () => {
     console.error('API连接测试失败:', error)
     throw error
   }
-}
\ No newline at end of file
+}
+
+/**
+ * 订阅设备变更推送 (Server-Sent Events)
+ * 首帧 snapshot 为全部设备列表，之后 update 帧为 { devices: {id: 设备信息}, removed: [id] }
+ * 断线后浏览器会自动重连，重连后会重新收到 snapshot
+ * @param {Object} handlers { onSnapshot, onUpdate, onError }
+ * @returns {Function|null} 取消订阅函数；浏览器不支持 EventSource 时返回 null
+ */
+export const subscribeDeviceStream = ({ onSnapshot, onUpdate, onError } = {}) => {
+  if (typeof window === 'undefined' || !window.EventSource) {
+    return null
+  }
+  const source = new EventSource(`${API_BASE}/stream`)
+  source.addEventListener('snapshot', (event) => {
+    onSnapshot && onSnapshot(JSON.parse(event.data))
+  })
+  source.addEventListener('update', (event) => {
+    onUpdate && onUpdate(JSON.parse(event.data))
+  })
+  source.onerror = (error) => {
+    console.error('设备推送连接异常:', error)
+    onError && onError(error)
+  }
+  return () => source.close()
+}
@@ -0,0 +1,162 @@
+"""
+设备传感器数据历史记录
+
+每个设备一个预分配的 NumPy 环形缓冲区，内存固定，写满后覆盖最旧的数据。
+查询时支持时间范围过滤和服务端降采样（min/max 分桶或 LTTB）。
+"""
+import threading
+
+import numpy as np
+
+# 记录的字段，顺序即缓冲区的列顺序，与最新数据存储一致
+from sensor_store import FIELDS
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+DOWNSAMPLE_METHODS = ('minmax', 'lttb')
+
+
+class DeviceHistory:
+    """单个设备的环形缓冲区：时间戳 (float64 秒) + 各字段值 (float32)"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((capacity, len(FIELDS)), dtype=np.float32)
+        self.head = 0   # 下一次写入的位置
+        self.size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self.timestamps.nbytes + self.values.nbytes
+
+    def append(self, timestamp, values):
+        """写入一条记录，values 按 FIELDS 顺序排列"""
+        with self._lock:
+            row = self.head
+            self.timestamps[row] = timestamp
+            self.values[row] = values
+            self.head = (row + 1) % self.capacity
+            if self.size < self.capacity:
+                self.size += 1
+
+    def snapshot(self, start=None, end=None):
+        """按时间顺序返回 [start, end] 范围内的 (timestamps, values) 副本"""
+        with self._lock:
+            if self.size < self.capacity:
+                timestamps = self.timestamps[:self.size].copy()
+                values = self.values[:self.size].copy()
+            else:
+                order = np.roll(np.arange(self.capacity), -self.head)
+                timestamps = self.timestamps[order]
+                values = self.values[order]
+        if start is not None or end is not None:
+            mask = np.ones(len(timestamps), dtype=bool)
+            if start is not None:
+                mask &= timestamps >= start
+            if end is not None:
+                mask &= timestamps <= end
+            timestamps, values = timestamps[mask], values[mask]
+        return timestamps, values
+
+
+class HistoryStore:
+    """所有设备的历史记录，缓冲区在设备首次上报数据时分配"""
+
+    def __init__(self, capacity=1800):
+        self.capacity = capacity
+        self._histories = {}
+        self._lock = threading.Lock()
+
+    def record(self, device_id, timestamp, values):
+        history = self._histories.get(device_id)
+        if history is None:
+            with self._lock:
+                history = self._histories.setdefault(device_id, DeviceHistory(self.capacity))
+        history.append(timestamp, values)
+
+    def get(self, device_id):
+        return self._histories.get(device_id)
+
+    def remove(self, device_id):
+        with self._lock:
+            self._histories.pop(device_id, None)
+
+    def query(self, device_id, start=None, end=None, fields=FIELDS, max_points=500, method='minmax'):
+        """
+        查询设备历史，每个字段返回 {'t': [毫秒时间戳], 'v': [值]}
+        点数超过 max_points 时按 method 降采样
+        """
+        history = self._histories.get(device_id)
+        if history is None:
+            timestamps = np.zeros(0, dtype=np.float64)
+            values = np.zeros((0, len(FIELDS)), dtype=np.float32)
+        else:
+            timestamps, values = history.snapshot(start, end)
+
+        series = {}
+        for name in fields:
+            column = values[:, FIELD_INDEX[name]]
+            t, v = downsample(timestamps, column, max_points, method)
+            series[name] = {
+                't': np.round(t * 1000).astype(np.int64).tolist(),
+                'v': np.round(v.astype(np.float64), 2).tolist(),
+            }
+        return len(timestamps), series
+
+
+def downsample(timestamps, values, max_points, method='minmax'):
+    """将一条时间序列降到不超过 max_points 个点"""
+    n = len(timestamps)
+    if n <= max_points or max_points < 3:
+        return timestamps, values
+    if method == 'lttb':
+        index = _lttb_index(timestamps, values, max_points)
+    else:
+        index = _minmax_index(values, max_points)
+    return timestamps[index], values[index]
+
+
+def _minmax_index(values, max_points):
+    """等点数分桶，每桶保留最小值和最大值所在的点，保持时间顺序"""
+    buckets = max(1, max_points // 2)
+    edges = np.linspace(0, len(values), buckets + 1).astype(np.int64)
+    index = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if hi <= lo:
+            continue
+        chunk = values[lo:hi]
+        a = lo + int(np.argmin(chunk))
+        b = lo + int(np.argmax(chunk))
+        if a == b:
+            index.append(a)
+        else:
+            index.extend((a, b) if a < b else (b, a))
+    return np.array(index, dtype=np.int64)
+
+
+def _lttb_index(timestamps, values, max_points):
+    """Largest-Triangle-Three-Buckets 降采样，保留首尾点"""
+    n = len(values)
+    x = timestamps - timestamps[0]
+    y = values.astype(np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    index = np.empty(max_points, dtype=np.int64)
+    index[0] = 0
+    index[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # 下一个桶的平均点；最后一个桶使用最后一个点
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        if next_hi <= next_lo:
+            next_lo, next_hi = n - 1, n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        if hi <= lo:
+            index[i + 1] = a
+            continue
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        index[i + 1] = a
+    return np.unique(index)
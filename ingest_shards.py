@@ -0,0 +1,315 @@
+"""
+多进程分片接入
+
+帧按设备ID的哈希分到 N 个工作进程，每个进程独立运行解析器，不受主进程 GIL 限制。
+带 MQTT 主题的帧按主题路由（见 topic_router）确定设备ID和解码器，工作进程使用同一份路由表。
+工作进程把每台设备的最新数据写入共享内存表（每台设备一个定长行），
+主进程的收集线程定期向量化比较各行的序号，只处理有变化的行，每个请求都不需要进程间通信。
+
+共享内存布局:
+    各工作进程的计数 (收到帧数, 解析出数据的帧数, 槽位已满丢弃的帧数) | 定长行数组
+每行 9 个 8 字节列: 序号, 时间戳, 已写入过的字段位图, 4 个浮点字段, 2 个整数字段。
+序号按 seqlock 方式使用：写入前后各加一，奇数表示正在写入，读取方前后两次序号一致才算读到完整的一行。
+槽位区间按工作进程平均划分，每个进程只写自己区间内的行；新设备的 (设备ID, 槽位) 通过队列告知主进程，
+每台设备只发送一次。
+"""
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import topic_router
+from app_logging import get_logger
+from sensor_store import FIELDS, FLOAT_FIELDS
+
+logger = get_logger('ingest_shards')
+
+DEFAULT_SLOTS = 100000
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_FLUSH_INTERVAL = 0.01
+DEFAULT_COLLECT_INTERVAL = 0.1
+
+# 每行的列: 序号, 时间戳, 字段位图, 各字段
+_COLUMNS = 3 + len(FIELDS)
+_SEQ = 0
+_TIMESTAMP = 1
+_PRESENT = 2
+_FIELD_COLUMN = {name: 3 + i for i, name in enumerate(FIELDS)}
+_FIELD_BIT = {name: 1 << i for i, name in enumerate(FIELDS)}
+_FLOAT_COLUMNS = frozenset(_FIELD_COLUMN[name] for name in FLOAT_FIELDS)
+
+# 每个工作进程的计数
+_STATS = ('received', 'parsed', 'dropped')
+
+
+def shard_of(device_id, shards):
+    # 内置 hash() 在每个进程中随机化，分片需要跨进程稳定的哈希
+    return zlib.crc32(device_id.encode('utf-8')) % shards
+
+
+class SharedTable:
+    """共享内存中的最新数据表，由 create 创建或按名称 attach"""
+
+    def __init__(self, shm, workers, capacity, owner):
+        self.shm = shm
+        self.workers = workers
+        self.capacity = capacity
+        self._owner = owner
+        stats_bytes = workers * len(_STATS) * 8
+        self._rows_offset = stats_bytes
+        buf = shm.buf
+        self.stats = buf[:stats_bytes].cast('q')
+        rows = buf[stats_bytes:stats_bytes + capacity * _COLUMNS * 8]
+        self.ints = rows.cast('q')
+        self.floats = rows.cast('d')
+
+    @classmethod
+    def create(cls, workers, capacity):
+        size = (workers * len(_STATS) + capacity * _COLUMNS) * 8
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        return cls(shm, workers, capacity, owner=True)
+
+    @classmethod
+    def attach(cls, name, workers, capacity):
+        return cls(shared_memory.SharedMemory(name=name), workers, capacity, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def slot_range(self, worker):
+        """工作进程可用的槽位区间 [start, end)"""
+        per_worker = self.capacity // self.workers
+        return worker * per_worker, (worker + 1) * per_worker
+
+    def sequences(self):
+        """所有行的序号列（NumPy 视图，不复制）"""
+        return np.frombuffer(self.shm.buf, dtype='<i8', count=self.capacity * _COLUMNS,
+                             offset=self._rows_offset).reshape(self.capacity, _COLUMNS)[:, _SEQ]
+
+    def write(self, slot, updates, timestamp):
+        """写入一台设备本帧解析出的字段，只由该槽位所属的工作进程调用"""
+        ints, floats = self.ints, self.floats
+        base = slot * _COLUMNS
+        ints[base] += 1
+        floats[base + _TIMESTAMP] = timestamp
+        present = ints[base + _PRESENT]
+        for name, value in updates.items():
+            column = _FIELD_COLUMN[name]
+            if column in _FLOAT_COLUMNS:
+                floats[base + column] = value
+            else:
+                ints[base + column] = value
+            present |= _FIELD_BIT[name]
+        ints[base + _PRESENT] = present
+        ints[base] += 1
+
+    def read(self, slot):
+        """读取完整的一行，返回 (序号, 时间戳, {字段: 值})，只包含写入过的字段"""
+        ints, floats = self.ints, self.floats
+        base = slot * _COLUMNS
+        while True:
+            seq = ints[base]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            timestamp = floats[base + _TIMESTAMP]
+            present = ints[base + _PRESENT]
+            values = {name: floats[base + column] if column in _FLOAT_COLUMNS else ints[base + column]
+                      for name, column in _FIELD_COLUMN.items() if present & _FIELD_BIT[name]}
+            if ints[base] == seq:
+                return seq, timestamp, values
+
+    def stat(self, worker, stat):
+        return self.stats[worker * len(_STATS) + _STATS.index(stat)]
+
+    def close(self):
+        self.stats.release()
+        self.ints.release()
+        self.floats.release()
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def _worker_main(worker, table_name, workers, capacity, routes, inbox, outbox):
+    """工作进程：解析收到的每批 (主题, 帧) 并写入共享内存表"""
+    router = topic_router.TopicRouter(routes)
+    table = SharedTable.attach(table_name, workers, capacity)
+    next_slot, end_slot = table.slot_range(worker)
+    slots = {}
+    received = parsed = dropped = 0
+    stats_base = worker * len(_STATS)
+    try:
+        while True:
+            batch = inbox.get()
+            if batch is None:
+                return
+            new_devices = []
+            for topic, payload_str in batch:
+                received += 1
+                device_id, updates = router.parse(payload_str, topic)
+                if not updates:
+                    continue
+                slot = slots.get(device_id)
+                if slot is None:
+                    if next_slot >= end_slot:
+                        dropped += 1
+                        continue
+                    slot = slots[device_id] = next_slot
+                    next_slot += 1
+                    new_devices.append((device_id, slot))
+                table.write(slot, updates, time.time())
+                parsed += 1
+            if new_devices:
+                outbox.put(new_devices)
+            # 计数只由本进程写入，每批更新一次
+            for offset, value in enumerate((received, parsed, dropped)):
+                table.stats[stats_base + offset] = value
+    finally:
+        table.close()
+
+
+class ShardedIngest:
+    """
+    主进程一侧：把帧分发给工作进程，并在收集线程中把有变化的行交给 on_update
+    on_update(device_id, values, timestamp): values 为该设备各字段的最新值（只含上报过的字段）
+    routes: 主题路由 [{'filter', 'decoder', 'device'}]；工作进程以 spawn 方式启动，
+    只能使用导入 sensor_parser 时已注册的解码器
+    """
+
+    def __init__(self, on_update, workers, capacity=DEFAULT_SLOTS, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, collect_interval=DEFAULT_COLLECT_INTERVAL, routes=()):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.on_update = on_update
+        self.workers = workers
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.collect_interval = collect_interval
+        self.routes = list(routes)
+        self.router = topic_router.TopicRouter(self.routes)
+        self.table = None
+        self._context = multiprocessing.get_context('spawn')
+        self._inboxes = []
+        self._outbox = None
+        self._processes = []
+        self._pending = [[] for _ in range(workers)]
+        self._pending_lock = threading.Lock()
+        self._devices = {}   # 槽位 -> 设备ID
+        self._seen = np.zeros(capacity, dtype=np.int64)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.table = SharedTable.create(self.workers, self.capacity)
+        self._outbox = self._context.Queue()
+        for worker in range(self.workers):
+            inbox = self._context.Queue()
+            process = self._context.Process(
+                target=_worker_main, name=f'ingest-worker-{worker}', daemon=True,
+                args=(worker, self.table.name, self.workers, self.capacity, self.routes, inbox, self._outbox))
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+        for target, name in ((self._flush_loop, 'ingest-dispatch'), (self._collect_loop, 'ingest-collect')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("🧩 分片接入已启动: %s 个工作进程, %s 个设备槽位", self.workers, self.capacity)
+        return self
+
+    def stop(self, timeout=5):
+        if self.table is None:
+            return
+        self._stop.set()
+        self.flush()
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.collect()
+        self.table.close()
+        self.table = None
+
+    # ---- 分发 ----
+
+    def submit(self, payload_str, topic=None, device_id=None):
+        """按设备分片放入待发送批次，攒够 batch_size 帧时立即发送；device_id 为已确定的设备ID"""
+        if device_id is None:
+            device_id = self.router.identify(payload_str, topic) or ''
+        worker = shard_of(device_id, self.workers)
+        with self._pending_lock:
+            pending = self._pending[worker]
+            pending.append((topic, payload_str))
+            if len(pending) < self.batch_size:
+                return
+            self._pending[worker] = []
+        self._inboxes[worker].put(pending)
+
+    def flush(self):
+        """发送所有未满的批次"""
+        with self._pending_lock:
+            batches, self._pending = self._pending, [[] for _ in range(self.workers)]
+        for worker, batch in enumerate(batches):
+            if batch:
+                self._inboxes[worker].put(batch)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    # ---- 收集 ----
+
+    def collect(self):
+        """处理自上次以来有变化的行，返回处理的设备数"""
+        while True:
+            try:
+                for device_id, slot in self._outbox.get_nowait():
+                    self._devices[slot] = device_id
+            except queue.Empty:
+                break
+        sequences = self.table.sequences()
+        changed = np.flatnonzero(sequences != self._seen)
+        count = 0
+        for slot in changed.tolist():
+            device_id = self._devices.get(slot)
+            if device_id is None:
+                # 新设备的通知还没有到达，下一轮再处理
+                continue
+            seq, timestamp, values = self.table.read(slot)
+            self._seen[slot] = seq
+            try:
+                self.on_update(device_id, values, timestamp)
+            except Exception:
+                logger.exception("处理分片接入的数据时出错: %s", device_id)
+            count += 1
+        return count
+
+    def _collect_loop(self):
+        while not self._stop.wait(self.collect_interval):
+            self.collect()
+
+    def stats(self):
+        """各工作进程的 {'received', 'parsed', 'dropped'} 计数"""
+        if self.table is None:
+            return []
+        return [{name: self.table.stat(worker, name) for name in _STATS} for worker in range(self.workers)]
+
+
+def add_arguments(parser):
+    """backend.py 和 server.py 共用的命令行参数"""
+    parser.add_argument('--ingest-workers', type=int, default=0,
+                        help='按设备分片解析数据的工作进程数，0 表示在主进程内解析（默认）')
+    parser.add_argument('--ingest-slots', type=int, default=DEFAULT_SLOTS,
+                        help=f'分片接入共享内存表的设备槽位数，默认 {DEFAULT_SLOTS}')
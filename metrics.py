@@ -0,0 +1,260 @@
+"""
+Prometheus 文本格式的进程内指标
+
+- 计数器和直方图按线程分片：每个线程只写自己的 dict，热路径上不加锁
+- 抓取时加锁合并所有分片；已结束线程的分片合并进归档后丢弃，
+  避免每请求一线程的服务器下分片无限增长
+- 在线数、最后上报时间等由回调在抓取时计算 (GaugeCallback)
+"""
+import bisect
+import threading
+import weakref
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 默认直方图分桶（秒），覆盖解析 (微秒级) 到 HTTP 请求 (秒级)
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                   0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Registry:
+    """指标注册表，一个进程通常只用模块级的 REGISTRY"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # [(线程弱引用, 该线程的分片)]
+        self._shards = []
+        # 已结束线程合并后的值
+        self._retired = {}
+        self._metrics = []
+
+    def shard(self):
+        """当前线程的分片 {(指标名, 标签值元组): 值}"""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((weakref.ref(threading.current_thread()), values))
+            return values
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, fn, labelnames=(), kind='gauge'):
+        return self.register(GaugeCallback(name, documentation, fn, labelnames, kind))
+
+    def _merged(self):
+        """合并所有分片的当前值"""
+        merged = {}
+        with self._lock:
+            alive = []
+            for thread_ref, values in self._shards:
+                thread = thread_ref()
+                if thread is None or not thread.is_alive():
+                    # 线程已结束，不会再写入，安全地并入归档
+                    _merge_into(self._retired, list(values.items()))
+                else:
+                    alive.append((thread_ref, values))
+                    _merge_into(merged, list(values.items()))
+            self._shards = alive
+            _merge_into(merged, self._retired.items())
+            metrics = list(self._metrics)
+        return metrics, merged
+
+    def collect(self):
+        """[(指标, [(标签值元组, 值)])]，直方图的值为 [各桶计数..., 总和, 次数]"""
+        metrics, merged = self._merged()
+        by_name = {}
+        for (name, labels), value in merged.items():
+            by_name.setdefault(name, []).append((labels, value))
+        return [(metric, metric.samples(by_name)) for metric in metrics]
+
+    def value(self, name, labels=()):
+        """单个指标的当前值，供测试和统计接口使用"""
+        for metric, samples in self.collect():
+            if metric.name == name:
+                return dict(samples).get(tuple(labels), 0)
+        return 0
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        for metric, samples in self.collect():
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for labels, value in samples:
+                lines.extend(metric.format(labels, value))
+        lines.append('')
+        return '\n'.join(lines)
+
+
+def _merge_into(target, items):
+    for key, value in items:
+        current = target.get(key)
+        if current is None:
+            target[key] = list(value) if isinstance(value, list) else value
+        elif isinstance(value, list):
+            for i, v in enumerate(value):
+                current[i] += v
+        else:
+            target[key] = current + value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_str(labelnames, labels, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra is not None:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # inc_each 按标签值组合计数，抓取时再展开到各标签值
+        self._each_name = name + ':each'
+
+    def inc(self, labels=(), amount=1):
+        values = self._registry.shard()
+        key = (self.name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def inc_each(self, label_values):
+        """
+        单标签计数器，对每个标签值各加 1
+        热路径上只对整个组合做一次 dict 更新，组合数量应当有限 (如一帧中出现的字段)
+        """
+        values = self._registry.shard()
+        key = (self._each_name, tuple(label_values))
+        values[key] = values.get(key, 0) + 1
+
+    def samples(self, by_name):
+        totals = dict(by_name.get(self.name, ()))
+        for combination, count in by_name.get(self._each_name, ()):
+            for label in combination:
+                totals[(label,)] = totals.get((label,), 0) + count
+        return sorted(totals.items())
+
+    def format(self, labels, value):
+        return [f'{self.name}{_label_str(self.labelnames, labels)} {_number(value)}']
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, labels=()):
+        values = self._registry.shard()
+        key = (self.name, labels)
+        slots = values.get(key)
+        if slots is None:
+            # 各桶计数 (最后一个为 +Inf)，然后是总和和次数
+            slots = values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        slots[bisect.bisect_left(self.buckets, value)] += 1
+        slots[-2] += value
+        slots[-1] += 1
+
+    def samples(self, by_name):
+        return sorted(by_name.get(self.name, ()), key=lambda item: item[0])
+
+    def format(self, labels, value):
+        lines = []
+        cumulative = 0
+        bounds = self.buckets + (float('inf'),)
+        for bound, count in zip(bounds, value):
+            cumulative += count
+            le = 'le="' + _number(float(bound)) + '"'
+            lines.append(f'{self.name}_bucket{_label_str(self.labelnames, labels, le)} {cumulative}')
+        label_str = _label_str(self.labelnames, labels)
+        lines.append(f'{self.name}_sum{label_str} {_number(value[-2])}')
+        lines.append(f'{self.name}_count{label_str} {value[-1]}')
+        return lines
+
+
+class GaugeCallback:
+    """
+    抓取时才计算的指标，fn 返回数值或 [(标签值元组, 值)]
+    读取其他组件已有的累计值时 kind 可设为 'counter'
+    """
+
+    def __init__(self, name, documentation, fn, labelnames=(), kind='gauge'):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+
+    def samples(self, by_name=None):
+        result = self.fn()
+        if isinstance(result, (int, float)):
+            return [((), result)]
+        return list(result)
+
+    def format(self, labels, value):
+        return [f'{self.name}{_label_str(self.labelnames, labels)} {_number(value)}']
+
+
+# 进程级注册表
+REGISTRY = Registry()
+
+
+def serve(port, registry=REGISTRY, host='0.0.0.0'):
+    """
+    在后台线程启动只提供 /metrics 的 HTTP 服务，供没有 Web 框架的进程 (如 mqtt_bridge) 导出指标
+    返回 HTTPServer，调用 shutdown() 停止
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
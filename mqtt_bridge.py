@@ -1,46 +1,79 @@
 import paho.mqtt.client as mqtt
 import sys
 import os
-import requests
+import metrics
+import binary_frame
+from forwarder import BatchForwarder, DROP_OLDEST
+from app_logging import RateLimitedLog, get_logger, setup_logging, shutdown_logging
+
+# 日志级别取环境变量 LOG_LEVEL，默认 INFO；逐条消息日志为 DEBUG 级别并按主题限流
+setup_logging()
+logger = get_logger('mqtt_bridge')
+message_log = RateLimitedLog(logger)
 
 # 指定后端API地址
 BACKEND_API_URL = 'http://localhost:5002/api/update-sensor-data'  # 修改为正确的后端端口
+# 批量上报接口，转发线程按批发送到这里
+BACKEND_BATCH_API_URL = 'http://localhost:5002/api/update-sensor-data/batch'
+
+# 转发管道配置
+FORWARD_WORKERS = 2           # 转发线程数，共享一个 keep-alive 连接池；同一主题的消息总由同一线程按序发送
+FORWARD_QUEUE_SIZE = 10000    # 内存队列上限（条）
+FORWARD_BATCH_SIZE = 200      # 每批最多帧数
+FORWARD_MAX_DELAY = 0.05      # 攒批最长等待时间（秒）
+FORWARD_QUEUE_POLICY = DROP_OLDEST  # 队列满时的策略: drop_oldest / drop_newest / block
+
+# Prometheus 指标导出端口 (http://<host>:9102/metrics)，设为 None 关闭
+METRICS_PORT = 9102
+
+forwarder = BatchForwarder(
+    BACKEND_BATCH_API_URL,
+    workers=FORWARD_WORKERS,
+    queue_size=FORWARD_QUEUE_SIZE,
+    batch_size=FORWARD_BATCH_SIZE,
+    max_delay=FORWARD_MAX_DELAY,
+    policy=FORWARD_QUEUE_POLICY,
+)
+
+# 转发队列深度和累计计数在抓取时从 forwarder.stats() 读取
+metrics.REGISTRY.gauge_callback(
+    'forwarder_queue_depth', '转发队列中等待发送的消息数', lambda: forwarder.qsize())
+metrics.REGISTRY.gauge_callback(
+    'forwarder_messages_total', '按结果统计的消息数 (submitted/dropped/forwarded/failed)',
+    lambda: [((name,), value) for name, value in forwarder.stats().items()
+             if name in ('submitted', 'dropped', 'forwarded', 'failed')],
+    ('result',), kind='counter')
 
 # 连接成功回调
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
-        print('✅ Connected successfully with result code 0')
+        logger.info('✅ Connected successfully with result code 0')
         client.subscribe('testtopic/#')
         # 也订阅测试文件中使用的主题
         client.subscribe("stm32/1")
     else:
-        print(f'❌ Connection failed with result code {rc}')
+        logger.error('❌ Connection failed with result code %s', rc)
         if rc == 1:
-            print("❌ Connection refused - incorrect protocol version")
+            logger.error("❌ Connection refused - incorrect protocol version")
         elif rc == 2:
-            print("❌ Connection refused - invalid client identifier")
+            logger.error("❌ Connection refused - invalid client identifier")
         elif rc == 3:
-            print("❌ Connection refused - server unavailable")
+            logger.error("❌ Connection refused - server unavailable")
         elif rc == 4:
-            print("❌ Connection refused - bad username or password")
+            logger.error("❌ Connection refused - bad username or password")
         elif rc == 5:
-            print("❌ Connection refused - not authorised")
+            logger.error("❌ Connection refused - not authorised")
 
 # 消息接收回调
 def on_message(client, userdata, msg):
-    payload_str = msg.payload.decode('utf-8')
-    print(f"📥 {msg.topic} {payload_str}")
+    # 二进制帧原样转发，文本帧解码后转发
+    payload_str = binary_frame.text_or_frame(msg.payload)
+    message_log.debug(msg.topic, "📥 %s %s", msg.topic, payload_str)
     
-    # 通过HTTP请求将数据发送到后端API
-    try:
-        response = requests.post(BACKEND_API_URL, data=payload_str, headers={'Content-Type': 'text/plain'})
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Data sent to backend: {result['message']}")
-        else:
-            print(f"❌ Failed to send data to backend: {response.status_code}, {response.text}")
-    except Exception as e:
-        print(f"❌ Error sending data to backend: {e}")
+    # 连同主题放入转发队列，由转发线程批量发送到后端API，不阻塞网络循环
+    # 后端按主题路由确定设备ID和解码器（见 topic_router）
+    if not forwarder.submit((msg.topic, payload_str)):
+        message_log.warning('queue-full', "⚠️ Forward queue full, dropped message from %s", msg.topic)
 
 # 创建客户端
 client = mqtt.Client()
@@ -55,10 +88,17 @@ client.username_pw_set("qxy1", "5686670")
 # 建立连接 - 使用测试文件中的端口
 try:
     client.connect('172.16.208.176', 18883, 60)
-    print("🔌 Attempting to connect to 172.16.208.176:18883")
+    logger.info("🔌 Attempting to connect to 172.16.208.176:18883")
     
-    # 开始网络循环
+    # 启动转发线程和指标导出后开始网络循环
+    forwarder.start()
+    if METRICS_PORT is not None:
+        metrics.serve(METRICS_PORT)
+        logger.info("📈 Metrics exported on :%s/metrics", METRICS_PORT)
     client.loop_forever()
     
 except Exception as e:
-    print(f"❌ Exception occurred: {e}")
\ No newline at end of file
+    logger.error("❌ Exception occurred: %s", e)
+finally:
+    forwarder.stop()
+    shutdown_logging()
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+后端内嵌的 MQTT 订阅接入
+
+backend.py 以 --mqtt 启动时直接订阅 config.SUB_TOPICS，
+paho 网络线程只把消息放入队列，由独立的接入线程调用解析器，
+省去 mqtt_bridge.py -> HTTP -> backend 的进程与网络开销。
+"""
+import queue
+import threading
+import uuid
+
+import paho.mqtt.client as mqtt
+
+import binary_frame
+from app_logging import RateLimitedLog, get_logger
+
+logger = get_logger('mqtt_ingest')
+_message_log = RateLimitedLog(logger)
+
+_STOP = object()
+
+
+class MqttIngestor:
+    """订阅 MQTT 主题并在接入线程中处理消息"""
+
+    def __init__(self, handler, mqtt_config, topics, qos=1, queue_size=10000,
+                 client_factory=None):
+        """
+        handler: 处理函数 handler(payload, topic)，payload 为文本，二进制帧保持 bytes（见 binary_frame）
+        client_factory: 创建 paho 客户端的函数，测试时可替换为假客户端
+        """
+        self.handler = handler
+        self.mqtt_config = mqtt_config
+        self.topics = list(topics)
+        self.qos = qos
+        self.client_factory = client_factory or mqtt.Client
+        self.dropped = 0
+        self.processed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self.client = None
+
+    def _create_client(self):
+        config = self.mqtt_config
+        client_id = config.get('client_id') or f"backend_ingest_{uuid.uuid4().hex[:8]}"
+        client = self.client_factory(client_id=client_id)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_message = self._on_message
+
+        if config.get('username') and config.get('password'):
+            client.username_pw_set(config['username'], config['password'])
+        if config.get('use_tls', False):
+            client.tls_set(
+                ca_certs=config.get('ca_certs'),
+                certfile=config.get('certfile'),
+                keyfile=config.get('keyfile')
+            )
+        if config.get('will_topic'):
+            client.will_set(
+                config['will_topic'],
+                config.get('will_payload', 'Client is offline'),
+                qos=config.get('will_qos', 1)
+            )
+        return client
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            logger.info("✅ 内嵌MQTT接入连接成功")
+            # 在连接回调中订阅，保证重连后订阅依然有效
+            for topic in self.topics:
+                client.subscribe(topic, qos=self.qos)
+                logger.info("📡 订阅主题: %s", topic)
+        else:
+            logger.error("❌ 内嵌MQTT接入连接失败，错误代码: %s", rc)
+
+    def _on_disconnect(self, client, userdata, rc):
+        if rc != 0:
+            logger.warning("⚠️ 内嵌MQTT接入意外断开连接，等待自动重连")
+
+    def _on_message(self, client, userdata, msg):
+        # 运行在 paho 网络线程中，只入队不解析
+        try:
+            self._queue.put_nowait((msg.topic, msg.payload))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            topic, payload = item
+            try:
+                self.handler(binary_frame.text_or_frame(payload), topic)
+            except Exception as e:
+                _message_log.error('handler', "❌ 内嵌MQTT接入处理消息出错: %s", e)
+            self.processed += 1
+
+    def start(self):
+        """启动接入线程并连接 MQTT 代理"""
+        self._thread = threading.Thread(target=self._run, name="mqtt-ingest", daemon=True)
+        self._thread.start()
+
+        self.client = self._create_client()
+        config = self.mqtt_config
+        logger.info("🔌 内嵌MQTT接入正在连接到 %s:%s", config['server'], config['port'])
+        self.client.connect_async(config['server'], config['port'], keepalive=config.get('keepalive', 60))
+        self.client.loop_start()
+        return self
+
+    def stop(self, timeout=5):
+        """断开连接，处理完队列中已收到的消息后停止接入线程"""
+        if self.client is not None:
+            self.client.disconnect()
+            self.client.loop_stop()
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def qsize(self):
+        return self._queue.qsize()
@@ -0,0 +1,321 @@
+"""
+设备和传感器数据的持久化（SQLite WAL，后台批量提交）
+
+接入路径只把记录放入内存队列，不等待磁盘；后台线程每 flush_interval 秒
+或攒够 batch_size 条记录时在一个事务中写入：
+- devices: 设备注册信息（注册、修改、删除）
+- latest: 每台设备的状态和最新数据，同一批内同一设备只写最后一次
+- readings: 每帧数据的追加记录（可关闭），超过 readings_retention 秒的记录由后台线程定期删除
+synchronous 为 SQLite 的同名 PRAGMA：NORMAL 只在 WAL checkpoint 时 fsync，
+FULL 每次提交都 fsync。
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+from app_logging import get_logger
+from sensor_store import FIELDS, INT_FIELDS
+
+logger = get_logger('persistence')
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_FLUSH_INTERVAL = 0.5
+# 每帧记录默认保留 7 天，0 表示不删除
+DEFAULT_READINGS_RETENTION = 7 * 24 * 3600
+# 删除过期每帧记录的间隔（秒）
+PRUNE_INTERVAL = 60
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+_FIELD_COLUMNS = ', '.join(FIELDS)
+_FIELD_PARAMS = ', '.join('?' for _ in FIELDS)
+_FIELD_DEFS = ', '.join(f"{name} {'INTEGER' if name in INT_FIELDS else 'REAL'}" for name in FIELDS)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS devices (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    protocol TEXT NOT NULL,
+    location TEXT,
+    properties TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS latest (
+    device_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    last_active_at REAL,
+    timestamp REAL,
+    {_FIELD_DEFS}
+);
+CREATE TABLE IF NOT EXISTS readings (
+    device_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    {_FIELD_DEFS}
+);
+CREATE INDEX IF NOT EXISTS readings_device_time ON readings (device_id, timestamp);
+CREATE INDEX IF NOT EXISTS readings_time ON readings (timestamp);
+"""
+
+# 队列中的记录类型
+_DEVICE = 0
+_DELETE = 1
+_LATEST = 2
+_FRAME = 3
+_FLUSH = 4
+
+_STOP = object()
+
+
+class WriteBehindStore:
+    """后台线程批量提交的 SQLite 存储"""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 synchronous='NORMAL', keep_readings=True, readings_retention=DEFAULT_READINGS_RETENTION):
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Unknown synchronous mode: {synchronous}")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous
+        self.keep_readings = keep_readings
+        self.readings_retention = readings_retention
+        self._next_prune = 0.0
+
+        # 不设上限：接入路径不能因为磁盘慢而阻塞或丢数据
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counters = {'committed': 0, 'batches': 0, 'errors': 0, 'pruned': 0}
+
+        self._conn = self._connect()
+        self._conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        return conn
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='persistence-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self, timeout=10):
+        """写完队列中剩余的记录后停止后台线程"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+        self._conn.close()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['pending'] = self._queue.qsize()
+        return stats
+
+    # ---- 接入路径调用，只入队 ----
+
+    def save_device(self, device):
+        self._queue.put((_DEVICE, (
+            device.id, device.name, device.protocol,
+            json.dumps(device.location, ensure_ascii=False),
+            json.dumps(device.properties, ensure_ascii=False),
+            device.created_at,
+        )))
+
+    def delete_device(self, device_id):
+        self._queue.put((_DELETE, device_id))
+
+    def save_latest(self, device_id, status, last_active_at, timestamp, values):
+        """设备状态和最新数据，values 按 FIELDS 顺序"""
+        self._queue.put((_LATEST, (device_id, status, last_active_at, timestamp, *values)))
+
+    def save_frame(self, device_id, last_active_at, timestamp, values):
+        """收到一帧数据：设备在线、最新数据更新，并追加一条每帧记录（只入队一次）"""
+        self._queue.put((_FRAME, (device_id, last_active_at, timestamp, values)))
+
+    def flush(self, timeout=10):
+        """等待此前入队的记录全部提交，返回是否在超时前完成"""
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    # ---- 启动时恢复 ----
+
+    def load(self):
+        """返回 (设备行列表, {device_id: 最新数据行})，行为 sqlite3.Row"""
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            devices = conn.execute('SELECT * FROM devices ORDER BY rowid').fetchall()
+            latest = {row['device_id']: row for row in conn.execute('SELECT * FROM latest')}
+        finally:
+            conn.close()
+        return devices, latest
+
+    # ---- 后台线程 ----
+
+    def _next_batch(self):
+        """阻塞取第一条，然后在 flush_interval 内攒到 batch_size 条；返回 (batch, 是否停止)"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            if item[0] == _FLUSH:
+                break
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._commit(batch)
+            if self.readings_retention and time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + PRUNE_INTERVAL
+                self.prune(time.time() - self.readings_retention)
+            if stopping:
+                return
+
+    def prune(self, before):
+        """删除时间早于 before 的每帧记录，返回删除的行数（后台线程调用）"""
+        try:
+            deleted = self._conn.execute('DELETE FROM readings WHERE timestamp < ?', (before,)).rowcount
+        except sqlite3.Error:
+            logger.exception("删除过期的每帧记录失败")
+            with self._lock:
+                self._counters['errors'] += 1
+            return 0
+        with self._lock:
+            self._counters['pruned'] += deleted
+        return deleted
+
+    def _commit(self, batch):
+        devices = {}
+        latest = {}
+        readings = []
+        deleted = set()
+        waiters = []
+        keep_readings = self.keep_readings
+        # 按顺序合并：删除先执行，并丢弃同批内此前该设备的记录
+        for kind, item in batch:
+            if kind == _FRAME:
+                device_id, last_active_at, timestamp, values = item
+                latest[device_id] = (device_id, 'online', last_active_at, timestamp, *values)
+                if keep_readings:
+                    readings.append((device_id, timestamp, *values))
+            elif kind == _LATEST:
+                latest[item[0]] = item
+            elif kind == _DEVICE:
+                devices[item[0]] = item
+            elif kind == _DELETE:
+                deleted.add(item)
+                devices.pop(item, None)
+                latest.pop(item, None)
+                readings = [row for row in readings if row[0] != item]
+            else:
+                waiters.append(item)
+
+        try:
+            conn = self._conn
+            conn.execute('BEGIN')
+            if deleted:
+                params = [(device_id,) for device_id in deleted]
+                conn.executemany('DELETE FROM devices WHERE id = ?', params)
+                conn.executemany('DELETE FROM latest WHERE device_id = ?', params)
+                conn.executemany('DELETE FROM readings WHERE device_id = ?', params)
+            conn.executemany(
+                'INSERT OR REPLACE INTO devices (id, name, protocol, location, properties, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                devices.values())
+            conn.executemany(
+                f'INSERT OR REPLACE INTO latest (device_id, status, last_active_at, timestamp, {_FIELD_COLUMNS}) '
+                f'VALUES (?, ?, ?, ?, {_FIELD_PARAMS})',
+                latest.values())
+            if readings:
+                conn.executemany(
+                    f'INSERT INTO readings (device_id, timestamp, {_FIELD_COLUMNS}) VALUES (?, ?, {_FIELD_PARAMS})',
+                    readings)
+            conn.execute('COMMIT')
+            with self._lock:
+                self._counters['committed'] += len(batch) - len(waiters)
+                self._counters['batches'] += 1
+        except sqlite3.Error:
+            logger.exception("持久化批量提交失败，丢弃 %s 条记录", len(batch) - len(waiters))
+            try:
+                self._conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            with self._lock:
+                self._counters['errors'] += 1
+        for done in waiters:
+            done.set()
+
+
+
+class Fanout:
+    """同时写入多个存储（如 SQLite 与快照变更日志），接口与 WriteBehindStore 一致"""
+
+    def __init__(self, *stores):
+        self.stores = list(stores)
+
+    def add(self, store):
+        self.stores.append(store)
+
+    def save_device(self, device):
+        for store in self.stores:
+            store.save_device(device)
+
+    def delete_device(self, device_id):
+        for store in self.stores:
+            store.delete_device(device_id)
+
+    def save_latest(self, device_id, status, last_active_at, timestamp, values):
+        for store in self.stores:
+            store.save_latest(device_id, status, last_active_at, timestamp, values)
+
+    def save_frame(self, device_id, last_active_at, timestamp, values):
+        for store in self.stores:
+            store.save_frame(device_id, last_active_at, timestamp, values)
+
+    def flush(self, timeout=10):
+        return all([store.flush(timeout) for store in self.stores])
+
+    def pending(self):
+        return sum(store.pending() for store in self.stores)
+
+    def close(self):
+        for store in self.stores:
+            store.close()
+
+
+def add_arguments(parser):
+    """backend.py 和 server.py 共用的命令行参数"""
+    parser.add_argument('--db', default=None,
+                        help='SQLite 数据库路径，开启持久化并在启动时恢复设备 (默认取环境变量 SENSOR_DB)')
+    parser.add_argument('--db-flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL,
+                        help=f'后台批量提交的最长间隔（秒），默认 {DEFAULT_FLUSH_INTERVAL}')
+    parser.add_argument('--db-batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'每个事务最多提交的记录数，默认 {DEFAULT_BATCH_SIZE}')
+    parser.add_argument('--db-synchronous', default='NORMAL', choices=SYNCHRONOUS_MODES,
+                        type=str.upper, help='SQLite synchronous 模式，FULL 为每次提交都 fsync')
+    parser.add_argument('--db-no-readings', action='store_true',
+                        help='只保存设备和最新数据，不追加每帧记录')
+    parser.add_argument('--db-readings-retention', type=float, default=DEFAULT_READINGS_RETENTION,
+                        help=f'每帧记录保留的秒数，0 表示不删除，默认 {DEFAULT_READINGS_RETENTION}')
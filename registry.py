@@ -0,0 +1,85 @@
+"""
+线程安全的设备注册表
+
+- 设备增删由一把成员锁串行化，读取方拿到的是写时复制的成员快照，
+  遍历时不会出现 "dictionary changed size during iteration"
+- 单个设备的状态与数据更新按设备ID哈希分片加锁，不同分片的设备接入互不竞争
+- 同时需要两把锁时先取设备的分片锁，再取成员锁
+"""
+import threading
+
+
+class DeviceRegistry:
+    """设备ID -> Device 的注册表，读取接口与普通字典一致"""
+
+    def __init__(self, stripes=64):
+        self._devices = {}
+        self._snapshot = {}
+        self._snapshot_stale = False
+        self.membership = threading.RLock()
+        self._stripes = [threading.RLock() for _ in range(stripes)]
+
+    def lock(self, device_id):
+        """返回设备所在分片的锁，修改单个设备的状态与数据时持有"""
+        return self._stripes[hash(device_id) % len(self._stripes)]
+
+    def add(self, device):
+        """注册设备，已存在时返回 False；调用方可先持有 membership 以组合其他操作"""
+        with self.membership:
+            if device.id in self._devices:
+                return False
+            self._devices[device.id] = device
+            self._snapshot_stale = True
+            return True
+
+    def load(self, devices):
+        """批量注册 {device_id: Device}（从快照恢复），已存在的设备被覆盖"""
+        with self.membership:
+            self._devices.update(devices)
+            self._snapshot_stale = True
+
+    def remove(self, device_id):
+        """删除设备，返回被删除的 Device 或 None"""
+        with self.membership:
+            device = self._devices.pop(device_id, None)
+            if device is not None:
+                self._snapshot_stale = True
+            return device
+
+    def snapshot(self):
+        """当前成员的只读快照；成员没有变化时复用同一份"""
+        if self._snapshot_stale:
+            with self.membership:
+                if self._snapshot_stale:
+                    self._snapshot = dict(self._devices)
+                    self._snapshot_stale = False
+        return self._snapshot
+
+    def clear(self):
+        with self.membership:
+            self._devices.clear()
+            self._snapshot_stale = True
+
+    def __contains__(self, device_id):
+        return device_id in self._devices
+
+    def __getitem__(self, device_id):
+        return self._devices[device_id]
+
+    def get(self, device_id, default=None):
+        return self._devices.get(device_id, default)
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def keys(self):
+        return self.snapshot().keys()
+
+    def items(self):
+        return self.snapshot().items()
+
+    def values(self):
+        return self.snapshot().values()
@@ -0,0 +1,87 @@
+"""
+设备接口的预序列化响应缓存
+
+每个设备缓存一份编码好的 JSON，设备列表缓存拼接好的响应体。
+设备变更时只标记为脏，读取时重新编码脏设备，列表按需重新拼接，
+没有变更时读取只是返回同一份 bytes。
+"""
+import threading
+
+
+class DeviceResponseCache:
+
+    def __init__(self, encode, snapshot_fn, device_ids_fn):
+        """
+        encode(obj): 编码为 JSON 字符串
+        snapshot_fn(device_id): 设备完整信息，设备不存在时返回 None
+        device_ids_fn(): 按列表顺序返回所有设备ID
+        """
+        self.encode = encode
+        self.snapshot_fn = snapshot_fn
+        self.device_ids_fn = device_ids_fn
+        self._bodies = None
+        self._list_body = None
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def mark_dirty(self, device_id):
+        with self._lock:
+            self._dirty.add(device_id)
+            self._list_body = None
+
+    def mark_all_dirty(self):
+        """设备被整批替换（如从快照恢复），下次读取时全部重新编码"""
+        with self._lock:
+            self._bodies = None
+            self._list_body = None
+            self._dirty.clear()
+
+    def _encode(self, device_id):
+        info = self.snapshot_fn(device_id)
+        if info is None:
+            return None
+        return self.encode(info).encode('utf-8')
+
+    def _flush(self):
+        """重新编码脏设备；设备增删时按设备顺序重建索引。需持有锁"""
+        if self._bodies is None:
+            self._bodies = {device_id: self._encode(device_id) for device_id in self.device_ids_fn()}
+            self._dirty.clear()
+            return
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        membership_changed = False
+        for device_id in dirty:
+            body = self._encode(device_id)
+            if body is None or device_id not in self._bodies:
+                membership_changed = True
+            if body is None:
+                self._bodies.pop(device_id, None)
+            else:
+                self._bodies[device_id] = body
+        if membership_changed:
+            bodies = self._bodies
+            self._bodies = {device_id: bodies.get(device_id) or self._encode(device_id)
+                            for device_id in self.device_ids_fn()}
+
+    def device_body(self, device_id):
+        """单个设备的 JSON bytes，设备不存在时返回 None"""
+        with self._lock:
+            self._flush()
+            return self._bodies.get(device_id)
+
+    def bodies(self, device_ids):
+        """多个设备的 JSON bytes，跳过不存在的设备"""
+        with self._lock:
+            self._flush()
+            bodies = self._bodies
+            return [body for body in map(bodies.get, device_ids) if body is not None]
+
+    def list_body(self):
+        """全部设备列表的 JSON bytes"""
+        with self._lock:
+            if self._list_body is None:
+                self._flush()
+                self._list_body = b'[' + b','.join(b for b in self._bodies.values() if b is not None) + b']\n'
+            return self._list_body
@@ -0,0 +1,213 @@
+"""
+按分钟、按小时的增量聚合 (min/max/mean/count)
+
+每个设备、每种粒度有一个正在累加的开放桶，收到数据时 O(1) 更新；
+数据跨过桶的时间边界（或查询时发现开放桶已到期）时封存进预分配的
+NumPy 环形缓冲区，写满后覆盖最旧的桶，内存与运行时长无关。
+没有数据的时间段不占用桶。
+"""
+import threading
+
+import numpy as np
+
+from sensor_store import FIELDS
+FIELD_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+# 粒度名称 -> 桶宽（秒）
+RESOLUTIONS = {'minute': 60, 'hour': 3600}
+# 每种粒度保留的桶数：分钟桶 2 小时，小时桶 2 天
+DEFAULT_RETENTION = {'minute': 120, 'hour': 48}
+
+_INF = float('inf')
+
+
+class RollupSeries:
+    """单个设备单一粒度的聚合：开放桶 + 已封存桶的环形缓冲区（每桶 128 字节）"""
+
+    def __init__(self, width, capacity):
+        self.width = width
+        self.capacity = capacity
+        self.starts = np.zeros(capacity, dtype=np.float64)
+        self.counts = np.zeros((capacity, len(FIELDS)), dtype=np.int32)
+        self.sums = np.zeros((capacity, len(FIELDS)), dtype=np.float64)
+        self.mins = np.zeros((capacity, len(FIELDS)), dtype=np.float32)
+        self.maxs = np.zeros((capacity, len(FIELDS)), dtype=np.float32)
+        self.head = 0   # 下一次封存的位置
+        self.size = 0
+        self.open_start = None
+        self._reset_open()
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.counts.nbytes + self.sums.nbytes + self.mins.nbytes + self.maxs.nbytes
+
+    def _reset_open(self):
+        n = len(FIELDS)
+        self._count = [0] * n
+        self._sum = [0.0] * n
+        self._min = [_INF] * n
+        self._max = [-_INF] * n
+
+    def add(self, timestamp, items):
+        """累加一帧，items 为 (字段序号, 值) 列表"""
+        start = timestamp - timestamp % self.width
+        if self.open_start != start:
+            if self.open_start is not None and start < self.open_start:
+                self._add_late(start, items)
+                return
+            self.seal()
+            self.open_start = start
+        count, total, low, high = self._count, self._sum, self._min, self._max
+        for i, value in items:
+            count[i] += 1
+            total[i] += value
+            if value < low[i]:
+                low[i] = value
+            if value > high[i]:
+                high[i] = value
+
+    def _add_late(self, start, items):
+        """乱序到达、属于上一个已封存桶的数据直接并入该桶，更早的丢弃"""
+        if not self.size:
+            return
+        row = (self.head - 1) % self.capacity
+        if self.starts[row] != start:
+            return
+        for i, value in items:
+            self.counts[row, i] += 1
+            self.sums[row, i] += value
+            self.mins[row, i] = min(self.mins[row, i], value)
+            self.maxs[row, i] = max(self.maxs[row, i], value)
+
+    def seal(self):
+        """把开放桶写入环形缓冲区"""
+        if self.open_start is None:
+            return
+        row = self.head
+        self.starts[row] = self.open_start
+        self.counts[row] = self._count
+        self.sums[row] = self._sum
+        self.mins[row] = self._min
+        self.maxs[row] = self._max
+        self.head = (row + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        self.open_start = None
+        self._reset_open()
+
+    def seal_expired(self, now):
+        """开放桶的时间段已经结束时封存"""
+        if self.open_start is not None and now >= self.open_start + self.width:
+            self.seal()
+
+    def snapshot(self):
+        """按时间顺序返回已封存桶与开放桶的 (starts, counts, sums, mins, maxs) 副本"""
+        if self.size < self.capacity:
+            order = np.arange(self.size)
+        else:
+            order = np.roll(np.arange(self.capacity), -self.head)
+        starts, counts, sums = self.starts[order], self.counts[order], self.sums[order]
+        mins, maxs = self.mins[order], self.maxs[order]
+        if self.open_start is not None:
+            starts = np.append(starts, self.open_start)
+            counts = np.vstack([counts, np.array(self._count, dtype=np.int32)])
+            sums = np.vstack([sums, self._sum])
+            mins = np.vstack([mins, self._min])
+            maxs = np.vstack([maxs, self._max])
+        return starts, counts, sums, mins, maxs
+
+
+class DeviceRollups:
+    """单个设备所有粒度的聚合，共用一把锁"""
+
+    def __init__(self, retention):
+        self.series = {name: RollupSeries(RESOLUTIONS[name], capacity) for name, capacity in retention.items()}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return sum(series.nbytes for series in self.series.values())
+
+    def add(self, timestamp, items):
+        with self._lock:
+            for series in self.series.values():
+                series.add(timestamp, items)
+
+    def snapshot(self, resolution, now):
+        with self._lock:
+            series = self.series[resolution]
+            series.seal_expired(now)
+            return series.snapshot(), series.open_start
+
+
+class RollupStore:
+    """所有设备的聚合，缓冲区在设备首次上报数据时分配"""
+
+    def __init__(self, retention=None):
+        self.retention = dict(DEFAULT_RETENTION if retention is None else retention)
+        unknown = set(self.retention) - set(RESOLUTIONS)
+        if unknown:
+            raise ValueError(f"Unknown resolutions: {', '.join(sorted(unknown))}")
+        self._rollups = {}
+        self._lock = threading.Lock()
+
+    def record(self, device_id, timestamp, updates):
+        """累加一帧，updates 为本帧解析出的 {字段名: 值}"""
+        rollups = self._rollups.get(device_id)
+        if rollups is None:
+            with self._lock:
+                rollups = self._rollups.setdefault(device_id, DeviceRollups(self.retention))
+        rollups.add(timestamp, [(FIELD_INDEX[name], value) for name, value in updates.items()])
+
+    def get(self, device_id):
+        return self._rollups.get(device_id)
+
+    def remove(self, device_id):
+        with self._lock:
+            self._rollups.pop(device_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._rollups.clear()
+
+    def query(self, device_id, resolution, now, start=None, end=None, fields=FIELDS):
+        """
+        查询设备聚合，返回 (开放桶起始时间或 None, 各桶起始毫秒时间戳, 各字段结果)
+        每个字段返回 {'count': [...], 'min': [...], 'max': [...], 'mean': [...]}，桶内没有该字段时为 null
+        """
+        rollups = self._rollups.get(device_id)
+        if rollups is None:
+            return None, [], {name: {'count': [], 'min': [], 'max': [], 'mean': []} for name in fields}
+
+        (starts, counts, sums, mins, maxs), open_start = rollups.snapshot(resolution, now)
+        mask = np.ones(len(starts), dtype=bool)
+        if start is not None:
+            # 与查询范围有重叠的桶都返回
+            mask &= starts + RESOLUTIONS[resolution] > start
+        if end is not None:
+            mask &= starts <= end
+        starts, counts, sums, mins, maxs = starts[mask], counts[mask], sums[mask], mins[mask], maxs[mask]
+
+        series = {}
+        for name in fields:
+            i = FIELD_INDEX[name]
+            count = counts[:, i]
+            empty = count == 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = sums[:, i] / count
+            series[name] = {
+                'count': count.tolist(),
+                'min': _with_nulls(mins[:, i], empty),
+                'max': _with_nulls(maxs[:, i], empty),
+                'mean': _with_nulls(mean, empty),
+            }
+        t = np.round(starts * 1000).astype(np.int64).tolist()
+        return open_start, t, series
+
+
+def _with_nulls(values, empty):
+    result = np.round(values.astype(np.float64), 2).tolist()
+    if empty.any():
+        for i in np.flatnonzero(empty).tolist():
+            result[i] = None
+    return result
@@ -0,0 +1,181 @@
+"""
+STM32 传感器文本帧解析引擎
+
+基于预编译字段表的单遍解析，不做任何逐字段日志输出。
+解析结果与原 backend.parse_sensor_data 中的逐行 startswith/split 链完全一致：
+    "stm32/1 Temperature1: 22.10 C, Humidity1: 16.10 %\nTemperature2: 21.80 C, Humidity2: 23.40 %\nRelay Status: 1\nPB8 Level: 1"
+"""
+import json
+
+# 字段表: 标签 -> (sensor_data 键, 类型, 单位)
+# 单位仅作说明，解析时与原实现一样不做校验
+FIELD_TABLE = {
+    'Temperature1': ('temperature1', float, 'C'),
+    'Humidity1': ('humidity1', float, '%'),
+    'Temperature2': ('temperature2', float, 'C'),
+    'Humidity2': ('humidity2', float, '%'),
+    'Relay Status': ('relay_status', int, None),
+    'PB8 Level': ('pb8_level', int, None),
+}
+
+# 复合行: 同一行内同时出现两个标签时按 ", " 拆分，且只接受这两个字段
+COMPOUND_GROUPS = (
+    ('Temperature1:', 'Humidity1:', frozenset(('Temperature1', 'Humidity1'))),
+    ('Temperature2:', 'Humidity2:', frozenset(('Temperature2', 'Humidity2'))),
+)
+
+DEFAULT_DEVICE_ID = 'default'
+
+
+def _split_lines(payload_str):
+    """按 \\r\\n、\\r、\\n 分行并丢弃空白行，等价于 re.split(r'\\r?\\n|\\r', ...)"""
+    if '\r' in payload_str:
+        payload_str = payload_str.replace('\r\n', '\n').replace('\r', '\n')
+    return [line for line in payload_str.split('\n') if line.strip()]
+
+
+def _convert(field, rest):
+    """按字段类型转换冒号后的文本，失败返回 None"""
+    key, kind, _unit = field
+    try:
+        if kind is float:
+            # "22.10 C" -> 22.10
+            return key, float(rest.strip().split(' ')[0])
+        return key, kind(rest.strip())
+    except ValueError:
+        return None
+
+
+def parse_device_id(first_line):
+    """从第一行提取设备ID，"stm32/1 Temperature1:..." -> "stm32_1" """
+    space_index = first_line.find(' ')
+    if space_index == -1:
+        return DEFAULT_DEVICE_ID
+    return first_line[:space_index].replace('/', '_')
+
+
+def _parse_lines(lines, errors):
+    """按字段表解析已分好的行，返回 {sensor_data 键: 值}"""
+    updates = {}
+    fields = FIELD_TABLE
+
+    for line in lines:
+        line = line.strip()
+
+        for first, second, allowed in COMPOUND_GROUPS:
+            if first in line and second in line:
+                # 复合行，例如 "Temperature1: 22.10 C, Humidity1: 16.10 %"
+                for part in line.split(', '):
+                    label, sep, rest = part.strip().partition(':')
+                    if sep and label in allowed:
+                        result = _convert(fields[label], rest)
+                        if result is not None:
+                            updates[result[0]] = result[1]
+                        elif errors is not None:
+                            errors.append(fields[label][0])
+                break
+        else:
+            # 单值行，例如 "Relay Status: 1"
+            label, sep, rest = line.partition(':')
+            field = fields.get(label) if sep else None
+            if field is not None:
+                result = _convert(field, rest)
+                if result is not None:
+                    updates[result[0]] = result[1]
+                elif errors is not None:
+                    errors.append(field[0])
+
+    return updates
+
+
+def peek_device_id(payload_str):
+    """不解析字段，只取帧所属设备的ID，与 parse_payload 的结果一致；没有有效行时返回空字符串"""
+    end = payload_str.find('\n')
+    first = payload_str if end == -1 else payload_str[:end]
+    if first.strip() and '\r' not in first:
+        return parse_device_id(first)
+    lines = _split_lines(payload_str)
+    return parse_device_id(lines[0]) if lines else ''
+
+
+# 可选的帧序号行，例如 "Seq: 42"；不是字段，解析字段时被忽略
+SEQUENCE_LABEL = 'Seq:'
+
+
+def peek_sequence(payload_str):
+    """不解析字段，只取帧中 "Seq: <n>" 行给出的序号，没有或不是非负整数时返回 None"""
+    index = payload_str.find(SEQUENCE_LABEL)
+    if index == -1 or (index and payload_str[index - 1] not in '\r\n'):
+        return None
+    start = index + len(SEQUENCE_LABEL)
+    end = payload_str.find('\n', start)
+    value = payload_str[start:] if end == -1 else payload_str[start:end]
+    if '\r' in value:
+        value = value.split('\r', 1)[0]
+    value = value.strip()
+    return int(value) if value.isdigit() else None
+
+
+def parse_payload(payload_str, errors=None):
+    """
+    解析一帧传感器文本
+    返回 (device_id, updates)；没有任何有效行时返回 (None, None)
+    updates 为 {sensor_data 键: 值}，只包含成功解析的字段
+    传入 errors 列表时，数值转换失败的字段键会追加到其中
+    """
+    lines = _split_lines(payload_str)
+    if not lines:
+        return None, None
+    return parse_device_id(lines[0]), _parse_lines(lines, errors)
+
+
+# 解码器: 名称 -> decode(payload_str, errors=None)，返回 {sensor_data 键: 值}
+# 设备ID由主题路由给出（见 topic_router），解码器只解析字段
+DECODERS = {}
+
+
+def register_decoder(name):
+    """注册解码器的装饰器，同名的解码器会被替换"""
+    def decorator(decode):
+        DECODERS[name] = decode
+        return decode
+    return decorator
+
+
+@register_decoder('stm32_text')
+def parse_fields(payload_str, errors=None):
+    """STM32 文本帧，与 parse_payload 的字段结果一致"""
+    return _parse_lines(_split_lines(payload_str), errors)
+
+
+# JSON 键可以是 sensor_data 键或文本帧中的标签
+_JSON_FIELDS = {key: field for label, field in FIELD_TABLE.items() for key in (label, field[0])}
+
+
+@register_decoder('json')
+def parse_json(payload_str, errors=None):
+    """JSON 对象，例如 {"temperature1": 22.1, "Relay Status": 1}；不是对象时没有字段"""
+    try:
+        data = json.loads(payload_str)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    updates = {}
+    for key, value in data.items():
+        field = _JSON_FIELDS.get(key)
+        if field is None:
+            continue
+        if isinstance(value, str):
+            result = _convert(field, value)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            result = None
+        elif field[1] is int and value != int(value):
+            result = None
+        else:
+            result = field[0], field[1](value)
+        if result is not None:
+            updates[result[0]] = result[1]
+        elif errors is not None:
+            errors.append(field[0])
+    return updates
@@ -0,0 +1,146 @@
+"""
+传感器最新数据的列式存储
+
+每个设备分配一个槽位号，各字段存放在按槽位索引的 array 列中，
+时间戳保存为秒级浮点数，只在序列化时格式化为 ISO 字符串。
+删除设备后槽位回收复用。
+
+每台设备的内存占用（64位 CPython）：
+- 数据列: 5 x float64 + 2 x int64 = 56 字节
+- 设备ID -> 槽位 的字典项约 100 字节（与设备ID字符串共享）
+原先每台设备一个 7 键字典加 ISO 时间戳字符串，约 530 字节。
+连同 Device 的测量结果见 benchmarks/bench_memory.py。
+"""
+from array import array
+from datetime import datetime
+
+FLOAT_FIELDS = ('temperature1', 'humidity1', 'temperature2', 'humidity2')
+INT_FIELDS = ('relay_status', 'pb8_level')
+# 与 API 返回的 current_data 字段顺序一致
+FIELDS = FLOAT_FIELDS + INT_FIELDS
+
+_NO_TIMESTAMP = float('nan')
+
+
+def format_timestamp(ts):
+    """秒级时间戳格式化为 ISO 字符串，None/NaN 返回 None"""
+    if ts is None or ts != ts:
+        return None
+    return datetime.fromtimestamp(ts).isoformat()
+
+
+class SensorStore:
+    """按设备槽位索引的最新传感器数据，读取接口与原 sensor_data 字典一致"""
+
+    def __init__(self):
+        self._slots = {}
+        self._free = []
+        self._columns = {name: array('d') for name in FLOAT_FIELDS}
+        self._columns.update({name: array('q') for name in INT_FIELDS})
+        self._timestamps = array('d')
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, device_id):
+        return device_id in self._slots
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def keys(self):
+        return self._slots.keys()
+
+    def items(self):
+        for device_id in list(self._slots):
+            data = self.get(device_id)
+            if data is not None:
+                yield device_id, data
+
+    def __getitem__(self, device_id):
+        data = self.get(device_id)
+        if data is None:
+            raise KeyError(device_id)
+        return data
+
+    def __delitem__(self, device_id):
+        slot = self._slots.pop(device_id)
+        self._free.append(slot)
+
+    def clear(self):
+        self.__init__()
+
+    def load(self, device_ids, columns, timestamps):
+        """
+        整列装入数据（从快照恢复），只能在存储为空时调用
+        columns 为 {字段名: 与 device_ids 等长的连续数值缓冲区}，timestamps 同理
+        """
+        if self._slots:
+            raise ValueError("SensorStore.load requires an empty store")
+        for name, column in self._columns.items():
+            column.frombytes(memoryview(columns[name]).cast('B'))
+        self._timestamps.frombytes(memoryview(timestamps).cast('B'))
+        self._slots = dict(zip(device_ids, range(len(device_ids))))
+        if not len(self._timestamps) == len(self._slots):
+            self.clear()
+            raise ValueError("column length does not match number of devices")
+
+    def allocate(self, device_id):
+        """为新设备分配槽位并置为默认值"""
+        slot = self._slots.get(device_id)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._timestamps)
+            for column in self._columns.values():
+                column.append(0)
+            self._timestamps.append(_NO_TIMESTAMP)
+        self._slots[device_id] = slot
+        self._reset_slot(slot, _NO_TIMESTAMP)
+        return slot
+
+    def _reset_slot(self, slot, timestamp):
+        for column in self._columns.values():
+            column[slot] = 0
+        self._timestamps[slot] = timestamp
+
+    def write(self, device_id, updates, timestamp):
+        """写入解析得到的字段并更新时间戳"""
+        slot = self._slots[device_id]
+        columns = self._columns
+        for name, value in updates.items():
+            columns[name][slot] = value
+        self._timestamps[slot] = timestamp
+
+    def reset(self, device_id, timestamp):
+        """数据过期：所有字段清零，时间戳记为过期时间"""
+        slot = self._slots.get(device_id)
+        if slot is not None:
+            self._reset_slot(slot, timestamp)
+
+    def timestamp(self, device_id):
+        """最后一次数据的秒级时间戳，没有数据时为 NaN"""
+        return self._timestamps[self._slots[device_id]]
+
+    def values(self, device_id):
+        """按 FIELDS 顺序返回各字段值"""
+        slot = self._slots[device_id]
+        columns = self._columns
+        return [columns[name][slot] for name in FIELDS]
+
+    def get(self, device_id, default=None):
+        """序列化为原 sensor_data 中的字典格式"""
+        slot = self._slots.get(device_id)
+        if slot is None:
+            return default
+        columns = self._columns
+        data = {name: columns[name][slot] for name in FIELDS}
+        data['timestamp'] = format_timestamp(self._timestamps[slot])
+        return data
+
+    def nbytes(self):
+        """数据列占用的字节数"""
+        return sum(c.itemsize * len(c) for c in self._columns.values()) + \
+            self._timestamps.itemsize * len(self._timestamps)
@@ -0,0 +1,319 @@
+"""
+生产环境的异步服务入口
+
+asyncio 负责连接管理和 HTTP/1.1 解析（支持 keep-alive），
+Flask 应用在有界线程池中执行，事件循环本身不会被请求处理阻塞。
+事件流 (text/event-stream) 响应在单独的线程池中逐块读取，不占用普通请求的工作线程。
+
+运行: python server.py --workers 8 --max-connections 1000
+或安装后使用命令 mqtt-sensor-backend
+"""
+import argparse
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import dedupe
+import commands
+import ingest_shards
+import persistence
+import snapshot
+from app_logging import get_logger, setup_logging
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+logger = get_logger('server')
+
+_REASONS = {
+    200: 'OK', 204: 'No Content', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+    408: 'Request Timeout', 411: 'Length Required', 413: 'Payload Too Large',
+    431: 'Request Header Fields Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class AsyncWSGIServer:
+    """在 asyncio 上运行 WSGI 应用"""
+
+    def __init__(self, app, host='0.0.0.0', port=5002, workers=8, max_connections=1000,
+                 max_streams=100, keepalive_timeout=15):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http-worker')
+        self.stream_executor = ThreadPoolExecutor(max_workers=max_streams, thread_name_prefix='http-stream')
+        self._stream_slots = None
+        self._max_streams = max_streams
+        self._connections = 0
+        self._server = None
+
+    async def start(self):
+        self._stream_slots = asyncio.Semaphore(self._max_streams)
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, limit=MAX_HEADER_BYTES)
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self.executor.shutdown(wait=False)
+        self.stream_executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        # 超过连接上限时直接返回 503 并关闭
+        if self._connections >= self.max_connections:
+            await self._write_simple(writer, 503, keep_alive=False)
+            writer.close()
+            return
+        self._connections += 1
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), self.keepalive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HTTPError as e:
+                    await self._write_simple(writer, e.status, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self._respond(request, writer)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections -= 1
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+        lines = head[:-4].decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(400)
+        headers = []
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise HTTPError(400)
+            headers.append((name.strip().lower(), value.strip()))
+        header_map = dict(headers)
+
+        if header_map.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked(reader)
+        else:
+            length = header_map.get('content-length')
+            try:
+                length = int(length) if length else 0
+            except ValueError:
+                raise HTTPError(400)
+            if length > MAX_BODY_BYTES:
+                raise HTTPError(413)
+            body = await reader.readexactly(length) if length else b''
+        return method, target, version, headers, header_map, body
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        total = 0
+        while True:
+            size_line = await reader.readuntil(b'\r\n')
+            try:
+                size = int(size_line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise HTTPError(400)
+            if size == 0:
+                # 跳过 trailer
+                while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                    pass
+                return b''.join(chunks)
+            total += size
+            if total > MAX_BODY_BYTES:
+                raise HTTPError(413)
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    def _environ(self, method, target, version, headers, body):
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'CONTENT_LENGTH': str(len(body)),
+        }
+        # 请求体已读取为完整内容，分块传输头不再传给应用
+        for name, value in headers:
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+            elif name not in ('content-length', 'transfer-encoding'):
+                key = 'HTTP_' + name.upper().replace('-', '_')
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+    def _call_app(self, environ):
+        """在工作线程中调用应用，普通响应在线程内读完；事件流返回迭代器"""
+        status_headers = []
+
+        def start_response(status, response_headers, exc_info=None):
+            status_headers[:] = [status, response_headers]
+
+        result = self.app(environ, start_response)
+        status, response_headers = status_headers
+        if any(k.lower() == 'content-type' and v.startswith('text/event-stream') for k, v in response_headers):
+            return status, response_headers, None, result
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return status, response_headers, body, None
+
+    async def _respond(self, request, writer):
+        method, target, version, headers, header_map, body = request
+        connection = header_map.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+        loop = asyncio.get_running_loop()
+        environ = self._environ(method, target, version, headers, body)
+        try:
+            status, response_headers, body, stream = await loop.run_in_executor(self.executor, self._call_app, environ)
+        except Exception:
+            logger.exception("❌ 处理请求出错")
+            await self._write_simple(writer, 500, keep_alive=False)
+            return False
+
+        head = [f"{version if version == 'HTTP/1.0' else 'HTTP/1.1'} {status}\r\n"]
+        for name, value in response_headers:
+            if name.lower() not in ('connection', 'transfer-encoding', 'content-length'):
+                head.append(f"{name}: {value}\r\n")
+
+        if stream is None:
+            head.append(f"Content-Length: {len(body)}\r\n")
+            head.append(f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+            writer.write(''.join(head).encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+            return keep_alive
+
+        # 事件流：分块传输直到客户端断开
+        head.append("Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        writer.write(''.join(head).encode('latin-1'))
+        async with self._stream_slots:
+            iterator = iter(stream)
+            try:
+                while True:
+                    chunk = await loop.run_in_executor(self.stream_executor, next, iterator, None)
+                    if chunk is None:
+                        break
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    if chunk:
+                        writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                        await writer.drain()
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                if hasattr(stream, 'close'):
+                    await loop.run_in_executor(self.stream_executor, stream.close)
+        return False
+
+    async def _write_simple(self, writer, status, keep_alive):
+        reason = _REASONS.get(status, '')
+        body = f"{status} {reason}".encode()
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='传感器数据后端服务（生产模式）')
+    parser.add_argument('--host', default='0.0.0.0', help='监听地址')
+    parser.add_argument('--port', type=int, default=5002, help='监听端口')
+    parser.add_argument('--workers', type=int, default=8, help='处理请求的工作线程数')
+    parser.add_argument('--max-connections', type=int, default=1000, help='最大并发连接数，超出时返回 503')
+    parser.add_argument('--max-streams', type=int, default=100, help='最大并发推送流（/api/stream）数')
+    parser.add_argument('--keepalive-timeout', type=float, default=15, help='空闲 keep-alive 连接的超时时间（秒）')
+    parser.add_argument('--mqtt', action='store_true',
+                        help='内嵌MQTT订阅，直接从代理接入数据，无需运行 mqtt_bridge.py')
+    parser.add_argument('--log-level', default=None,
+                        help='日志级别 (DEBUG/INFO/WARNING/ERROR)，默认取环境变量 LOG_LEVEL 或 INFO')
+    persistence.add_arguments(parser)
+    snapshot.add_arguments(parser)
+    ingest_shards.add_arguments(parser)
+    dedupe.add_arguments(parser)
+    commands.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    setup_logging(args.log_level)
+
+    import backend
+    backend.load_topic_routes()
+    backend.start_persistence_from_args(args)
+    backend.start_expiration_checker()
+    if args.dedupe:
+        backend.start_dedupe(args.dedupe_window, args.dedupe_frames)
+    if args.ingest_workers:
+        backend.start_ingest_workers(args.ingest_workers, args.ingest_slots)
+    if args.mqtt:
+        backend.start_mqtt_ingest()
+    if args.commands:
+        backend.start_commands(args.command_window, args.command_timeout)
+
+    server = AsyncWSGIServer(
+        backend.app, host=args.host, port=args.port, workers=args.workers,
+        max_connections=args.max_connections, max_streams=args.max_streams,
+        keepalive_timeout=args.keepalive_timeout)
+    logger.info("🚀 后端服务已启动: http://%s:%s (工作线程 %s, 最大连接 %s)",
+                args.host, args.port, args.workers, args.max_connections)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,12 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/yourusername/mqtt-emqx-python-client",
     packages=find_packages(),
+    py_modules=[
+        "main", "backend", "server", "sensor_parser", "batch_codec", "history", "expiry",
+        "stream", "change_tracker", "response_cache", "sensor_store", "registry", "device_index", "alerts",
+        "mqtt_ingest", "forwarder", "app_logging", "metrics", "persistence", "snapshot", "rollup",
+        "ingest_shards", "topic_router", "binary_frame", "dedupe", "commands",
+    ],
     classifiers=[
         "Development Status :: 4 - Beta",
         "Intended Audience :: Developers",
@@ -27,10 +33,15 @@ setup(
     python_requires=">=3.7",
     install_requires=[
         "paho-mqtt>=1.6.0",
+        "flask>=2.3",
+        "flask-cors>=4.0",
+        "requests>=2.31",
+        "numpy>=1.21",
     ],
     entry_points={
         "console_scripts": [
             "mqtt-emqx-client=main:run_client",
+            "mqtt-sensor-backend=server:main",
         ],
     },
 )
\ No newline at end of file
@@ -0,0 +1,331 @@
+"""
+设备注册表快照与变更日志，用于快速重启
+
+快照为固定布局的二进制文件，启动时 mmap 后直接按列读取，不逐行解析：
+    头部 | 定长记录数组 | 设备ID表 (JSON 数组) | 元数据区 (每台设备一段 JSON)
+定长记录包含时间、状态和最新数据，可以整列装入 SensorStore；
+名称、位置等元数据只记录偏移，设备第一次被访问时才解码。
+
+快照之后的变更追加写入变更日志 (<快照路径>.journal)，启动时按顺序重放。
+日志记录都是完整状态（设备信息、最新数据、删除），重复重放结果不变，
+因此生成快照时先切换日志文件再读取内存，快照与新日志合起来总是完整的。
+"""
+import json
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+from app_logging import get_logger
+from sensor_store import FLOAT_FIELDS, INT_FIELDS
+
+logger = get_logger('snapshot')
+
+MAGIC = b'SNAP'
+# 版本 1 的设备ID表按换行分隔，ID 中含换行时会错位；版本 2 改为 JSON 数组，仍可读取版本 1
+VERSION = 2
+_READABLE_VERSIONS = (1, VERSION)
+DEFAULT_INTERVAL = 300
+DEFAULT_JOURNAL_FLUSH_INTERVAL = 0.5
+
+# 魔数, 版本, 设备数, 记录区偏移, ID表偏移, ID表长度, 元数据区偏移, 元数据区长度, 生成时间
+_HEADER = struct.Struct('<4sIQQQQQQd')
+
+# 设备状态编码
+STATUSES = ('offline', 'online')
+_STATUS_CODE = {status: code for code, status in enumerate(STATUSES)}
+
+RECORD_DTYPE = np.dtype(
+    [('created_at', '<f8'), ('last_active_at', '<f8'), ('timestamp', '<f8')]
+    + [(name, '<f8') for name in FLOAT_FIELDS]
+    + [(name, '<i8') for name in INT_FIELDS]
+    + [('status', 'u1'), ('meta_offset', '<u8'), ('meta_len', '<u4')]
+)
+
+_NAN = float('nan')
+
+
+def _or_nan(value):
+    return _NAN if value is None else value
+
+
+def encode_meta(name, protocol, location, properties):
+    return json.dumps([name, protocol, location, properties], ensure_ascii=False).encode('utf-8')
+
+
+def decode_meta(data):
+    """返回 (name, protocol, location, properties)"""
+    return json.loads(data)
+
+
+def write_snapshot(path, entries):
+    """
+    原子地写入快照（先写临时文件再替换）
+    entries: 可迭代的 (device_id, 元数据 bytes, created_at, last_active_at, status, timestamp, values)
+    values 按 sensor_store.FIELDS 顺序；返回写入的设备数
+    """
+    ids = []
+    metas = []
+    rows = []
+    offset = 0
+    for device_id, meta, created_at, last_active_at, status, timestamp, values in entries:
+        ids.append(device_id)
+        metas.append(meta)
+        rows.append((created_at, _or_nan(last_active_at), _or_nan(timestamp), *values,
+                     _STATUS_CODE.get(status, 0), offset, len(meta)))
+        offset += len(meta)
+
+    records = np.array(rows, dtype=RECORD_DTYPE) if rows else np.zeros(0, dtype=RECORD_DTYPE)
+    id_blob = json.dumps(ids, ensure_ascii=False).encode('utf-8')
+    meta_blob = b''.join(metas)
+
+    records_offset = _HEADER.size
+    ids_offset = records_offset + records.nbytes
+    meta_offset = ids_offset + len(id_blob)
+    header = _HEADER.pack(MAGIC, VERSION, len(ids), records_offset, ids_offset, len(id_blob),
+                          meta_offset, len(meta_blob), time.time())
+
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        f.write(records.tobytes())
+        f.write(id_blob)
+        f.write(meta_blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(ids)
+
+
+class Snapshot:
+    """mmap 打开的快照，记录数组直接引用映射内存"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, count, records_offset, ids_offset, ids_len,
+         meta_offset, meta_len, created) = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version not in _READABLE_VERSIONS:
+            raise ValueError(f"Not a snapshot file or unsupported version: {path}")
+        self.created = created
+        self.records = np.frombuffer(self._mmap, dtype=RECORD_DTYPE, count=count, offset=records_offset)
+        id_blob = self._mmap[ids_offset:ids_offset + ids_len].decode('utf-8')
+        if not count:
+            self.ids = []
+        elif version == 1:
+            self.ids = id_blob.split('\n')
+        else:
+            self.ids = json.loads(id_blob)
+        if len(self.ids) != count:
+            raise ValueError(f"Snapshot device id table does not match its records: {path}")
+        self._meta_offset = meta_offset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def meta(self, index):
+        """第 index 台设备的 (name, protocol, location, properties)"""
+        return decode_meta(self.meta_bytes(index))
+
+    def meta_bytes(self, index):
+        record = self.records[index]
+        start = self._meta_offset + int(record['meta_offset'])
+        return self._mmap[start:start + int(record['meta_len'])]
+
+    def column(self, name):
+        """某一列的连续副本"""
+        return np.ascontiguousarray(self.records[name])
+
+    def statuses(self):
+        return [STATUSES[code] for code in self.records['status'].tolist()]
+
+
+# ---- 变更日志 ----
+
+# 记录头: 类型, 载荷长度
+_RECORD_HEADER = struct.Struct('<cI')
+# 最新数据: 状态, last_active_at, timestamp, 各字段值
+_LATEST = struct.Struct('<Bdd' + 'd' * len(FLOAT_FIELDS) + 'q' * len(INT_FIELDS))
+
+_KIND_DEVICE = b'D'
+_KIND_DELETE = b'X'
+_KIND_LATEST = b'L'
+
+_ROTATE = 0
+_FLUSH = 1
+_STOP = object()
+
+
+def journal_paths(snapshot_path):
+    """(当前日志, 生成快照期间切换出的旧日志)"""
+    journal = f'{snapshot_path}.journal'
+    return journal, f'{journal}.old'
+
+
+class Journal:
+    """
+    快照之后的变更日志，写入方法与 persistence.WriteBehindStore 一致，只入队不等待磁盘
+    后台线程每 flush_interval 秒把攒下的记录一次写入文件，fsync 为真时随后 fsync
+    """
+
+    def __init__(self, snapshot_path, flush_interval=DEFAULT_JOURNAL_FLUSH_INTERVAL, fsync=False):
+        self.path, self.old_path = journal_paths(snapshot_path)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._queue = queue.SimpleQueue()
+        self._file = open(self.path, 'ab')
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='snapshot-journal', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self, timeout=10):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+        self._file.close()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    # ---- 接入路径调用 ----
+
+    def save_device(self, device):
+        meta = encode_meta(device.name, device.protocol, device.location, device.properties)
+        payload = json.dumps([device.id, device.created_at]).encode('utf-8') + b'\n' + meta
+        self._queue.put(_record(_KIND_DEVICE, payload))
+
+    def delete_device(self, device_id):
+        self._queue.put(_record(_KIND_DELETE, device_id.encode('utf-8')))
+
+    def save_latest(self, device_id, status, last_active_at, timestamp, values):
+        payload = _LATEST.pack(_STATUS_CODE.get(status, 0), _or_nan(last_active_at), _or_nan(timestamp), *values)
+        self._queue.put(_record(_KIND_LATEST, payload + device_id.encode('utf-8')))
+
+    def save_frame(self, device_id, last_active_at, timestamp, values):
+        self.save_latest(device_id, 'online', last_active_at, timestamp, values)
+
+    def flush(self, timeout=10):
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def rotate(self, timeout=10):
+        """切换到新的日志文件，此前的记录移入旧日志；返回是否完成"""
+        done = threading.Event()
+        self._queue.put((_ROTATE, done))
+        return done.wait(timeout)
+
+    def discard_old(self):
+        """新快照已写入，旧日志中的变更都已包含在快照里"""
+        try:
+            os.remove(self.old_path)
+        except FileNotFoundError:
+            pass
+
+    # ---- 后台线程 ----
+
+    def _run(self):
+        while True:
+            chunks = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP or isinstance(item, tuple):
+                    break
+                chunks.append(item)
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+                    break
+            self._write(chunks)
+            if item is _STOP:
+                return
+            if isinstance(item, tuple):
+                action, done = item
+                if action == _ROTATE:
+                    self._rotate()
+                done.set()
+
+    def _write(self, chunks):
+        if not chunks:
+            return
+        try:
+            self._file.write(b''.join(chunks))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError:
+            logger.exception("写入快照变更日志失败，丢弃 %s 条记录", len(chunks))
+
+    def _rotate(self):
+        self._file.close()
+        if os.path.exists(self.old_path):
+            # 上一次快照没有完成，旧日志还需要保留，把当前日志接在后面
+            with open(self.old_path, 'ab') as old, open(self.path, 'rb') as current:
+                old.write(current.read())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, self.old_path)
+        self._file = open(self.path, 'ab')
+
+
+def _record(kind, payload):
+    return _RECORD_HEADER.pack(kind, len(payload)) + payload
+
+
+def read_journal(path):
+    """
+    按顺序读取日志，产生以下记录:
+        ('device', device_id, created_at, 元数据 bytes)
+        ('delete', device_id)
+        ('latest', device_id, status, last_active_at, timestamp, values)
+    末尾不完整的记录（写入时进程退出）被忽略
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    pos = 0
+    end = len(data)
+    while pos + _RECORD_HEADER.size <= end:
+        kind, length = _RECORD_HEADER.unpack_from(data, pos)
+        start = pos + _RECORD_HEADER.size
+        if start + length > end:
+            break
+        payload = data[start:start + length]
+        pos = start + length
+        if kind == _KIND_LATEST:
+            status, last_active_at, timestamp, *values = _LATEST.unpack_from(payload)
+            device_id = payload[_LATEST.size:].decode('utf-8')
+            yield ('latest', device_id, STATUSES[status],
+                   None if last_active_at != last_active_at else last_active_at, timestamp, values)
+        elif kind == _KIND_DEVICE:
+            head, _, meta = payload.partition(b'\n')
+            device_id, created_at = json.loads(head)
+            yield ('device', device_id, created_at, meta)
+        elif kind == _KIND_DELETE:
+            yield ('delete', payload.decode('utf-8'))
+        else:
+            logger.warning("快照变更日志 %s 中有未知记录类型 %r，停止重放", path, kind)
+            return
+
+
+def add_arguments(parser):
+    """backend.py 和 server.py 共用的命令行参数"""
+    parser.add_argument('--snapshot', default=None,
+                        help='快照文件路径，开启定期快照与变更日志，启动时优先从快照恢复 (默认取环境变量 SENSOR_SNAPSHOT)')
+    parser.add_argument('--snapshot-interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f'生成快照的间隔（秒），默认 {DEFAULT_INTERVAL}')
+    parser.add_argument('--journal-fsync', action='store_true',
+                        help='每次写入变更日志后 fsync')
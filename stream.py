@@ -0,0 +1,108 @@
+"""
+设备变更推送 (Server-Sent Events)
+
+解析器、过期检查和设备增删改只把设备ID标记为已变更，开销为一次集合插入；
+推送线程每个 tick 把本轮变更的设备各序列化一次，合并进每个客户端的待发送表，
+客户端无论积压多少次变更，每个 tick 最多收到一帧。
+"""
+import json
+import threading
+import time
+
+
+class Subscription:
+    """单个客户端的待发送变更，按设备ID合并"""
+
+    def __init__(self):
+        self._pending = {}
+        self._cond = threading.Condition()
+        self.closed = False
+
+    def push(self, delta):
+        with self._cond:
+            self._pending.update(delta)
+            self._cond.notify()
+
+    def wait(self, timeout):
+        """等待变更，超时返回空字典"""
+        with self._cond:
+            if not self._pending and not self.closed:
+                self._cond.wait(timeout)
+            delta, self._pending = self._pending, {}
+        return delta
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class StreamHub:
+    """收集设备变更并按 tick 推送给所有订阅者"""
+
+    def __init__(self, snapshot_fn, tick=0.5, heartbeat=15):
+        """
+        snapshot_fn(device_id): 返回设备当前的完整信息，设备已删除时返回 None
+        """
+        self.snapshot_fn = snapshot_fn
+        self.tick = tick
+        self.heartbeat = heartbeat
+        self._dirty = set()
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def publish(self, device_id):
+        """标记设备已变更；没有订阅者时什么也不做"""
+        if self._clients:
+            with self._lock:
+                self._dirty.add(device_id)
+
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            self._clients.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stream-hub", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._clients.discard(subscription)
+        subscription.close()
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                clients = list(self._clients)
+            if not dirty or not clients:
+                continue
+            delta = {device_id: self.snapshot_fn(device_id) for device_id in dirty}
+            for subscription in clients:
+                subscription.push(delta)
+
+    def events(self, subscription, initial):
+        """
+        生成 SSE 事件流: 先发送 snapshot 全量，之后每帧发送 update 增量
+        update 格式: {"devices": {设备ID: 设备信息}, "removed": [已删除的设备ID]}
+        """
+        try:
+            yield format_event('snapshot', initial)
+            while not subscription.closed:
+                delta = subscription.wait(self.heartbeat)
+                if not delta:
+                    # 心跳注释，防止代理断开空闲连接
+                    yield ': keepalive\n\n'
+                    continue
+                changed = {k: v for k, v in delta.items() if v is not None}
+                removed = [k for k, v in delta.items() if v is None]
+                yield format_event('update', {'devices': changed, 'removed': removed})
+        finally:
+            self.unsubscribe(subscription)
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
@@ -0,0 +1,196 @@
+"""
+按 MQTT 主题路由到设备ID和解码器
+
+路由表是由 MQTT 订阅过滤器（支持 + 和 # 通配符）组成的前缀树，每个主题层级一个节点。
+匹配时沿主题的各层逐层下行，同一层上精确匹配优先于 +，+ 优先于 #。
+匹配到的路由给出设备ID和解码器（见 sensor_parser.DECODERS），解码器只解析字段，不再从载荷中找设备ID。
+设备ID默认是把主题中的 / 换成 _，例如 stm32/1 -> stm32_1，与 "stm32/1 Temperature1: ..." 帧首给出的ID一致。
+匹配结果按主题缓存，稳定运行时每条消息只需要一次字典查找。
+没有匹配的主题，以及不带主题的 HTTP 上报，仍然用 sensor_parser.parse_payload 从载荷首行提取设备ID。
+二进制帧（见 binary_frame）按首字节识别，不论路由配置的解码器都按二进制解析。
+"""
+import threading
+
+import binary_frame
+import sensor_parser
+
+DEFAULT_DECODER = 'stm32_text'
+
+# 主题 -> 匹配结果的缓存上限，超过后清空重建
+CACHE_SIZE = 100000
+
+
+class Route:
+    __slots__ = ('filter', 'decoder', 'device')
+
+    def __init__(self, topic_filter, decoder=DEFAULT_DECODER, device=None):
+        """
+        device: 设备ID模板，{0}、{1}... 为主题的各层，{topic} 为完整主题；None 时为主题中的 / 换成 _
+        参数不合法时抛出 ValueError
+        """
+        validate_filter(topic_filter)
+        if decoder not in sensor_parser.DECODERS:
+            raise ValueError(f"unknown decoder {decoder!r}, registered: {', '.join(sorted(sensor_parser.DECODERS))}")
+        self.filter = topic_filter
+        self.decoder = decoder
+        self.device = device
+
+    def device_id(self, topic):
+        if self.device is None:
+            return topic.replace('/', '_')
+        try:
+            return self.device.format(*topic.split('/'), topic=topic)
+        except (IndexError, KeyError):
+            # 模板引用了主题中不存在的层级（# 匹配到的层数不定）
+            return topic.replace('/', '_')
+
+    def to_dict(self):
+        return {'filter': self.filter, 'decoder': self.decoder, 'device': self.device}
+
+
+def validate_filter(topic_filter):
+    """检查 MQTT 订阅过滤器：+ 和 # 必须独占一层，# 只能在最后一层"""
+    if not isinstance(topic_filter, str) or not topic_filter:
+        raise ValueError("topic filter must be a non-empty string")
+    levels = topic_filter.split('/')
+    for i, level in enumerate(levels):
+        if level == '#' and i != len(levels) - 1:
+            raise ValueError(f"'#' must be the last level in {topic_filter!r}")
+        if len(level) > 1 and ('+' in level or '#' in level):
+            raise ValueError(f"wildcards must occupy a whole level in {topic_filter!r}")
+
+
+class _Node:
+    __slots__ = ('children', 'route')
+
+    def __init__(self):
+        self.children = {}
+        self.route = None
+
+
+class TopicRouter:
+
+    def __init__(self, routes=()):
+        """routes: [{'filter': ..., 'decoder': ..., 'device': ...}]，见 Route"""
+        self._root = _Node()
+        self._routes = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.load(routes)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def routes(self):
+        return [route.to_dict() for route in self._routes.values()]
+
+    def load(self, routes):
+        for route in routes:
+            self.add(route['filter'], route.get('decoder', DEFAULT_DECODER), route.get('device'))
+
+    def add(self, topic_filter, decoder=DEFAULT_DECODER, device=None):
+        """新增或替换一条路由，返回 Route；参数不合法时抛出 ValueError"""
+        route = Route(topic_filter, decoder, device)
+        with self._lock:
+            node = self._root
+            for level in topic_filter.split('/'):
+                node = node.children.setdefault(level, _Node())
+            node.route = route
+            self._routes[topic_filter] = route
+            self._cache = {}
+        return route
+
+    def remove(self, topic_filter):
+        with self._lock:
+            if self._routes.pop(topic_filter, None) is None:
+                return False
+            levels = topic_filter.split('/')
+            path = [self._root]
+            for level in levels:
+                path.append(path[-1].children[level])
+            path[-1].route = None
+            # 自下而上删除不再有路由的叶子节点
+            for depth in range(len(levels), 0, -1):
+                node = path[depth]
+                if node.route is not None or node.children:
+                    break
+                del path[depth - 1].children[levels[depth - 1]]
+            self._cache = {}
+            return True
+
+    def match(self, topic):
+        """主题匹配到的 Route，没有时返回 None"""
+        return self._search(self._root, topic.split('/'), 0)
+
+    def _search(self, node, levels, i):
+        if i == len(levels):
+            if node.route is not None:
+                return node.route
+            # "a/#" 也匹配 "a"
+            tail = node.children.get('#')
+            return tail.route if tail is not None else None
+        children = node.children
+        child = children.get(levels[i])
+        if child is not None:
+            route = self._search(child, levels, i + 1)
+            if route is not None:
+                return route
+        # 以 $ 开头的系统主题不匹配首层通配符
+        if i == 0 and levels[0].startswith('$'):
+            return None
+        child = children.get('+')
+        if child is not None:
+            route = self._search(child, levels, i + 1)
+            if route is not None:
+                return route
+        child = children.get('#')
+        return child.route if child is not None else None
+
+    def resolve(self, topic):
+        """主题对应的 (设备ID, 解码函数)，没有匹配的路由时返回 None"""
+        cache = self._cache
+        try:
+            return cache[topic]
+        except KeyError:
+            pass
+        route = self.match(topic)
+        resolved = None if route is None else (route.device_id(topic), sensor_parser.DECODERS[route.decoder])
+        if len(cache) >= CACHE_SIZE:
+            cache = self._cache = {}
+        cache[topic] = resolved
+        return resolved
+
+    def identify(self, payload_str, topic=None):
+        """不解析字段，只确定帧所属的设备ID，与 parse 的结果一致；无法确定时返回 None 或空字符串"""
+        resolved = self.resolve(topic) if topic else None
+        if not isinstance(payload_str, str):
+            device_id = binary_frame.device_id(payload_str)
+            return resolved[0] if device_id is not None and resolved is not None else device_id
+        if resolved is not None:
+            return resolved[0]
+        return sensor_parser.peek_device_id(payload_str)
+
+    def parse(self, payload_str, topic=None, errors=None, device_id=None):
+        """
+        解析一帧数据，返回 (device_id, updates)，约定与 sensor_parser.parse_payload 相同
+        payload_str 为文本，或 binary_frame.text_or_frame 保留下来的二进制帧 (bytes)
+        主题匹配到路由时设备ID取自主题，否则从载荷中提取
+        device_id 为此前 identify 得到的非空设备ID时直接使用，不再重新确定
+        """
+        if device_id:
+            if not isinstance(payload_str, str):
+                frame_device, updates = binary_frame.decode(payload_str, errors)
+                return (None if frame_device is None else device_id), updates
+            resolved = self.resolve(topic) if topic else None
+            decode = sensor_parser.parse_fields if resolved is None else resolved[1]
+            return device_id, decode(payload_str, errors)
+        resolved = self.resolve(topic) if topic else None
+        if not isinstance(payload_str, str):
+            device_id, updates = binary_frame.decode(payload_str, errors)
+            if device_id is not None and resolved is not None:
+                device_id = resolved[0]
+            return device_id, updates
+        if resolved is None:
+            return sensor_parser.parse_payload(payload_str, errors)
+        device_id, decode = resolved
+        return device_id, decode(payload_str, errors)